@@ -0,0 +1,207 @@
+# stdlib imports
+import glob
+import json
+import os.path
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# local imports
+from impactutils.io.table import (read_table, dataframe_to_xml,
+                                  dataframe_to_geojson)
+
+STATION_EXTENSIONS = ['.xlsx', '.csv']
+OUTPUT_FORMATS = {'xml': '_dat.xml',
+                  'geojson': '_dat.json'}
+
+
+def find_station_files(inputs):
+    """Find the station spreadsheets and CSV files to convert.
+
+    Args:
+        inputs (str or list): Directory, glob pattern or file name, or a
+            list of any of these. Directories are searched (not
+            recursively) for files with the extensions in
+            STATION_EXTENSIONS.
+    Returns:
+        list: Sorted list of unique file names.
+    """
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for ext in STATION_EXTENSIONS:
+                files += glob.glob(os.path.join(item, '*' + ext))
+        elif os.path.isfile(item):
+            files.append(item)
+        else:
+            files += [path for path in glob.glob(item)
+                      if os.path.isfile(path)]
+    return sorted(set(files))
+
+
+def convert_station_files(inputs, outdir, workers=None, output_format='xml',
+                          manifest=None):
+    """Convert station spreadsheets and CSV files to ShakeMap station files.
+
+    Files are read and checked with read_table. Each file is written to
+    outdir, with its base name and the suffix in OUTPUT_FORMATS (i.e.,
+    complete_pgm.xlsx => complete_pgm_dat.xml).
+    Files are converted in parallel in a pool of processes. A file that
+    cannot be read or written does not stop the conversion; its error is
+    recorded in the manifest.
+
+    The manifest is a dictionary with the following keys:
+     - created: Time (seconds since the epoch) the conversion finished.
+     - format: Output format.
+     - outdir: Output directory.
+     - nconverted: Number of files that were converted.
+     - nfailed: Number of files that could not be converted.
+     - files: List of dictionaries, one for each input file, in the order
+       of the input files, with keys:
+        - input: Input file name.
+        - output: Output file name, or None if conversion failed.
+        - status: 'ok' or 'error'.
+        - error: Error message, or None.
+        - error_type: Name of the exception class, or None.
+        - rows: Number of rows read from the input file, or None.
+        - reference: Reference string from the input file, or None.
+        - elapsed: Seconds spent converting the file.
+
+    Args:
+        inputs (str or list): Input files, see find_station_files.
+        outdir (str): Output directory, created if it does not exist.
+        workers (int): Number of worker processes. None uses the number
+            of CPUs, 1 converts the files in this process.
+        output_format (str): Output format, one of the keys of
+            OUTPUT_FORMATS.
+        manifest (str): Path to JSON file where the manifest should be
+            written. Defaults to manifest.json in outdir.
+    Returns:
+        dict: Manifest, as described above.
+    Raises:
+        ValueError: If output_format is not supported, or workers is less
+            than one.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError('Unsupported output format %r, must be one of %s.' %
+                         (output_format, sorted(OUTPUT_FORMATS)))
+    if workers is not None and workers < 1:
+        raise ValueError('workers must be at least one.')
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    if manifest is None:
+        manifest = os.path.join(outdir, 'manifest.json')
+
+    files = find_station_files(inputs)
+    results = [None] * len(files)
+    jobs = []
+    outputs = set()
+    for i, infile in enumerate(files):
+        stem = os.path.splitext(os.path.basename(infile))[0]
+        outfile = os.path.join(outdir, stem + OUTPUT_FORMATS[output_format])
+        if outfile in outputs:
+            # i.e., foo.xlsx and foo.csv
+            results[i] = _make_result(
+                infile, error=ValueError(
+                    'Output file %s would overwrite the output of another '
+                    'input file.' % outfile))
+            continue
+        outputs.add(outfile)
+        jobs.append((i, infile, outfile))
+
+    if workers == 1 or len(jobs) < 2:
+        for i, infile, outfile in jobs:
+            results[i] = _convert_station_file(infile, outfile,
+                                               output_format)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [(i, infile, outfile,
+                        executor.submit(_convert_station_file, infile,
+                                        outfile, output_format))
+                       for i, infile, outfile in jobs]
+            for i, infile, outfile, future in futures:
+                try:
+                    results[i] = future.result()
+                except Exception as error:
+                    # the worker died (i.e., BrokenProcessPool), or the
+                    # job or its result could not be pickled
+                    if os.path.isfile(outfile):
+                        os.remove(outfile)
+                    results[i] = _make_result(infile, error=error)
+
+    nfailed = sum(result['status'] != 'ok' for result in results)
+    summary = {'created': int(time.time()),
+               'format': output_format,
+               'outdir': outdir,
+               'nconverted': len(results) - nfailed,
+               'nfailed': nfailed,
+               'files': results}
+    with open(manifest, 'wt') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def _convert_station_file(infile, outfile, output_format):
+    """Internal method to convert one station file, catching all errors.
+
+    Args:
+        infile (str): Path to Excel or CSV file.
+        outfile (str): Path to output file.
+        output_format (str): Output format, one of the keys of
+            OUTPUT_FORMATS.
+    Returns:
+        dict: Result for the manifest, see convert_station_files.
+    """
+    t0 = time.time()
+    try:
+        df, reference = read_table(infile)
+        if reference is not None:
+            # reference cells are not always text (i.e., dates)
+            reference = str(reference)
+        if output_format == 'xml':
+            dataframe_to_xml(df, outfile, reference=reference)
+        else:
+            dataframe_to_geojson(df, outfile, reference=reference)
+    except Exception as error:
+        if os.path.isfile(outfile):
+            os.remove(outfile)
+        return _make_result(infile, error=error, elapsed=time.time() - t0)
+    return _make_result(infile, outfile=outfile, rows=len(df),
+                        reference=reference, elapsed=time.time() - t0)
+
+
+def _make_result(infile, outfile=None, rows=None, reference=None,
+                 error=None, elapsed=0.0):
+    """Internal method to make the manifest entry of an input file.
+
+    Args:
+        infile (str): Path to input file.
+        outfile (str): Path to output file, or None.
+        rows (int): Number of rows read, or None.
+        reference: Reference from the input file (converted to a string),
+            or None.
+        error (Exception): Conversion error, or None.
+        elapsed (float): Seconds spent converting the file.
+    Returns:
+        dict: Result for the manifest, see convert_station_files.
+    """
+    result = {'input': infile,
+              'output': outfile,
+              'status': 'ok',
+              'error': None,
+              'error_type': None,
+              'rows': rows,
+              'reference': None,
+              'elapsed': elapsed}
+    if reference is not None:
+        result['reference'] = str(reference)
+    if error is not None:
+        result['status'] = 'error'
+        # KeyError puts quotes around its message
+        if isinstance(error, KeyError) and len(error.args) == 1:
+            result['error'] = str(error.args[0])
+        else:
+            result['error'] = str(error) or type(error).__name__
+        result['error_type'] = type(error).__name__
+    return result
@@ -0,0 +1,209 @@
+# stdlib imports
+import json
+import os
+import os.path
+import struct
+import tempfile
+
+# third party imports
+import numpy as np
+import pandas as pd
+
+MAGIC = b'IMPACTUTILS_COLUMN_CACHE_1\n'
+ALIGNMENT = 8
+
+
+def get_source_key(source):
+    """Return the key that ties a cache file to its source file.
+
+    Args:
+        source (str): Path to source file.
+    Returns:
+        dict: Dictionary with the absolute path, modification time (ns)
+        and size (bytes) of the source file.
+    """
+    stat = os.stat(source)
+    return {'path': os.path.abspath(source),
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size}
+
+
+def write_column_cache(cachefile, df, source, extra=None):
+    """Write a dataframe to a binary column cache file.
+
+    The file starts with a magic string and a JSON header describing the
+    source file and the columns, followed by one block per column,
+    aligned so that numeric columns can be memory mapped. String (object)
+    columns are stored as integer codes into a table of the unique strings,
+    which is stored as newline separated UTF-8 text (missing values are
+    stored as the string 'nan'). Boolean, integer and float columns are
+    stored as raw arrays. The index of the dataframe is not stored.
+
+    The file is written to a temporary file in the same directory, and
+    then renamed, so readers never see a partial file.
+
+    Args:
+        cachefile (str): Path to cache file.
+        df (DataFrame): Dataframe to cache.
+        source (str): Path to the file df was read from.
+        extra (dict): JSON serializable dictionary of other information to
+            store in the header, or None.
+    Raises:
+        TypeError: If a column has an unsupported type.
+        ValueError: If a string column contains newlines.
+    """
+    blocks = []
+    columns = []
+    for name in df.columns:
+        values = df[name]
+        if values.dtype == object or isinstance(values.dtype,
+                                                pd.CategoricalDtype):
+            codes, uniques = pd.factorize(values.astype(str), sort=False)
+            uniques = list(uniques)
+            if any('\n' in value for value in uniques):
+                raise ValueError('String column %s contains newlines.' % name)
+            table = '\n'.join(uniques).encode('utf-8')
+            codes = codes.astype('<i4')
+            columns.append({'name': name, 'kind': 'string',
+                            'dtype': codes.dtype.str,
+                            'nstrings': len(uniques)})
+            blocks += [codes.tobytes(), table]
+        elif values.dtype.kind in 'biuf':
+            array = values.to_numpy()
+            if array.dtype.kind == 'b':
+                array = array.astype('u1')
+            array = array.astype(array.dtype.newbyteorder('<'))
+            columns.append({'name': name, 'kind': values.dtype.kind,
+                            'dtype': array.dtype.str})
+            blocks.append(array.tobytes())
+        else:
+            raise TypeError('Column %s has unsupported type %s.' %
+                            (name, values.dtype))
+
+    header = {'source': get_source_key(source),
+              'nrows': len(df),
+              'columns': columns,
+              'blocks': [],
+              'extra': extra}
+    # block offsets are relative to the end of the header
+    offset = 0
+    for block in blocks:
+        header['blocks'].append([offset, len(block)])
+        offset += _padded(len(block))
+    header_bytes = json.dumps(header).encode('utf-8')
+    prefix_len = len(MAGIC) + 8 + len(header_bytes)
+    padding = _padded(prefix_len) - prefix_len
+
+    cachedir = os.path.dirname(os.path.abspath(cachefile))
+    fd, tmpfile = tempfile.mkstemp(dir=cachedir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header_bytes) + padding))
+            f.write(header_bytes + b' ' * padding)
+            for block in blocks:
+                f.write(block)
+                f.write(b'\0' * (_padded(len(block)) - len(block)))
+        os.replace(tmpfile, cachefile)
+    except BaseException:
+        if os.path.isfile(tmpfile):
+            os.remove(tmpfile)
+        raise
+
+
+def read_column_cache(cachefile, source, mmap=True):
+    """Read a dataframe from a binary column cache file.
+
+    Args:
+        cachefile (str): Path to cache file.
+        source (str): Path to the file the cache was made from.
+        mmap (bool): Memory map numeric columns rather than reading them.
+            The maps are copy-on-write: the columns of the dataframe can be
+            modified without changing the cache file.
+    Returns:
+        tuple or None: (DataFrame, extra), where extra is the dictionary
+        passed to write_column_cache, or None if the cache file does not
+        exist, is not a valid cache file, or was made from a different
+        version (path, modification time or size) of source.
+    """
+    try:
+        header, data_offset = _read_header(cachefile)
+        if header['source'] != get_source_key(source):
+            return None
+    except (OSError, ValueError, KeyError):
+        return None
+
+    nrows = header['nrows']
+    blocks = iter(header['blocks'])
+    data = {}
+    try:
+        for column in header['columns']:
+            offset, nbytes = next(blocks)
+            offset += data_offset
+            dtype = np.dtype(column['dtype'])
+            if mmap and nrows:
+                array = np.memmap(cachefile, dtype=dtype, mode='c',
+                                  offset=offset, shape=(nrows,))
+            else:
+                array = np.fromfile(cachefile, dtype=dtype, count=nrows,
+                                    offset=offset)
+            if column['kind'] == 'string':
+                offset, nbytes = next(blocks)
+                with open(cachefile, 'rb') as f:
+                    f.seek(data_offset + offset)
+                    table = f.read(nbytes).decode('utf-8')
+                strings = np.array(table.split('\n') if column['nstrings']
+                                   else [], dtype=object)
+                data[column['name']] = strings[array]
+            elif column['kind'] == 'b':
+                data[column['name']] = array.view(np.bool_)
+            else:
+                data[column['name']] = array
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+    # copy=False keeps the memory mapped arrays as the dataframe's columns
+    df = pd.DataFrame(data, columns=[c['name'] for c in header['columns']],
+                      copy=False)
+    return (df, header['extra'])
+
+
+def _read_header(cachefile):
+    """Internal method to read the header of a cache file.
+
+    Args:
+        cachefile (str): Path to cache file.
+    Returns:
+        tuple: Header dictionary, and offset (bytes) of the first block.
+    Raises:
+        ValueError: If the file is not a valid cache file, or is shorter
+            than its header says.
+        KeyError: If the header has no blocks.
+    """
+    with open(cachefile, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a column cache file.' % cachefile)
+        header_len = f.read(8)
+        if len(header_len) != 8:
+            raise ValueError('%s is truncated.' % cachefile)
+        header_len, = struct.unpack('<Q', header_len)
+        header_bytes = f.read(header_len)
+        if len(header_bytes) != header_len:
+            raise ValueError('%s is truncated.' % cachefile)
+        header = json.loads(header_bytes.decode('utf-8'))
+    data_offset = len(MAGIC) + 8 + header_len
+    nbytes = max([offset + size for offset, size in header['blocks']],
+                 default=0)
+    if os.path.getsize(cachefile) < data_offset + nbytes:
+        raise ValueError('%s is truncated.' % cachefile)
+    return (header, data_offset)
+
+
+def _padded(nbytes):
+    """Internal method to round a block size up to the alignment.
+
+    Args:
+        nbytes (int): Size in bytes.
+    Returns:
+        int: Size rounded up to a multiple of ALIGNMENT.
+    """
+    return -(-nbytes // ALIGNMENT) * ALIGNMENT
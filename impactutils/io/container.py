@@ -13,6 +13,8 @@ import pandas as pd
 
 # local imports
 from impactutils.time.ancient_time import HistoricTime
+from impactutils.io.iostats import (instrumented, read_dataset,
+                                    create_dataset, timed_transform)
 
 # list of allowed data types in dictionaries
 ALLOWED = [str, int, float, bool, bytes,
@@ -40,6 +42,7 @@ class HDFContainer(object):
             hdfobj:  Open h5py File Object.
         """
         self._hdfobj = hdfobj
+        self._stats = None
 
     @classmethod
     def create(cls, hdf_file):
@@ -85,9 +88,30 @@ class HDFContainer(object):
         """
         return self._hdfobj.filename
 
+    def setStats(self, stats):
+        """
+        Turn I/O instrumentation on or off.
+
+        Args:
+            stats (IOStats): IOStats instance that will record every
+                get/set/drop call on this container, or None to turn
+                instrumentation off.
+        """
+        self._stats = stats
+
+    def getStats(self):
+        """
+        Return the IOStats instance recording calls on this container.
+
+        Returns:
+            IOStats: IOStats instance, or None if instrumentation is off.
+        """
+        return self._stats
+
     #
     # Dictionaries
     #
+    @instrumented(GROUPS['dict'])
     def getDictionary(self, name):
         """Return a dictionary stored in container.
 
@@ -104,10 +128,11 @@ class HDFContainer(object):
             raise LookupError('Dictionary %s not in %s'
                               % (name, self.getFileName()))
         mdataset = dict_group[dict_name]
-        outstring = mdataset[()].decode('utf-8')
-        outdict = json.loads(outstring)
+        outstring = read_dataset(self, mdataset).decode('utf-8')
+        outdict = timed_transform(self, json.loads, outstring)
         return outdict
 
+    @instrumented(GROUPS['dict'])
     def setDictionary(self, name, dictionary):
         """
         Store a dictionary in the HDF file, in group name.
@@ -131,11 +156,12 @@ class HDFContainer(object):
         else:
             dict_group = self._hdfobj[GROUPS['dict']]
 
-        inbytes = json.dumps(dictionary).encode('utf-8')
-        mdataset = dict_group.create_dataset(dict_name, data=inbytes)
+        inbytes = timed_transform(self, json.dumps, dictionary).encode('utf-8')
+        mdataset = create_dataset(self, dict_group, dict_name, inbytes)
 
         return mdataset
 
+    @instrumented(GROUPS['dict'])
     def dropDictionary(self, name):
         """
         Delete dictionary from container.
@@ -166,6 +192,7 @@ class HDFContainer(object):
     #
     # Lists
     #
+    @instrumented(GROUPS['list'])
     def setList(self, name, inlist):
         """
         Store a homogenous list in the HDF file.
@@ -189,11 +216,12 @@ class HDFContainer(object):
         else:
             list_group = self._hdfobj[GROUPS['list']]
 
-        inbytes = json.dumps(inlist).encode('utf-8')
-        mdataset = list_group.create_dataset(list_name, data=inbytes)
+        inbytes = timed_transform(self, json.dumps, inlist).encode('utf-8')
+        mdataset = create_dataset(self, list_group, list_name, inbytes)
 
         return mdataset
 
+    @instrumented(GROUPS['list'])
     def getList(self, name):
         """Return a list stored in container.
 
@@ -209,8 +237,8 @@ class HDFContainer(object):
             raise LookupError('List %s not in %s'
                               % (name, self.getFileName()))
         mdataset = list_group[list_name]
-        outstring = mdataset[()].decode('utf-8')
-        outlist = json.loads(outstring)
+        outstring = read_dataset(self, mdataset).decode('utf-8')
+        outlist = timed_transform(self, json.loads, outstring)
         return outlist
 
     def getLists(self):
@@ -225,6 +253,7 @@ class HDFContainer(object):
         lists = list(self._hdfobj[GROUPS['list']].keys())
         return lists
 
+    @instrumented(GROUPS['list'])
     def dropList(self, name):
         """
         Delete list from container.
@@ -244,6 +273,7 @@ class HDFContainer(object):
     # Arrays
     #
 
+    @instrumented(GROUPS['array'])
     def setArray(self, name, array, metadata=None, compression=True):
         """
         Store a numpy array and optional metadata in the HDF file, in group
@@ -277,13 +307,14 @@ class HDFContainer(object):
         else:
             array_group = self._hdfobj[GROUPS['array']]
 
-        dset = array_group.create_dataset(
-            array_name, data=array, compression=compression)
+        dset = create_dataset(self, array_group, array_name, array,
+                              compression=compression)
         if metadata:
             for key, value in metadata.items():
                 dset.attrs[key] = value
         return dset
 
+    @instrumented(GROUPS['array'])
     def getArray(self, name):
         """
         Retrieve an array of data and any associated metadata from a dataset.
@@ -301,7 +332,7 @@ class HDFContainer(object):
             raise LookupError('Array %s not in %s'
                               % (name, self.getFileName()))
         dset = array_group[array_name]
-        data = dset[()]
+        data = read_dataset(self, dset)
         metadata = {}
         for key, value in dset.attrs.items():
             metadata[key] = value
@@ -319,6 +350,7 @@ class HDFContainer(object):
         arrays = list(self._hdfobj[GROUPS['array']].keys())
         return arrays
 
+    @instrumented(GROUPS['array'])
     def dropArray(self, name):
         """
         Delete array from container.
@@ -338,6 +370,7 @@ class HDFContainer(object):
     # Strings
     #
 
+    @instrumented(GROUPS['string'])
     def setString(self, name, instring):
         """
         Store a string in the HDF file, as the attribute name under a special
@@ -359,10 +392,11 @@ class HDFContainer(object):
             string_group = self._hdfobj[GROUPS['string']]
 
         inbytes = instring.encode('utf-8')
-        mdataset = string_group.create_dataset(string_name, data=inbytes)
+        mdataset = create_dataset(self, string_group, string_name, inbytes)
 
         return mdataset
 
+    @instrumented(GROUPS['string'])
     def getString(self, name):
         """
         Retrieve a string from a attribute name in a special group.
@@ -379,7 +413,7 @@ class HDFContainer(object):
             raise LookupError('Dictionary %s not in %s'
                               % (name, self.getFileName()))
         mdataset = string_group[string_name]
-        outstring = mdataset[()].decode('utf-8')
+        outstring = read_dataset(self, mdataset).decode('utf-8')
         return outstring
 
     def getStrings(self):
@@ -394,6 +428,7 @@ class HDFContainer(object):
         strings = list(self._hdfobj[GROUPS['string']].keys())
         return strings
 
+    @instrumented(GROUPS['string'])
     def dropString(self, name):
         """
         Delete string from container.
@@ -412,6 +447,7 @@ class HDFContainer(object):
     #
     # Dataframes
     #
+    @instrumented(GROUPS['dataframe'])
     def setDataFrame(self, name, dataframe):
         """
         Store a pandas DataFrame in the HDF file, as a dictionary object.
@@ -430,8 +466,10 @@ class HDFContainer(object):
         else:
             dataframe_group = self._hdfobj[GROUPS['dataframe']]
 
-        inbytes = dataframe.to_json(date_format='iso').encode('utf-8')
-        mdataset = dataframe_group.create_dataset(dataframe_name, data=inbytes)
+        outstring = timed_transform(self, dataframe.to_json, date_format='iso')
+        inbytes = outstring.encode('utf-8')
+        mdataset = create_dataset(self, dataframe_group, dataframe_name,
+                                  inbytes)
         # use attributes to store time columns?
         cidx = dataframe.select_dtypes(include=['datetime64[ns]']).columns
         clist = cidx.tolist()
@@ -439,6 +477,7 @@ class HDFContainer(object):
         mdataset.attrs['time_columns'] = cstr.encode('utf-8')
         return mdataset
 
+    @instrumented(GROUPS['dataframe'])
     def getDataFrame(self, name):
         """Return a DataFrame stored in container.
 
@@ -455,14 +494,15 @@ class HDFContainer(object):
             raise LookupError('Dataframe %s not in %s'
                               % (name, self.getFileName()))
         mdataset = dataframe_group[dataframe_name]
-        outstring = mdataset[()].decode('utf-8')
+        outstring = read_dataset(self, mdataset).decode('utf-8')
 
         # in setDataFrame, we stored the names of the
         # date/time columns in an attribute.  Let's use that
         # now to make sure those are read back in with the appropriate
         # type
         clist = json.loads(mdataset.attrs['time_columns'].decode('utf-8'))
-        dataframe = pd.read_json(outstring, convert_dates=clist)
+        dataframe = timed_transform(self, pd.read_json, outstring,
+                                    convert_dates=clist)
 
         return dataframe
 
@@ -478,6 +518,7 @@ class HDFContainer(object):
         dataframes = list(self._hdfobj[GROUPS['dataframe']].keys())
         return dataframes
 
+    @instrumented(GROUPS['dataframe'])
     def dropDataFrame(self, name):
         """
         Delete dataframe from container.
@@ -0,0 +1,296 @@
+# stdlib imports
+import functools
+import json
+import time
+import zlib
+
+# third party imports
+import numpy as np
+import pandas as pd
+
+FIELDS = ['method', 'path', 'nbytes', 'storage_bytes', 'io_time',
+          'decompress_time', 'decode_time', 'wall_time']
+
+
+class IOStats(object):
+    """
+    Collects per-call I/O statistics from HDF containers.
+
+    Instrumentation is off unless an IOStats object is attached to a
+    container with setStats(). One IOStats object may be shared by any
+    number of containers. Every get/set/drop call on an instrumented
+    container adds one record with the following fields:
+
+     - method: Name of the container method.
+     - path: HDF path of the object that was read, written or dropped.
+     - nbytes: Uncompressed size (bytes) of the data read or written.
+     - storage_bytes: Size (bytes) of the data in the file, i.e.,
+       compressed size for compressed datasets.
+     - io_time: Seconds spent in HDF5 reads and writes. For writes of
+       compressed datasets this includes compression.
+     - decompress_time: Seconds spent decompressing gzip compressed
+       datasets on read.
+     - decode_time: Seconds spent converting between stored bytes and
+       Python objects (JSON and DataFrame (de)serialization).
+     - wall_time: Total seconds spent in the call.
+    """
+
+    def __init__(self):
+        self._records = []
+        self._stack = []
+
+    def reset(self):
+        """Discard all records.
+        """
+        self._records = []
+        self._stack = []
+
+    def __len__(self):
+        """Return the number of records.
+
+        Returns:
+            int: Number of records.
+        """
+        return len(self._records)
+
+    def getRecords(self):
+        """Return a copy of the list of records.
+
+        Returns:
+            list: List of dictionaries, with keys described in the
+            class documentation.
+        """
+        return [record.copy() for record in self._records]
+
+    def getDataFrame(self):
+        """Return the records as a DataFrame.
+
+        Returns:
+            DataFrame: One row per record, columns as described in the
+            class documentation.
+        """
+        return pd.DataFrame(self._records, columns=FIELDS)
+
+    def getSummary(self):
+        """Return totals of the records, grouped by container method.
+
+        Returns:
+            DataFrame: Indexed by method, with a 'calls' column and the sums
+            of the byte and time fields.
+        """
+        df = self.getDataFrame()
+        summary = df.drop(columns='path').groupby('method').sum()
+        summary.insert(0, 'calls', df.groupby('method').size())
+        return summary
+
+    def report(self):
+        """Return a text report of the summary.
+
+        Returns:
+            str: Summary table, one line per container method, with a
+            total line at the end.
+        """
+        summary = self.getSummary()
+        fmt = '%-16s %8s %12s %12s %10s %10s %10s %10s'
+        lines = [fmt % ('method', 'calls', 'bytes', 'stored',
+                        'io(s)', 'decomp(s)', 'decode(s)', 'wall(s)')]
+        rowfmt = '%-16s %8i %12i %12i %10.4f %10.4f %10.4f %10.4f'
+        for method, row in summary.iterrows():
+            lines.append(rowfmt % ((method,) + tuple(row.values)))
+        totals = summary.sum()
+        lines.append(rowfmt % (('total',) + tuple(totals.values)))
+        return '\n'.join(lines)
+
+    def dump(self, filename):
+        """Write the records and summary to a JSON file.
+
+        Args:
+            filename (str): Path to output JSON file.
+        """
+        summary = self.getSummary().astype(float)
+        outdict = {'records': self._records,
+                   'summary': summary.to_dict(orient='index')}
+        with open(filename, 'wt') as f:
+            json.dump(outdict, f, indent=2)
+
+    #
+    # Recording, used by the containers
+    #
+    def _start(self, method, path):
+        record = dict.fromkeys(FIELDS, 0)
+        record['method'] = method
+        record['path'] = path
+        self._stack.append(record)
+        return record
+
+    def _finish(self, record, wall_time):
+        record['wall_time'] = wall_time
+        # calls nest, so the record is the last one started; list.remove()
+        # would find the first equal record instead
+        last = self._stack.pop()
+        assert last is record, 'IOStats records finished out of order.'
+        self._records.append(record)
+
+    def _add(self, **kwargs):
+        if not self._stack:
+            return
+        record = self._stack[-1]
+        for key, value in kwargs.items():
+            record[key] += value
+
+    def _read(self, dset):
+        storage_bytes = dset.id.get_storage_size()
+        nbytes = dset.size * dset.dtype.itemsize
+        data = None
+        if _is_plain_gzip(dset):
+            try:
+                data, io_time, decompress_time = _read_gzip(dset)
+            except Exception:
+                data = None
+        if data is None:
+            t0 = time.perf_counter()
+            data = dset[()]
+            io_time = time.perf_counter() - t0
+            decompress_time = 0.0
+        self._add(nbytes=nbytes, storage_bytes=storage_bytes,
+                  io_time=io_time, decompress_time=decompress_time)
+        return data
+
+    def _write(self, group, name, data, **kwargs):
+        t0 = time.perf_counter()
+        dset = group.create_dataset(name, data=data, **kwargs)
+        io_time = time.perf_counter() - t0
+        self._add(nbytes=dset.size * dset.dtype.itemsize,
+                  storage_bytes=dset.id.get_storage_size(),
+                  io_time=io_time)
+        return dset
+
+    def _transform(self, func, *args, **kwargs):
+        t0 = time.perf_counter()
+        result = func(*args, **kwargs)
+        self._add(decode_time=time.perf_counter() - t0)
+        return result
+
+
+def _is_plain_gzip(dset):
+    """Internal method to check whether a dataset can be read chunk by chunk.
+
+    Args:
+        dset (Dataset): HDF5 dataset.
+    Returns:
+        bool: True if gzip is the only filter on the dataset, and its
+        chunks can therefore be decompressed with zlib.
+    """
+    return (dset.chunks is not None and dset.compression == 'gzip' and
+            not dset.shuffle and not dset.fletcher32 and
+            dset.scaleoffset is None and dset.dtype.kind in 'biufc' and
+            dset.dtype.isnative and hasattr(dset.id, 'read_direct_chunk'))
+
+
+def _read_gzip(dset):
+    """Internal method to read a gzip compressed dataset, timing the raw
+    chunk reads separately from their decompression.
+
+    Args:
+        dset (Dataset): HDF5 dataset, see _is_plain_gzip().
+    Returns:
+        tuple: Array of data, read time and decompression time (seconds).
+    """
+    t0 = time.perf_counter()
+    chunks = []
+    for chunk_slice in dset.iter_chunks():
+        offset = tuple(s.start for s in chunk_slice)
+        filter_mask, raw = dset.id.read_direct_chunk(offset)
+        chunks.append((chunk_slice, filter_mask, raw))
+    t1 = time.perf_counter()
+    data = np.empty(dset.shape, dtype=dset.dtype)
+    for chunk_slice, filter_mask, raw in chunks:
+        # a set bit in the mask means the filter was skipped for this chunk
+        buffer = raw if filter_mask & 1 else zlib.decompress(raw)
+        block = np.frombuffer(buffer, dtype=dset.dtype).reshape(dset.chunks)
+        valid = tuple(slice(0, s.stop - s.start) for s in chunk_slice)
+        data[chunk_slice] = block[valid]
+    t2 = time.perf_counter()
+    return data, t1 - t0, t2 - t1
+
+
+def instrumented(base):
+    """Decorator for container get/set/drop methods to record IOStats.
+
+    The decorated method must take the object name as its first argument,
+    optionally preceded by a list of sub groups (as in HDFContainerBase).
+
+    Args:
+        base (str): Name of the top level group the method operates on.
+    Returns:
+        function: Decorator.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = getattr(self, '_stats', None)
+            if stats is None:
+                return method(self, *args, **kwargs)
+            if args and isinstance(args[0], (list, tuple)):
+                parts = [base] + list(args[0]) + list(args[1:2])
+            else:
+                parts = [base] + list(args[0:1])
+            record = stats._start(method.__name__, '/'.join(parts))
+            t0 = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                stats._finish(record, time.perf_counter() - t0)
+        return wrapper
+    return decorator
+
+
+def read_dataset(container, dset):
+    """Read all of the data in a dataset, recording IOStats if enabled.
+
+    Args:
+        container: HDFContainer or HDFContainerBase instance.
+        dset (Dataset): HDF5 dataset.
+    Returns:
+        Data in dataset.
+    """
+    stats = getattr(container, '_stats', None)
+    if stats is None:
+        return dset[()]
+    return stats._read(dset)
+
+
+def create_dataset(container, group, name, data, **kwargs):
+    """Create a dataset in a group, recording IOStats if enabled.
+
+    Args:
+        container: HDFContainer or HDFContainerBase instance.
+        group (Group): HDF5 group.
+        name (str): Name of new dataset.
+        data: Data to write.
+        kwargs: Other arguments to Group.create_dataset().
+    Returns:
+        Dataset: New HDF5 dataset.
+    """
+    stats = getattr(container, '_stats', None)
+    if stats is None:
+        return group.create_dataset(name, data=data, **kwargs)
+    return stats._write(group, name, data, **kwargs)
+
+
+def timed_transform(container, func, *args, **kwargs):
+    """Call a serialization or deserialization function (i.e., json.dumps
+    or pd.read_json), recording its time in IOStats if enabled.
+
+    Args:
+        container: HDFContainer or HDFContainerBase instance.
+        func (function): Function to call (i.e., json.loads).
+        args: Arguments to func.
+        kwargs: Keyword arguments to func.
+    Returns:
+        Return value of func.
+    """
+    stats = getattr(container, '_stats', None)
+    if stats is None:
+        return func(*args, **kwargs)
+    return stats._transform(func, *args, **kwargs)
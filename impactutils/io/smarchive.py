@@ -0,0 +1,343 @@
+# stdlib imports
+import json
+import os.path
+
+# third party imports
+import h5py
+import numpy as np
+import pandas as pd
+
+# local imports
+from impactutils.io.smcontainers import ShakeMapOutputContainer
+
+EVENTS = 'events'
+SUMMARY = 'summary'
+INFO = 'info.json'
+
+
+def _get_event_id(container, filename):
+    """Internal method to determine the event ID of an output container.
+
+    Args:
+        container (ShakeMapOutputContainer): Open output container.
+        filename (str): Path to the container file.
+    Returns:
+        str: Event ID from the container metadata, or the container file
+        name without extension if the metadata does not have one.
+    """
+    try:
+        info = container.getMetadata()
+        eventid = info['input']['event_information']['event_id']
+    except (LookupError, TypeError):
+        eventid = os.path.splitext(os.path.basename(filename))[0]
+    return str(eventid).replace('/', '_')
+
+
+def _map_dataset(group, name, srcfile, dset):
+    """Internal method to map a dataset from another file into an index.
+
+    Fixed size datasets are mapped as HDF5 virtual datasets; variable length
+    datasets (i.e., station ID strings) cannot be virtual, and are mapped
+    as external links instead. In neither case is the data copied.
+
+    Args:
+        group (Group): Group in the index file where dataset will be mapped.
+        name (str): Name of the mapped dataset in group.
+        srcfile (str): Path to source file, relative to index file.
+        dset (Dataset): Dataset in the (open) source file.
+    Returns:
+        Dataset or None: Virtual dataset, or None if an external link was
+        created.
+    """
+    if h5py.check_vlen_dtype(dset.dtype) is not None or not dset.shape:
+        group[name] = h5py.ExternalLink(srcfile, dset.name)
+        return None
+    source = h5py.VirtualSource(srcfile, dset.name, shape=dset.shape,
+                                dtype=dset.dtype)
+    layout = h5py.VirtualLayout(shape=dset.shape, dtype=dset.dtype)
+    layout[...] = source
+    vdset = group.create_virtual_dataset(name, layout)
+    for key, value in dset.attrs.items():
+        vdset.attrs[key] = value
+    return vdset
+
+
+class ShakeMapArchive(object):
+    """
+    HDF5 index of the IMT data and metadata in many ShakeMap output
+    containers.
+
+    The index holds no IMT data itself. Every IMT layer of every event is
+    mapped into the index as a virtual dataset pointing back to the output
+    container it came from, and the metadata dictionary as an external link.
+    Summary statistics of the IMT mean layers are computed when the index is
+    built and stored in a small table, so that cross-event queries can be
+    answered without touching the output containers at all.
+
+    Index layout::
+
+        events/<eventid>/info.json                      (external link)
+        events/<eventid>/imts/<component>/<imt>/<layer> (virtual datasets)
+        summary                                         (table)
+    """
+
+    def __init__(self, hdfobj):
+        """
+        Instantiate a ShakeMapArchive from an open h5py File Object.
+
+        Args:
+            hdfobj:  Open h5py File Object.
+        """
+        self._hdfobj = hdfobj
+
+    @classmethod
+    def create(cls, index_file, container_files, stats=True):
+        """
+        Create an archive index of a sequence of ShakeMap output containers.
+
+        Container files are referenced relative to the directory of the
+        index file, so the index can be moved along with the archive.
+
+        Args:
+            index_file (str): Path to HDF file to be created.
+            container_files (list): Paths to ShakeMapOutputContainer files.
+            stats (bool): Boolean indicating whether summary statistics of
+                the IMT mean layers should be computed. This requires
+                reading each mean layer once.
+
+        Returns:
+            ShakeMapArchive instance.
+
+        Raises:
+            ValueError: When two containers have the same event ID.
+        """
+        index_dir = os.path.dirname(os.path.abspath(index_file))
+        hdfobj = h5py.File(index_file, 'w')
+        # don't leave a partial index behind if anything fails
+        try:
+            events = hdfobj.create_group(EVENTS)
+            rows = []
+            for container_file in container_files:
+                srcfile = os.path.relpath(os.path.abspath(container_file),
+                                          index_dir)
+                srcobj = h5py.File(container_file, 'r')
+                try:
+                    container = ShakeMapOutputContainer(srcobj)
+                    eventid = _get_event_id(container, container_file)
+                    if eventid in events:
+                        raise ValueError('Event %s in %s is already in %s'
+                                         % (eventid, container_file,
+                                            index_file))
+                    egroup = events.create_group(eventid)
+                    egroup.attrs['source'] = srcfile
+                    datatype = container.getDataType()
+                    egroup.attrs['data_type'] = datatype or ''
+                    if INFO in container.getDictionaries():
+                        egroup[INFO] = h5py.ExternalLink(
+                            srcfile, '/dictionaries/%s' % INFO)
+                    for comp_imt in container.getIMTs():
+                        component, imt = comp_imt.split('/')
+                        imt_group = container._getGroup(
+                            'arrays', ['imts', component, imt])
+                        out_group = egroup.require_group(
+                            'imts/%s/%s' % (component, imt))
+                        for layer in imt_group:
+                            _map_dataset(out_group, layer, srcfile,
+                                         imt_group[layer])
+                        if stats:
+                            rows.append(_layer_stats(eventid, component, imt,
+                                                     imt_group))
+                finally:
+                    srcobj.close()
+            if stats:
+                _write_summary(hdfobj, rows)
+        except BaseException:
+            hdfobj.close()
+            os.remove(index_file)
+            raise
+        hdfobj.flush()
+        return cls(hdfobj)
+
+    @classmethod
+    def load(cls, index_file):
+        """
+        Instantiate a ShakeMapArchive from an existing index file.
+
+        Args:
+            index_file: Valid path to HDF5 index file.
+
+        Returns:
+            Instance of ShakeMapArchive.
+        """
+        hdfobj = h5py.File(index_file, 'r')
+        return cls(hdfobj)
+
+    def close(self):
+        """
+        Close the index file.
+        """
+        self._hdfobj.close()
+
+    def getFileName(self):
+        """
+        Return the name of the HDF5 index file associated with this object.
+
+        Returns:
+            (str): Name of the file associated with this object.
+        """
+        return self._hdfobj.filename
+
+    def _getEvent(self, eventid):
+        if eventid not in self._hdfobj[EVENTS]:
+            raise LookupError('Event %s not in %s'
+                              % (eventid, self.getFileName()))
+        return self._hdfobj[EVENTS][eventid]
+
+    def getEvents(self):
+        """
+        Return list of event IDs in the archive.
+
+        Returns:
+            list: List of event IDs.
+        """
+        return list(self._hdfobj[EVENTS].keys())
+
+    def getSourceFile(self, eventid):
+        """
+        Return the path to the output container for an event.
+
+        Args:
+            eventid (str): Event ID.
+
+        Returns:
+            str: Path to the output container file.
+        """
+        source = self._getEvent(eventid).attrs['source']
+        index_dir = os.path.dirname(os.path.abspath(self.getFileName()))
+        return os.path.normpath(os.path.join(index_dir, source))
+
+    def getMetadata(self, eventid):
+        """
+        Return the metadata dictionary ('info.json') of an event.
+
+        Args:
+            eventid (str): Event ID.
+
+        Returns:
+            dict: Metadata dictionary.
+        """
+        egroup = self._getEvent(eventid)
+        if INFO not in egroup:
+            raise LookupError('No metadata for event %s in %s'
+                              % (eventid, self.getFileName()))
+        return json.loads(egroup[INFO][()].decode('utf-8'))
+
+    def getIMTs(self, eventid, component=None):
+        """Return list of names of available IMTs for an event.
+
+        Args:
+            eventid (str): Event ID.
+            component (str): Optional string to filter result to only include
+                IMTs available for this component. Default of None returns
+                all IMTs regardless of component, as 'component/imt'.
+
+        Returns:
+            list: List of names of IMTs.
+        """
+        egroup = self._getEvent(eventid)
+        if 'imts' not in egroup:
+            return []
+        imts = egroup['imts']
+        if component is not None:
+            return list(imts[component].keys())
+        return [comp + '/' + imt for comp in imts for imt in imts[comp]]
+
+    def getIMT(self, eventid, imt_name, component):
+        """
+        Retrieve the layers of an IMT of an event, and their metadata.
+
+        Args:
+            eventid (str): Event ID.
+            imt_name (str): The name of the IMT.
+            component (str): The component of the IMT.
+
+        Returns:
+            dict: Dictionary with the same contents as the one returned by
+            ShakeMapOutputContainer.getIMTGrids() or getIMTArrays(),
+            depending on the data type of the event.
+        """
+        egroup = self._getEvent(eventid)
+        path = 'imts/%s/%s' % (component, imt_name)
+        if path not in egroup:
+            raise LookupError('IMT %s/%s not in event %s'
+                              % (component, imt_name, eventid))
+        imt_dict = {}
+        for layer, dset in egroup[path].items():
+            imt_dict[layer] = dset[()]
+            if layer in ['mean', 'std']:
+                imt_dict[layer + '_metadata'] = dict(dset.attrs.items())
+        return imt_dict
+
+    def getSummary(self):
+        """
+        Return the summary statistics of the IMT mean and std layers of all
+        events in the archive.
+
+        Returns:
+            DataFrame: Table with columns eventid, component, imt, min,
+            max, mean and std_mean (the mean of the standard deviation
+            layer), with one row per event IMT.
+        """
+        if SUMMARY not in self._hdfobj:
+            raise LookupError('No summary statistics in %s'
+                              % self.getFileName())
+        table = self._hdfobj[SUMMARY][()]
+        df = pd.DataFrame(table)
+        for column in ['eventid', 'component', 'imt']:
+            df[column] = df[column].str.decode('utf-8')
+        return df
+
+
+def _layer_stats(eventid, component, imt, imt_group):
+    """Internal method to compute summary statistics of an IMT.
+
+    Args:
+        eventid (str): Event ID.
+        component (str): IMT component.
+        imt (str): IMT name.
+        imt_group (Group): Group containing the IMT layers.
+    Returns:
+        tuple: Row of the summary table.
+    """
+    mean = imt_group['mean'][()]
+    std = imt_group['std'][()]
+    if np.all(np.isnan(mean)):
+        mmin = mmax = mmean = np.nan
+    else:
+        mmin = np.nanmin(mean)
+        mmax = np.nanmax(mean)
+        mmean = np.nanmean(mean)
+    std_mean = np.nan if np.all(np.isnan(std)) else np.nanmean(std)
+    return (eventid.encode('utf-8'), component.encode('utf-8'),
+            imt.encode('utf-8'), mmin, mmax, mmean, std_mean)
+
+
+def _write_summary(hdfobj, rows):
+    """Internal method to write the summary table to an index file.
+
+    Args:
+        hdfobj (File): Open index file.
+        rows (list): List of tuples from _layer_stats().
+    """
+    # size the string fields to the longest values, HDF5 compound tables
+    # need fixed width strings.
+    widths = [max([len(row[i]) for row in rows] + [1]) for i in range(3)]
+    dtype = np.dtype([('eventid', 'S%i' % widths[0]),
+                      ('component', 'S%i' % widths[1]),
+                      ('imt', 'S%i' % widths[2]),
+                      ('min', 'f8'),
+                      ('max', 'f8'),
+                      ('mean', 'f8'),
+                      ('std_mean', 'f8')])
+    table = np.array(rows, dtype=dtype)
+    hdfobj.create_dataset(SUMMARY, data=table)
@@ -5,6 +5,8 @@ import json
 import h5py
 
 # local imports
+from impactutils.io.iostats import (instrumented, read_dataset,
+                                    create_dataset, timed_transform)
 
 
 class HDFContainerBase(object):
@@ -16,6 +18,7 @@ class HDFContainerBase(object):
             hdfobj:  Open h5py File Object.
         """
         self._hdfobj = hdfobj
+        self._stats = None
 
     @classmethod
     def create(cls, hdf_file):
@@ -60,6 +63,26 @@ class HDFContainerBase(object):
         """
         return self._hdfobj.filename
 
+    def setStats(self, stats):
+        """
+        Turn I/O instrumentation on or off.
+
+        Args:
+            stats (IOStats): IOStats instance that will record every
+                get/set/drop call on this container, or None to turn
+                instrumentation off.
+        """
+        self._stats = stats
+
+    def getStats(self):
+        """
+        Return the IOStats instance recording calls on this container.
+
+        Returns:
+            IOStats: IOStats instance, or None if instrumentation is off.
+        """
+        return self._stats
+
     def _makeGroup(self, base, groups):
         if base not in self._hdfobj:
             group = self._hdfobj.create_group(base)
@@ -101,6 +124,7 @@ class HDFContainerBase(object):
     #
     # Dictionaries
     #
+    @instrumented('dictionaries')
     def getDictionary(self, groups, name):
         """Return a dictionary stored in container.
 
@@ -118,10 +142,11 @@ class HDFContainerBase(object):
             raise LookupError('Dictionary %s not in %s'
                               % (name, self.getFileName()))
         mdataset = dict_group[name]
-        outstring = mdataset[()].decode('utf-8')
-        outdict = json.loads(outstring)
+        outstring = read_dataset(self, mdataset).decode('utf-8')
+        outdict = timed_transform(self, json.loads, outstring)
         return outdict
 
+    @instrumented('dictionaries')
     def setDictionary(self, groups, name, dictionary):
         """
         Store a dictionary in the HDF file, in group name.
@@ -138,11 +163,12 @@ class HDFContainerBase(object):
             nothing: Nothing.
         """
         dict_group = self._makeGroup('dictionaries', groups)
-        inbytes = json.dumps(dictionary).encode('utf-8')
-        dict_group.create_dataset(name, data=inbytes)
+        inbytes = timed_transform(self, json.dumps, dictionary).encode('utf-8')
+        create_dataset(self, dict_group, name, inbytes)
 
         return
 
+    @instrumented('dictionaries')
     def dropDictionary(self, groups, name):
         """
         Delete dictionary from container.
@@ -177,6 +203,7 @@ class HDFContainerBase(object):
     # Arrays
     #
 
+    @instrumented('arrays')
     def setArray(self, groups, name, array, metadata=None, compression=True):
         """
         Store a numpy array and optional metadata in the HDF file, in group
@@ -206,13 +233,14 @@ class HDFContainerBase(object):
             raise LookupError('%s already exists in %s' %
                               (name, self._hdfobj.filename))
 
-        dset = array_group.create_dataset(name, data=array,
-                                          compression=compression)
+        dset = create_dataset(self, array_group, name, array,
+                              compression=compression)
         if metadata:
             for key, value in metadata.items():
                 dset.attrs[key] = value
         return dset
 
+    @instrumented('arrays')
     def getArray(self, groups, name):
         """
         Retrieve an array of data and any associated metadata from a dataset.
@@ -231,7 +259,7 @@ class HDFContainerBase(object):
             raise LookupError('Array %s not in %s'
                               % (name, self.getFileName()))
         dset = array_group[name]
-        data = dset[()]
+        data = read_dataset(self, dset)
         metadata = {}
         for key, value in dset.attrs.items():
             metadata[key] = value
@@ -248,6 +276,7 @@ class HDFContainerBase(object):
             return []
         return self._getGroupPaths(self._hdfobj['arrays'])
 
+    @instrumented('arrays')
     def dropArray(self, groups, name):
         """
         Delete array from container.
@@ -265,6 +294,7 @@ class HDFContainerBase(object):
     # Strings
     #
 
+    @instrumented('strings')
     def setString(self, groups, name, instring):
         """
         Store a string in the HDF file, as the attribute name under a special
@@ -282,9 +312,10 @@ class HDFContainerBase(object):
         """
         string_group = self._makeGroup('strings', groups)
         inbytes = instring.encode('utf-8')
-        string_group.create_dataset(name, data=inbytes)
+        create_dataset(self, string_group, name, inbytes)
         return
 
+    @instrumented('strings')
     def getString(self, groups, name):
         """
         Retrieve a string from a attribute name in a special group.
@@ -302,7 +333,7 @@ class HDFContainerBase(object):
             raise LookupError('Dictionary %s not in %s'
                               % (name, self.getFileName()))
         mdataset = string_group[name]
-        outstring = mdataset[()].decode('utf-8')
+        outstring = read_dataset(self, mdataset).decode('utf-8')
         return outstring
 
     def getStrings(self):
@@ -316,6 +347,7 @@ class HDFContainerBase(object):
             return []
         return self._getGroupPaths(self._hdfobj['strings'])
 
+    @instrumented('strings')
     def dropString(self, groups, name):
         """
         Delete string from container.
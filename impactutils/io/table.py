@@ -1,13 +1,15 @@
 # stdlib imports
+import itertools
+import json
 import re
 import time
-import string
 
 # third party imports
 import pandas as pd
 import numpy as np
 from lxml import etree
-from openpyxl import load_workbook, utils
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
 
 REQUIRED_COLUMNS = ['STATION', 'LAT', 'LON', 'NETID']
 CHANNEL_GROUPS = [['[A-Z]{2}E', '[A-Z]{2}N', '[A-Z]{2}Z'],
@@ -17,38 +19,48 @@ CHANNEL_GROUPS = [['[A-Z]{2}E', '[A-Z]{2}N', '[A-Z]{2}Z'],
 CHANNEL_PATTERNS = ['^[H,B][H,L,N][E,N,Z,1,2,3]$',  # match standard seed names
                     '^H[1,2]$',  # match H1/H2
                     '^Z$']  # match Z
+CHANNEL_GROUP_RES = [[re.compile(pattern) for pattern in group]
+                     for group in CHANNEL_GROUPS]
+CHANNEL_PATTERN_RES = [re.compile(pattern) for pattern in CHANNEL_PATTERNS]
+# any single channel name of the channel groups
+CHANNEL_RE = re.compile('|'.join(pattern for group in CHANNEL_GROUPS
+                                 for pattern in group))
+# names of amplitude elements in long format tables (pga, psa03, etc.)
+IMT_RE = re.compile(r'pga|pgv|pgd|psa\d+|intensity')
 PGM_COLS = ['PGA', 'PGV', 'SA(0.3)', 'SA(1.0)', 'SA(3.0)']
 OPTIONAL = ['NAME', 'DISTANCE', 'REFERENCE',
             'INTENSITY', 'SOURCE', 'LOC', 'INSTTYPE', 'ELEV',
             'NRESP', 'INTENSITY_STDDEV']
 FLOATRE = "[-+]?[0-9]*\.?[0-9]+"
+EMPTY_CELL = re.compile(r'\s+')
+OLD_PSA = re.compile(r'^psa(\d+)$', re.IGNORECASE)
 
+# station attributes in XML output: column, attribute name, and format
+# (None for strings)
+XML_ATTRIBUTES = [('NAME', 'name', None),
+                  ('NETID', 'netid', None),
+                  ('DISTANCE', 'dist', '%.1f'),
+                  ('INTENSITY', 'intensity', '%.1f'),
+                  ('NRESP', 'nresp', '%i'),
+                  ('INTENSITY_STDDEV', 'intensity_stddev', '%.2f'),
+                  ('SOURCE', 'source', None),
+                  ('LOC', 'loc', None),
+                  ('INSTTYPE', 'insttype', None),
+                  ('ELEV', 'elev', '%.1f')]
+# column types of CSV files
+STRING_COLUMNS = ['STATION', 'NETID', 'NAME', 'SOURCE', 'LOC', 'INSTTYPE',
+                  'CHANNEL', 'IMT', 'FLAG']
+FLOAT_COLUMNS = ['LAT', 'LON', 'VALUE', 'DISTANCE', 'ELEV', 'INTENSITY',
+                 'INTENSITY_STDDEV', 'NRESP']
+NUMERIC_ATTRIBUTES = set(attribute for _, attribute, fmt in XML_ATTRIBUTES
+                         if fmt is not None)
 
-def _move(cellstr, nrows, ncols):
-    """Internal method for adding rows/columns to cell coordinate.
-
-    'A1' moved by 1 row, 1 column => 'B2'
-
-    Args:
-        cellstr (str): Cell coordinate (A1,B2)
-        nrows (int): Number of rows to move (usually down)
-        ncols (int): Number of columns to move (usually right)
-    Returns:
-        str: New cell coordinate.
-    """
-    # WARNING! This will only work up to column Z!
-    # colidx is a string, rowidx is a number
-    col_str_idx, rowidx = utils.cell.coordinate_from_string(cellstr)
-    letters = string.ascii_uppercase
-    try:
-        colidx = letters.index(col_str_idx)
-        newcolidx = colidx + ncols
-        newrowidx = rowidx + nrows
-        newcellstr = '%s%i' % (letters[newcolidx], newrowidx)
-        return newcellstr
-    except ValueError:
-        raise ValueError('Could not add %i columns to column %s.' %
-                         (ncols, col_str_idx))
+# GeoJSON property names of station XML attributes
+GEOJSON_PROPERTIES = {'netid': 'network',
+                      'dist': 'distance',
+                      'loc': 'location',
+                      'insttype': 'instrumentType',
+                      'elev': 'elevation'}
 
 
 def read_excel(excelfile):
@@ -102,54 +114,45 @@ def read_excel(excelfile):
 
     """
 
-    # figure out if data frame is multi-index or not
-    wb = load_workbook(excelfile)
-    ws = wb.active
+    # read all of the cell values in one pass over the streamed sheet
+    rows = _read_sheet_rows(excelfile)
 
-    # figure out where the top left of the data begins
-    topleft = 'A1'
-    first_cell = 'A2'
-    second_cell = 'A3'
-
-    # figure out if there is a little reference section in this...
-    reference = None
-    skip_rows = None
-    header = [0, 1]
-    if ws[topleft].value.lower() != 'reference':
+    # there must be a little reference section in this...
+    if not rows or not isinstance(rows[0][0], str) or \
+            rows[0][0].lower() != 'reference':
         raise KeyError('Reference cells are required in A1 and B1!')
-    refcell = _move(topleft, 0, 1)
-    reference = ws[refcell].value
-    first_cell = _move(topleft, 1, 0)
-    second_cell = _move(first_cell, 1, 0)
-    skip_rows = [0]
-    header = [1, 2]
-
-    is_multi = True
+    reference = rows[0][1] if len(rows[0]) > 1 else None
+    if reference == '':
+        reference = None
+    rows = rows[1:]
+
     # if the first column of the second row is not empty,
     # then we do not have a multi-index.
-    if ws[second_cell].value is not None:
-        is_multi = False
+    is_multi = len(rows) < 2 or rows[1][0] == ''
 
     # read in dataframe, assuming that ground motions are grouped by channel
     if is_multi:
-        try:
-            # note - in versions of pandas prior to 0.24, index_col=None
-            # has no effect here.  Hence the unsetting of the index later.
-            df = pd.read_excel(excelfile, header=header, index_col=None)
-            # if the name column is all blanks, it's filled with NaNs by
-            # default, which causes problems later on.  Replace with
-            # empty strings
-            if 'NAME' in df.columns:
-                df['NAME'] = df['NAME'].fillna('')
-        except pd.errors.ParserError:
+        if len(rows) < 2 or all(value == '' for value in rows[1]):
             raise IndexError('Input file has invalid empty first data row.')
+        # fill in the channel names over all of their PGM columns
+        _fill_header(rows[:2])
+        # spreadsheets written from a multi-indexed dataframe have a
+        # blank row with the (empty) index names after the header
+        if len(rows) > 2 and all(value == '' for value in rows[2]):
+            del rows[2]
+        df = _rows_to_dataframe(rows, 2)
+        # if the name column is all blanks, it's filled with NaNs by
+        # default, which causes problems later on.  Replace with
+        # empty strings
+        if 'NAME' in df.columns:
+            df['NAME'] = df['NAME'].fillna('')
 
         headers = df.columns.get_level_values(0).str.upper()
         subheaders = df.columns.get_level_values(1).str.upper()
         df.columns = pd.MultiIndex.from_arrays([headers, subheaders])
         top_headers = df.columns.levels[0]
     else:
-        df = pd.read_excel(excelfile, skiprows=skip_rows, index_col=None)
+        df = _rows_to_dataframe(rows, 1)
         top_headers = df.columns
 
     # make sure basic columns are present
@@ -164,45 +167,22 @@ def read_excel(excelfile):
 
     # check if channel headers are valid
     channels = (set(top_headers) - set(REQUIRED_COLUMNS)) - set(OPTIONAL)
-    valid = False
-    if len(channels):
-        for channel_group in CHANNEL_GROUPS:
-            num_channels = 0
-            for channel_pat in channel_group:
-                cp = re.compile(channel_pat)
-                if len(list(filter(cp.match, channels))):
-                    num_channels += 1
-            if num_channels == 1 and len(channels) == 1:
-                valid = True
-                break
-            elif num_channels > 1:
-                h1_pat = re.compile(channel_group[0])
-                h2_pat = re.compile(channel_group[1])
-                has_h1 = len(list(filter(h1_pat.match, channels))) > 0
-                has_h2 = len(list(filter(h2_pat.match, channels))) > 0
-                if has_h1 or has_h2:
-                    valid = True
-                    break
-    else:
-        valid = True
-    if not valid:
-        raise KeyError('%s is not a valid channel grouping' %
-                       str(sorted(list(channels))))
+    _check_channel_groups(channels)
 
     # make sure the empty cells are all nans or floats
     found = False
     if 'INTENSITY' in top_headers:
         found = True
-    empty_cell = re.compile(r'\s+')
     for channel in channels:
-        channel_df = df[channel].copy()
         for column in PGM_COLS:
-            if column in channel_df:
-                found = True
-                channel_df[column] = channel_df[column].replace(
-                    empty_cell, np.nan)
-                channel_df[column] = channel_df[column].astype(float)
-        df[channel] = channel_df
+            if (channel, column) not in df.columns:
+                continue
+            found = True
+            values = df[(channel, column)]
+            if values.dtype == object:
+                blank = values.str.contains(EMPTY_CELL, na=False)
+                values = values.mask(blank.astype(bool))
+            df[(channel, column)] = values.astype(float)
 
     if not found:
         fmt = ('File must contain at least one of the following '
@@ -213,11 +193,279 @@ def read_excel(excelfile):
     return (df, reference)
 
 
+def _check_channel_groups(channels):
+    """Internal method to check that a set of channels is a valid grouping.
+
+    Args:
+        channels (set): Channel names.
+    Raises:
+        KeyError: If the channels are not a valid channel grouping.
+    """
+    if not len(channels):
+        return
+    for channel_group in CHANNEL_GROUP_RES:
+        num_channels = 0
+        for channel_re in channel_group:
+            if any(channel_re.match(channel) for channel in channels):
+                num_channels += 1
+        if num_channels == 1 and len(channels) == 1:
+            return
+        elif num_channels > 1:
+            h1_re, h2_re = channel_group[0:2]
+            has_h1 = any(h1_re.match(channel) for channel in channels)
+            has_h2 = any(h2_re.match(channel) for channel in channels)
+            if has_h1 or has_h2:
+                return
+    raise KeyError('%s is not a valid channel grouping' %
+                   str(sorted(list(channels))))
+
+
+def read_csv(csvfile, chunksize=None):
+    """Read strong motion CSV file, return a DataFrame.
+
+    The file is read with the pandas C parser, with the (upper case)
+    column types given in STRING_COLUMNS and FLOAT_COLUMNS. Unnamed columns
+    (i.e., a saved dataframe index) are skipped, and column names are
+    converted to upper case.
+
+    Two kinds of file are supported:
+     - Long format, with one row per station, channel and IMT, as
+       described in dataframe_to_xml. CHANNEL, IMT and VALUE columns are
+       required, and a FLAG column of '0' is added if there is none.
+       Every channel must be one of the channels in CHANNEL_GROUPS, and
+       IMTs must be amplitude names (pga, pgv, pgd, psa03, etc., or
+       intensity) or PGM column names as in read_excel (SA(0.3), etc.),
+       which are translated to amplitude names.
+     - Station (i.e., DYFI) format, with one row per station and an
+       INTENSITY column.
+
+    Both must have the columns in REQUIRED_COLUMNS. Missing values in
+    string columns are replaced with empty strings.
+
+    Args:
+        csvfile (str): Path to valid CSV file, or a file object.
+        chunksize (int): Number of rows per dataframe, or None to read the
+            whole file into one dataframe.
+    Returns:
+        If chunksize is None, a tuple of:
+            DataFrame: Dataframe as described above.
+            None: CSV files have no reference, this is for compatibility
+            with read_excel.
+        Otherwise, a generator of (DataFrame, None) tuples, one for every
+        chunksize rows. Every chunk is checked as it is read.
+    Raises:
+        KeyError: If required columns are missing, or channels or IMTs are
+            not valid.
+    """
+    dtype = {}
+    for column in STRING_COLUMNS:
+        dtype[column] = dtype[column.lower()] = str
+    for column in FLOAT_COLUMNS:
+        dtype[column] = dtype[column.lower()] = np.float64
+    reader = pd.read_csv(csvfile, engine='c', dtype=dtype,
+                         usecols=lambda column: not column.startswith(
+                             'Unnamed'),
+                         chunksize=chunksize)
+    if chunksize is None:
+        return (_check_csv_dataframe(reader), None)
+    return ((_check_csv_dataframe(df), None) for df in reader)
+
+
+def _check_csv_dataframe(df):
+    """Internal method to check and clean up a dataframe read from CSV.
+
+    Args:
+        df (DataFrame): Dataframe read from a CSV file.
+    Returns:
+        DataFrame: Dataframe with upper case column names, see read_csv.
+    Raises:
+        KeyError: If required columns are missing, or channels or IMTs are
+            not valid.
+    """
+    df.columns = df.columns.str.upper()
+    if not set(REQUIRED_COLUMNS).issubset(set(df.columns)):
+        fmt = 'Input CSV file must specify the following columns: %s.'
+        raise KeyError(fmt % str(REQUIRED_COLUMNS))
+    long_columns = ['CHANNEL', 'IMT', 'VALUE']
+    if 'IMT' in df.columns:
+        if not set(long_columns).issubset(set(df.columns)):
+            fmt = 'Long format CSV files must have the columns: %s.'
+            raise KeyError(fmt % str(long_columns))
+        if 'FLAG' not in df.columns:
+            df['FLAG'] = '0'
+        df['CHANNEL'] = df['CHANNEL'].str.upper()
+        bad = ~df['CHANNEL'].str.fullmatch(CHANNEL_RE).fillna(False)
+        if bad.any():
+            raise KeyError('%s are not valid channels' %
+                           str(sorted(df['CHANNEL'][bad].unique())))
+        imts = df['IMT'].fillna('').astype(str)
+        df['IMT'] = [_old_imt_name(imt.strip()) for imt in imts]
+        bad = ~df['IMT'].str.fullmatch(IMT_RE)
+        if bad.any():
+            raise KeyError('%s are not valid IMTs' %
+                           str(sorted(imts[bad].unique())))
+    elif 'INTENSITY' not in df.columns:
+        fmt = ('File must contain at least one of the following '
+               'data columns: %s')
+        raise KeyError(fmt % str(long_columns + ['INTENSITY']))
+    for column in STRING_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].fillna('')
+    return df
+
+
+def read_table(filename, chunksize=None):
+    """Read a strong motion Excel or CSV file, return a DataFrame.
+
+    Files with the extension .csv are read with read_csv, all others with
+    read_excel.
+
+    Args:
+        filename (str): Path to valid Excel or CSV file.
+        chunksize (int): Number of rows per dataframe for CSV files, see
+            read_csv. Excel files are always read into one dataframe.
+    Returns:
+        tuple or generator: As from read_excel or read_csv.
+    """
+    if filename.lower().endswith('.csv'):
+        return read_csv(filename, chunksize=chunksize)
+    return read_excel(filename)
+
+
+def _read_sheet_rows(excelfile):
+    """Internal method to read the cell values of the active sheet.
+
+    The workbook is opened in read-only (streaming) mode, and the cell
+    values are converted as pandas.read_excel does: empty cells become
+    empty strings, error cells become NaN and integral floats become
+    integers. Trailing empty cells and rows are removed, and all rows are
+    padded to the same length.
+
+    Args:
+        excelfile (str): Path to valid Excel file.
+    Returns:
+        list: List of rows, each a list of cell values.
+    """
+    wb = load_workbook(excelfile, read_only=True, data_only=True,
+                       keep_links=False)
+    try:
+        ws = wb.active
+        ws.reset_dimensions()
+        rows = []
+        nrows = 0
+        for values in ws.iter_rows(values_only=True):
+            row = [_convert_cell(value) for value in values]
+            while row and row[-1] == '':
+                row.pop()
+            rows.append(row)
+            if row:
+                nrows = len(rows)
+    finally:
+        wb.close()
+    rows = rows[:nrows]
+    if rows:
+        ncols = max(len(row) for row in rows)
+        for row in rows:
+            row.extend([''] * (ncols - len(row)))
+    return rows
+
+
+def _convert_cell(value):
+    """Internal method to convert an Excel cell value.
+
+    Args:
+        value: Cell value from openpyxl.
+    Returns:
+        Empty string for empty cells, NaN for error cells, int for
+        integral floats, or the input value.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        if value in ERROR_CODES:
+            return np.nan
+    elif isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _rows_to_dataframe(rows, nheader):
+    """Internal method to make a dataframe from the cell values of a sheet.
+
+    Columns are named and typed as pandas.read_excel does: blank header
+    cells are named 'Unnamed: N' ('Unnamed: N_level_L' with a multi row
+    header), repeated names get a '.N' suffix, empty cells become NaN, and
+    columns of numbers (or numeric strings) are converted to numbers.
+
+    Args:
+        rows (list): Rows, each a list of cell values, as from
+            _read_sheet_rows.
+        nheader (int): Number of header rows (1 or 2).
+    Returns:
+        DataFrame: Dataframe, with a MultiIndex for a multi row header.
+    """
+    header = [[str(value) for value in row] for row in rows[:nheader]]
+    for level, names in enumerate(header):
+        for i, name in enumerate(names):
+            if name != '':
+                continue
+            if nheader == 1:
+                names[i] = 'Unnamed: %i' % i
+            else:
+                names[i] = 'Unnamed: %i_level_%i' % (i, level)
+    if nheader == 1:
+        names = []
+        counts = {}
+        for name in header[0]:
+            count = counts.get(name, 0)
+            counts[name] = count + 1
+            names.append(name if not count else '%s.%i' % (name, count))
+        columns = pd.Index(names)
+    else:
+        columns = pd.MultiIndex.from_arrays(header)
+
+    data = {}
+    for i in range(len(columns)):
+        values = pd.Series([row[i] for row in rows[nheader:]],
+                           dtype=object).replace('', np.nan)
+        try:
+            data[i] = pd.to_numeric(values) if len(values) else values
+        except (ValueError, TypeError):
+            data[i] = values.infer_objects()
+    df = pd.DataFrame(data)
+    df.columns = columns
+    return df
+
+
+def _fill_header(rows):
+    """Internal method to forward fill the blank cells of a multi row header.
+
+    Blank cells take the value of the cell to their left, but only inside
+    the same parent column (i.e., a channel name is filled in over all of
+    its PGM columns). This matches the MultiIndex header handling of
+    pandas.read_excel.
+
+    Args:
+        rows (list): Header rows, filled in place.
+    """
+    control = [True] * len(rows[0])
+    for row in rows:
+        last = row[0]
+        for i in range(1, len(row)):
+            if not control[i]:
+                last = row[i]
+            if row[i] == '':
+                row[i] = last
+            else:
+                control[i] = False
+                last = row[i]
+
+
 def _get_channels(columns):
     channels = []
     for column in columns:
-        for cmatch in CHANNEL_PATTERNS:
-            if re.search(cmatch, column) is not None:
+        for channel_re in CHANNEL_PATTERN_RES:
+            if channel_re.search(column) is not None:
                 channels.append(column)
                 break
     return channels
@@ -247,134 +495,770 @@ def dataframe_to_xml(df, xmlfile, reference=None):
      - NRESP: Number of responses for aggregated intensity. (OPTIONAL)
      - INTENSITY_STDDEV: Uncertainty for this intensity. (OPTIONAL)
 
+    The CHANNEL, IMT, VALUE and FLAG columns may also be lower case. Rows
+    with the same station code (the STATION column, prefixed with NETID)
+    are written as a single station.
+
     Args:
         df (DataFrame): Pandas dataframe, as described in read_excel.
-        xmlfile (str): Path to file where XML file should be written.
+        xmlfile (str): Path to file where XML file should be written, or a
+            file object opened in binary mode.
+        reference (str): Reference string for the station list, or None.
     """
-    if hasattr(df.columns, 'levels'):
-        top_headers = set(df.columns.levels[0])
-        required = set(REQUIRED_COLUMNS)
-        optional = set(OPTIONAL)
-        channel_candidates = (top_headers - required) - optional
-        channels = _get_channels(channel_candidates)
+    dataframes_to_xml(df, xmlfile, reference=reference)
+
+
+def dataframes_to_xml(dataframes, xmlfile, reference=None):
+    """Write one or more dataframes to a single ShakeMap XML file.
+
+    Stations are written to the file as they are created, rather than
+    building the whole document in memory, so dataframes can be an
+    iterator of chunks of a station set that is too large to hold at once
+    (i.e., from pd.read_csv(..., chunksize=N)). All chunks must have the
+    structure described in dataframe_to_xml, and all of the rows of a
+    station must be in the same chunk; a station code that was already
+    written from an earlier chunk is skipped. The output is the same as
+    that of dataframe_to_xml for the concatenated dataframes.
+
+    Args:
+        dataframes (DataFrame or iterable): Dataframe, or iterable of
+            dataframes, as described in dataframe_to_xml.
+        xmlfile (str): Path to file where XML file should be written, or a
+            file object opened in binary mode.
+        reference (str): Reference string for the station list, or None.
+    """
+    if isinstance(dataframes, pd.DataFrame):
+        dataframes = [dataframes]
+    attrib = {'created': '%i' % int(time.time())}
+    if reference is not None:
+        attrib['reference'] = reference
+
+    seen = set()
+    chunks = (_iter_station_elements(df, seen) for df in dataframes)
+    # find the first station, an empty station list is written as a single
+    # element
+    first = None
+    for stations in chunks:
+        first = next(stations, None)
+        if first is not None:
+            break
+
+    if isinstance(xmlfile, str):
+        f = open(xmlfile, 'wb')
     else:
-        channels = []
-    root = etree.Element('shakemap-data', code_version="3.5", map_version="3")
+        f = xmlfile
+    try:
+        with etree.xmlfile(f, close=False) as xf:
+            root_attrib = {'code_version': '3.5', 'map_version': '3'}
+            with xf.element('shakemap-data', root_attrib):
+                xf.write('\n  ')
+                if first is None:
+                    xf.write(etree.Element('stationlist', attrib))
+                else:
+                    with xf.element('stationlist', attrib):
+                        _write_stations(xf, [first])
+                        _write_stations(xf, stations)
+                        xf.flush()
+                        for stations in chunks:
+                            _write_stations(xf, stations)
+                            xf.flush()
+                        xf.write('\n  ')
+                xf.write('\n')
+        # match the trailing newline of ElementTree.write(pretty_print=True)
+        f.write(b'\n')
+    finally:
+        if f is not xmlfile:
+            f.close()
+
 
-    create_time = int(time.time())
-    stationlist = etree.SubElement(
-        root, 'stationlist', created='%i' % create_time)
+def _write_stations(xf, stations):
+    """Internal method to write indented station elements.
+
+    Args:
+        xf: lxml incremental writer, inside the stationlist element.
+        stations (iterable): Station elements.
+    """
+    for station in stations:
+        etree.indent(station, space='  ', level=2)
+        xf.write('\n    ')
+        xf.write(station)
+
+
+def dataframe_to_geojson(df, jsonfile, reference=None):
+    """Write a dataframe to a ShakeMap style GeoJSON station list.
+
+    The output is a FeatureCollection with one Point feature per station.
+    Feature properties are the station attributes that are written to
+    station XML by dataframe_to_xml (with the names listed in
+    GEOJSON_PROPERTIES), the station_type ('seismic' for stations with
+    amplitudes, 'macroseismic' otherwise), and a list of channels, each
+    with a name and a list of amplitudes (name, value and flag).
+    Missing values are written as null.
+
+    Args:
+        df (DataFrame): Pandas dataframe, as described in dataframe_to_xml.
+        jsonfile (str): Path to file where GeoJSON file should be written,
+            or a file object opened in text mode.
+        reference (str): Reference string for the station list, or None.
+    """
+    dataframes_to_geojson(df, jsonfile, reference=reference)
+
+
+def dataframes_to_geojson(dataframes, jsonfile, reference=None):
+    """Write one or more dataframes to a single GeoJSON station list.
+
+    Features are written to the file as they are created, the same way
+    dataframes_to_xml writes stations, and the same restrictions on chunks
+    apply.
+
+    Args:
+        dataframes (DataFrame or iterable): Dataframe, or iterable of
+            dataframes, as described in dataframe_to_xml.
+        jsonfile (str): Path to file where GeoJSON file should be written,
+            or a file object opened in text mode.
+        reference (str): Reference string for the station list, or None.
+    """
+    if isinstance(dataframes, pd.DataFrame):
+        dataframes = [dataframes]
+    header = {'type': 'FeatureCollection',
+              'created': int(time.time())}
     if reference is not None:
-        stationlist.attrib['reference'] = reference
+        header['reference'] = reference
+
+    if isinstance(jsonfile, str):
+        f = open(jsonfile, 'wt')
+    else:
+        f = jsonfile
+    try:
+        # the header without its closing brace
+        f.write(json.dumps(header)[:-1] + ', "features": [')
+        separator = '\n'
+        seen = set()
+        for df in dataframes:
+            for attributes, components in _iter_station_records(df, seen):
+                f.write(separator)
+                f.write(_station_feature(attributes, components))
+                separator = ',\n'
+            f.flush()
+        f.write('\n]}\n')
+    finally:
+        if f is not jsonfile:
+            f.close()
 
-    processed_stations = []
 
-    for _, row in df.iterrows():
-        tmprow = row.copy()
-        if isinstance(tmprow.index, pd.core.indexes.multi.MultiIndex):
-            tmprow.index = tmprow.index.droplevel(1)
+def _station_feature(attributes, components):
+    """Internal method to make the GeoJSON feature of a station.
+
+    Args:
+        attributes (dict): Station attributes, as from
+            _iter_station_records.
+        components (list): Station components, as from
+            _iter_station_records.
+    Returns:
+        str: JSON text of the station feature.
+    """
+    properties = {}
+    for attribute, value in attributes.items():
+        if attribute in ['lat', 'lon']:
+            continue
+        if attribute in NUMERIC_ATTRIBUTES:
+            value = _json_number(value)
+        properties[GEOJSON_PROPERTIES.get(attribute, attribute)] = value
+    channels = []
+    for comp_attributes, amplitudes in components:
+        channels.append({
+            'name': comp_attributes['name'],
+            'amplitudes': [{'name': imt,
+                            'value': _json_number(amp_attributes['value']),
+                            'flag': amp_attributes['flag']}
+                           for imt, amp_attributes in amplitudes]})
+    if any(channel['amplitudes'] for channel in channels):
+        properties['station_type'] = 'seismic'
+    else:
+        properties['station_type'] = 'macroseismic'
+    properties['channels'] = channels
+    feature = {'type': 'Feature',
+               'id': attributes['code'],
+               'geometry': {
+                   'type': 'Point',
+                   'coordinates': [_json_number(attributes['lon']),
+                                   _json_number(attributes['lat'])]},
+               'properties': properties}
+    return json.dumps(feature)
+
+
+def _json_number(value):
+    """Internal method to convert a formatted number for JSON output.
+
+    Args:
+        value (str): Formatted number.
+    Returns:
+        float, int or None: Number, or None for NaN.
+    """
+    number = float(value)
+    if np.isnan(number):
+        return None
+    if number.is_integer() and '.' not in value:
+        return int(number)
+    return number
+
 
-        # assign required columns
-        stationcode = str(tmprow['STATION']).strip()
+def xml_to_dataframe(xmlfile, layout='wide', chunksize=None):
+    """Read a ShakeMap station XML file into a dataframe.
 
-        netid = tmprow['NETID'].strip()
-        if not stationcode.startswith(netid):
-            stationcode = '%s.%s' % (netid, stationcode)
+    The file is parsed incrementally, and station elements are discarded
+    as soon as they have been read, so memory use is bounded by the size
+    of the output rather than that of the XML document.
 
-        # if this is a dataframe created by shakemap,
-        # there will be multiple rows per station.
-        # below we process all those rows at once,
-        # so we need this bookkeeping to know that
-        # we've already dealt with this station
-        if stationcode in processed_stations:
+    Two layouts are supported:
+     - 'wide': Multi-indexed dataframe as from read_excel, with one row per
+       station and the amplitudes in (channel, PGM) columns. Old style
+       amplitude names are translated (i.e., psa03 becomes SA(0.3)).
+       Amplitude flags are not kept.
+     - 'long': One row per station, channel and IMT, with the station
+       columns and CHANNEL, IMT, VALUE and FLAG columns, as described in
+       dataframe_to_xml. Stations without amplitudes have no rows.
+
+    In both layouts the STATION column holds the station code as found in
+    the file (i.e., including the network prefix), and the station
+    attributes (NAME, NETID, DISTANCE, etc.) that appear in the file are
+    in columns as described in dataframe_to_xml.
+
+    Args:
+        xmlfile (str): Path to ShakeMap station XML file, or a file
+            object.
+        layout (str): 'wide' or 'long'.
+        chunksize (int): Number of stations per dataframe, or None to read
+            all of the stations into one dataframe.
+    Returns:
+        If chunksize is None, a tuple of:
+            DataFrame: Dataframe in the requested layout.
+            str or None: Reference string or None.
+        Otherwise, a generator of (DataFrame, reference) tuples, one for
+        every chunksize stations.
+    Raises:
+        ValueError: If layout is not 'wide' or 'long', or chunksize is
+            less than one.
+    """
+    if layout not in ['wide', 'long']:
+        raise ValueError('Unknown layout %r, must be "wide" or "long".' %
+                         layout)
+    if chunksize is not None and chunksize < 1:
+        raise ValueError('chunksize must be at least one.')
+    if chunksize is not None:
+        return _iter_xml_dataframes(xmlfile, layout, chunksize)
+    header = {}
+    stations = list(_iter_xml_stations(xmlfile, header))
+    df = _stations_to_dataframe(stations, layout)
+    return (df, header.get('reference'))
+
+
+def _iter_xml_dataframes(xmlfile, layout, chunksize):
+    """Internal method to read a station XML file in chunks.
+
+    Args:
+        xmlfile (str): Path to ShakeMap station XML file, or a file object.
+        layout (str): 'wide' or 'long'.
+        chunksize (int): Number of stations per dataframe.
+    Yields:
+        tuple: (DataFrame, reference) for every chunksize stations.
+    """
+    header = {}
+    stations = _iter_xml_stations(xmlfile, header)
+    while True:
+        chunk = list(itertools.islice(stations, chunksize))
+        if not chunk:
+            break
+        yield (_stations_to_dataframe(chunk, layout),
+               header.get('reference'))
+
+
+def _iter_xml_stations(xmlfile, header):
+    """Internal method to parse the stations of a station XML file.
+
+    Args:
+        xmlfile (str): Path to ShakeMap station XML file, or a file object.
+        header (dict): Dictionary to which the 'reference' attribute of
+            the stationlist is added.
+    Yields:
+        tuple: Dictionary of station columns and values, and list of
+        (channel, imt, value, flag) tuples of the station's amplitudes.
+    """
+    attributes = [(attribute, column, fmt is not None)
+                  for column, attribute, fmt in XML_ATTRIBUTES]
+    context = etree.iterparse(xmlfile, events=('start', 'end'),
+                              tag=('stationlist', 'station'))
+    for event, element in context:
+        if element.tag == 'stationlist':
+            if event == 'start':
+                header['reference'] = element.get('reference')
             continue
+        if event != 'end':
+            continue
+        station = {'STATION': element.get('code'),
+                   'LAT': float(element.get('lat')),
+                   'LON': float(element.get('lon'))}
+        for attribute, column, is_float in attributes:
+            value = element.get(attribute)
+            if value is not None:
+                station[column] = float(value) if is_float else value
+        amplitudes = []
+        for comp in element.iterchildren('comp'):
+            channel = comp.get('name')
+            for amplitude in comp.iterchildren(tag=etree.Element):
+                amplitudes.append((channel, amplitude.tag,
+                                   float(amplitude.get('value')),
+                                   amplitude.get('flag', '0')))
+        yield (station, amplitudes)
 
-        station = etree.SubElement(stationlist, 'station')
-
-        station.attrib['code'] = stationcode
-        station.attrib['lat'] = '%.4f' % tmprow['LAT']
-        station.attrib['lon'] = '%.4f' % tmprow['LON']
-
-        # assign optional columns
-        if 'NAME' in tmprow:
-            station.attrib['name'] = tmprow['NAME'].strip()
-        if 'NETID' in tmprow:
-            station.attrib['netid'] = tmprow['NETID'].strip()
-        if 'DISTANCE' in tmprow:
-            station.attrib['dist'] = '%.1f' % tmprow['DISTANCE']
-        if 'INTENSITY' in tmprow:
-            station.attrib['intensity'] = '%.1f' % tmprow['INTENSITY']
-        if 'NRESP' in tmprow:
-            station.attrib['nresp'] = '%i' % tmprow['NRESP']
-        if 'INTENSITY_STDDEV' in tmprow:
-            station.attrib['intensity_stddev'] = '%.2f' % tmprow['INTENSITY_STDDEV']
-        if 'SOURCE' in tmprow:
-            station.attrib['source'] = tmprow['SOURCE'].strip()
-        if 'LOC' in tmprow:
-            station.attrib['loc'] = tmprow['LOC'].strip()
-        if 'INSTTYPE' in tmprow:
-            station.attrib['insttype'] = tmprow['INSTTYPE'].strip()
-        if 'ELEV' in tmprow:
-            station.attrib['elev'] = '%.1f' % tmprow['ELEV']
-
-        if 'imt' not in tmprow.index:
-            # sort channels by N,E,Z or H1,H2,Z
-            channels = sorted(list(channels))
-
-            for channel in channels:
-                component = etree.SubElement(station, 'comp')
-                component.attrib['name'] = channel.upper()
-
-                # figure out if channel is horizontal or vertical
-                if channel[-1] in ['1', '2', 'E', 'N']:
-                    component.attrib['orientation'] = 'h'
-                else:
-                    component.attrib['orientation'] = 'z'
-
-                # create sub elements out of any of the PGMs
-                # this is extra confusing because we're trying to
-                # transition from psa03 style to SA(0.3) style.
-                # station xml format only accepts the former, but we're
-                # supporting the latter as input, and the format as output.
-
-                # loop over desired output fields
-                for pgm in ['pga', 'pgv', 'psa03', 'psa10', 'psa30']:
-                    newpgm = _translate_imt(pgm, row[channel].index)
-                    c1 = newpgm not in row[channel]
-                    c2 = False
-                    if not c1:
-                        c2 = np.isnan(row[channel][newpgm])
-                    if c1 or c2:
-                        continue
-                    # make an element with the old style name
-                    pgm_el = etree.SubElement(component, pgm)
-                    pgm_el.attrib['flag'] = '0'
-                    pgm_el.attrib['value'] = '%.4f' % row[channel][newpgm]
-            processed_stations.append(stationcode)
+        # free the station and any earlier siblings
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def _stations_to_dataframe(stations, layout):
+    """Internal method to make a dataframe from parsed stations.
+
+    Args:
+        stations (list): List of (station, amplitudes) tuples, as from
+            _iter_xml_stations.
+        layout (str): 'wide' or 'long'.
+    Returns:
+        DataFrame: Dataframe in the requested layout, see xml_to_dataframe.
+    """
+    columns = ['STATION', 'LAT', 'LON']
+    present = set()
+    for station, _ in stations:
+        present.update(station)
+    columns += [column for column, _, _ in XML_ATTRIBUTES
+                if column in present]
+    df = pd.DataFrame([station for station, _ in stations], columns=columns)
+    for column, _, fmt in XML_ATTRIBUTES:
+        if column in present and fmt is None:
+            df[column] = df[column].fillna('')
+
+    rows = [i for i, (_, amplitudes) in enumerate(stations)
+            for _ in amplitudes]
+    amplitudes = pd.DataFrame(
+        [amplitude for _, station_amps in stations
+         for amplitude in station_amps],
+        columns=['CHANNEL', 'IMT', 'VALUE', 'FLAG'])
+
+    if layout == 'long':
+        df = df.iloc[rows].reset_index(drop=True)
+        return pd.concat([df, amplitudes], axis=1)
+
+    df.columns = pd.MultiIndex.from_arrays([df.columns, [''] * len(columns)])
+    if not len(amplitudes):
+        return df
+    amplitudes['IMT'] = [_translate_old_imt(imt) for imt in amplitudes['IMT']]
+    amplitudes['ROW'] = rows
+    amplitudes = amplitudes.drop_duplicates(['ROW', 'CHANNEL', 'IMT'])
+    values = amplitudes.pivot(index='ROW', columns=['CHANNEL', 'IMT'],
+                              values='VALUE')
+    values = values.reindex(range(len(df)))
+    # sort by channel, with the PGMs in the order of read_excel files
+    order = {pgm: i for i, pgm in enumerate(PGM_COLS)}
+    amp_columns = sorted(values.columns, key=lambda column: (
+        column[0], order.get(column[1], len(order)), column[1]))
+    values = values[amp_columns]
+    values.columns = pd.MultiIndex.from_tuples(amp_columns)
+    values.index = df.index
+    return pd.concat([df, values], axis=1)
+
+
+def _translate_old_imt(imt):
+    """Internal method to translate an old style amplitude name.
+
+    psa03 => SA(0.3), pga => PGA
+
+    Args:
+        imt (str): Amplitude element name.
+    Returns:
+        str: Column name as used by read_excel.
+    """
+    match = OLD_PSA.match(imt)
+    if match is not None:
+        return 'SA(%.1f)' % (int(match.group(1)) / 10)
+    return imt.upper()
+
+
+def merge_tables(dataframes, priority=None, prefer_unflagged=True):
+    """Merge station tables from several sources into one table.
+
+    Amplitudes are keyed on the station code (STATION, prefixed with
+    NETID as in dataframe_to_xml), LOC, CHANNEL and IMT. When more than
+    one row has the same key, the winner is chosen by, in order:
+     - Flag: unflagged rows (FLAG of '0' or empty) beat flagged rows, if
+       prefer_unflagged is True.
+     - Source priority: rows whose SOURCE is earlier in priority win. Rows
+       with a source that is not in priority (or no SOURCE column) rank
+       after all listed sources.
+     - Input order: rows from earlier dataframes, and then earlier rows,
+       win.
+
+    Rows are matched with a hash index (groupby) rather than by sorting or
+    comparing stations pairwise, so the cost is linear in the total
+    number of rows.
+
+    Args:
+        dataframes (list): List of long format dataframes (as from
+            read_csv or xml_to_dataframe(layout='long')) or multi-indexed
+            dataframes from read_excel, which are converted to long
+            format. Stations without amplitudes (i.e., intensity only) are
+            not kept.
+        priority (list): List of source names (values of the SOURCE
+            column), highest priority first, or None to use the order of
+            dataframes only.
+        prefer_unflagged (bool): Whether unflagged amplitudes should beat
+            flagged amplitudes regardless of source priority.
+    Returns:
+        DataFrame: Long format dataframe, as described in
+        dataframe_to_xml, with one row per key (the winning row), in order
+        of the first appearance of the key in any dataframe. STATION holds
+        the station code prefixed with NETID.
+    Raises:
+        KeyError: If a dataframe is missing required columns.
+    """
+    frames = []
+    for df in dataframes:
+        if hasattr(df.columns, 'levels'):
+            df = _wide_to_long(df)
         else:
-            # this file was created by a process that has imt/value columns
-            # search the dataframe for all rows with this same station code
-            scode = tmprow['STATION']
-            station_rows = df[df['STATION'] == scode]
-
-            # now we need to find all of the channels
-            channels = station_rows['channel'].unique()
-            for channel in channels:
-                channel_rows = station_rows[station_rows['channel'] == channel]
-                component = etree.SubElement(station, 'comp')
-                component.attrib['name'] = channel.upper()
-                for _, channel_row in channel_rows.iterrows():
-                    pgm = channel_row['imt']
-                    value = channel_row['value']
-
-                    pgm_el = etree.SubElement(component, pgm)
-                    pgm_el.attrib['value'] = '%.4f' % value
-                    pgm_el.attrib['flag'] = str(channel_row['flag'])
-
-            processed_stations.append(stationcode)
-
-    tree = etree.ElementTree(root)
-    tree.write(xmlfile, pretty_print=True)
+            df = df.rename(columns=str.upper)
+            required = REQUIRED_COLUMNS + ['CHANNEL', 'IMT', 'VALUE']
+            if not set(required).issubset(set(df.columns)):
+                fmt = 'Tables to merge must have the columns: %s.'
+                raise KeyError(fmt % str(required))
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=REQUIRED_COLUMNS +
+                            ['CHANNEL', 'IMT', 'VALUE', 'FLAG'])
+    df = pd.concat(frames, ignore_index=True, sort=False)
+    if not len(df):
+        return df
+
+    df['STATION'] = _get_station_codes(df)
+    df['CHANNEL'] = df['CHANNEL'].str.upper()
+    df['IMT'] = df['IMT'].str.lower()
+    if 'FLAG' in df.columns:
+        df['FLAG'] = df['FLAG'].fillna('0').astype(str)
+    else:
+        df['FLAG'] = '0'
+    if 'LOC' in df.columns:
+        locs = df['LOC'].fillna('').astype(str).str.strip()
+    else:
+        locs = pd.Series('', index=df.index)
+
+    # score every row, lowest wins; rows are in input order, so the row
+    # position breaks ties
+    nrows = len(df)
+    score = np.arange(nrows, dtype=np.int64)
+    if priority is not None:
+        ranks = {source: i for i, source in enumerate(priority)}
+        if 'SOURCE' in df.columns:
+            source_rank = df['SOURCE'].map(ranks).fillna(len(ranks))
+            source_rank = source_rank.to_numpy().astype(np.int64)
+        else:
+            source_rank = np.full(nrows, len(ranks), dtype=np.int64)
+        score += source_rank * nrows
+    if prefer_unflagged:
+        flagged = ~df['FLAG'].str.strip().isin(['0', ''])
+        score += flagged.to_numpy().astype(np.int64) * \
+            nrows * (len(priority) + 1 if priority is not None else 1)
+
+    # scores are unique, so the row with the lowest score of its key wins
+    keys = [df['STATION'], locs, df['CHANNEL'], df['IMT']]
+    groups = pd.Series(score).groupby(keys, sort=False)
+    keep = np.flatnonzero(score == groups.transform('min').to_numpy())
+    # groups are numbered in order of first appearance of their key, which
+    # may be before the winning row
+    order = np.argsort(groups.ngroup().to_numpy()[keep], kind='stable')
+    return df.iloc[keep[order]].reset_index(drop=True)
+
+
+def _wide_to_long(df):
+    """Internal method to convert a multi-indexed dataframe to long format.
+
+    Args:
+        df (DataFrame): Multi-indexed dataframe, as from read_excel.
+    Returns:
+        DataFrame: Long format dataframe, as described in dataframe_to_xml,
+        with the amplitudes of every station in channel and PGM order.
+        PGM names are translated to old style IMT names (SA(0.3) => psa03)
+        and FLAG is '0'.
+    """
+    top_headers = list(dict.fromkeys(df.columns.get_level_values(0)))
+    station_columns = [column for column in top_headers
+                       if column in REQUIRED_COLUMNS or column in OPTIONAL]
+    stations = pd.DataFrame({column: _get_column(df, column).to_numpy()
+                             for column in station_columns})
+    channels = [column for column in top_headers
+                if column not in station_columns]
+    parts = []
+    rows = []
+    for channel in sorted(channels):
+        for pgm in df[channel].columns:
+            imt = _old_imt_name(pgm)
+            # skip columns that are not PGMs, as dataframe_to_xml does
+            if not IMT_RE.fullmatch(imt):
+                continue
+            values = pd.to_numeric(df[(channel, pgm)],
+                                   errors='coerce').to_numpy()
+            valid = np.flatnonzero(~np.isnan(values))
+            part = stations.iloc[valid].reset_index(drop=True)
+            part['CHANNEL'] = channel
+            part['IMT'] = imt
+            part['VALUE'] = values[valid]
+            part['FLAG'] = '0'
+            parts.append(part)
+            rows.append(valid)
+    if not parts:
+        return pd.DataFrame(columns=station_columns +
+                            ['CHANNEL', 'IMT', 'VALUE', 'FLAG'])
+    long_df = pd.concat(parts, ignore_index=True)
+    order = np.argsort(np.concatenate(rows), kind='stable')
+    return long_df.iloc[order].reset_index(drop=True)
+
+
+def _old_imt_name(pgm):
+    """Internal method to translate a PGM column name to an old style name.
+
+    SA(0.3) => psa03, PGA => pga
+
+    Args:
+        pgm (str): PGM column name, as in read_excel dataframes.
+    Returns:
+        str: Amplitude element name.
+    """
+    match = re.match(r'^SA\((%s)\)$' % FLOATRE, pgm, re.IGNORECASE)
+    if match is not None:
+        return 'psa%02i' % int(round(float(match.group(1)) * 10))
+    return pgm.lower()
+
+
+def _get_column(df, column):
+    """Internal method to get a top level column from a dataframe.
+
+    Args:
+        df (DataFrame): Flat or multi-indexed (as from read_excel) dataframe.
+        column (str): Name of the (top level) column.
+    Returns:
+        Series: Column values.
+    """
+    values = df[column]
+    if isinstance(values, pd.DataFrame):
+        values = values.iloc[:, 0]
+    return values
+
+
+def _get_long_columns(df):
+    """Internal method to find the columns of a long format dataframe.
+
+    Long format dataframes have one row per station, channel and IMT, with
+    the channel, imt, value and flag in (lower or upper case) columns.
+
+    Args:
+        df (DataFrame): Input dataframe.
+    Returns:
+        dict or None: Dictionary mapping 'channel', 'imt', 'value' and
+        'flag' to the names of those columns in df, or None if df is not
+        in long format.
+    """
+    if hasattr(df.columns, 'levels'):
+        return None
+    columns = {}
+    for key in ['channel', 'imt', 'value', 'flag']:
+        for column in [key, key.upper()]:
+            if column in df.columns:
+                columns[key] = column
+                break
+    if 'imt' not in columns:
+        return None
+    return columns
+
+
+def _get_station_codes(df):
+    """Internal method to get the station codes of all rows in a dataframe.
+
+    Station codes are prefixed with the network ID, unless they already
+    start with it.
+
+    Args:
+        df (DataFrame): Input dataframe.
+    Returns:
+        list: Station code of every row in df.
+    """
+    stations = _get_column(df, 'STATION').astype(str).str.strip()
+    netids = _get_column(df, 'NETID').str.strip()
+    codes = [code if code.startswith(netid) else '%s.%s' % (netid, code)
+             for code, netid in zip(stations, netids)]
+    return codes
+
+
+def _format_column(df, column, fmt, rows):
+    """Internal method to format the values of a column as strings.
+
+    Args:
+        df (DataFrame): Input dataframe.
+        column (str): Name of the (top level) column.
+        fmt (str): Format string, or None for stripped strings.
+        rows (ndarray): Positions of the rows to format.
+    Returns:
+        ndarray: Array of formatted strings, one for each row in rows.
+    """
+    values = _get_column(df, column).to_numpy()[rows]
+    if fmt is None:
+        return np.array([value.strip() for value in values], dtype=object)
+    return np.char.mod(fmt, values)
+
+
+def _iter_station_records(df, seen=None):
+    """Internal method to prepare the stations of a dataframe for output.
+
+    Attributes and amplitudes are formatted a column at a time, and rows
+    are grouped by station with hash lookups, so the cost is linear in
+    the number of rows.
+
+    Args:
+        df (DataFrame): Dataframe, as described in dataframe_to_xml.
+        seen (set): Station codes to skip, or None. Codes of the yielded
+            stations are added to the set.
+    Yields:
+        tuple: (attributes, components) for every unique station code, in
+        order of first appearance. attributes is a dictionary of the
+        station's XML attributes (code, lat, lon, etc.) and formatted
+        values, and components is a list of (attributes, amplitudes)
+        tuples, one for each comp element, where amplitudes is a list of
+        (imt, attributes) tuples.
+    """
+    if not len(df):
+        return
+    codes = _get_station_codes(df)
+    unique = ~pd.Series(codes).duplicated().to_numpy()
+    if seen is not None:
+        unique &= np.array([code not in seen for code in codes], dtype=bool)
+        seen.update(codes)
+    rows = np.flatnonzero(unique)
+    if not len(rows):
+        return
+
+    columns = set(df.columns.get_level_values(0))
+    lats = _format_column(df, 'LAT', '%.4f', rows)
+    lons = _format_column(df, 'LON', '%.4f', rows)
+    attributes = []
+    for column, attribute, fmt in XML_ATTRIBUTES:
+        if column in columns:
+            attributes.append((attribute,
+                               _format_column(df, column, fmt, rows)))
+
+    long_columns = _get_long_columns(df)
+    if long_columns is None:
+        channels = _get_wide_amplitudes(df)
+    else:
+        # this file was created by a process that has imt/value columns,
+        # find the rows of every station (keyed on the original value of
+        # the station column)
+        stations = _get_column(df, 'STATION').to_numpy()
+        station_rows = df.groupby('STATION', sort=False).indices
+        channel_values = df[long_columns['channel']].to_numpy()
+        channel_names = df[long_columns['channel']].str.upper().to_numpy()
+        imts = df[long_columns['imt']].to_numpy()
+        values = np.char.mod('%.4f', df[long_columns['value']].to_numpy())
+        flags = df[long_columns['flag']].astype(str).to_numpy()
+
+    for i, row in enumerate(rows):
+        station = {'code': codes[row], 'lat': lats[i], 'lon': lons[i]}
+        for attribute, strings in attributes:
+            station[attribute] = strings[i]
+
+        components = []
+        if long_columns is None:
+            for channel, orientation, pgms in channels:
+                # make elements with the old style names
+                amplitudes = [(pgm, {'flag': '0', 'value': strings[row]})
+                              for pgm, strings, valid in pgms if valid[row]]
+                components.append(({'name': channel,
+                                    'orientation': orientation}, amplitudes))
+        else:
+            channel_amplitudes = {}
+            for srow in station_rows.get(stations[row], []):
+                channel = channel_values[srow]
+                amplitudes = channel_amplitudes.get(channel)
+                if amplitudes is None:
+                    amplitudes = []
+                    channel_amplitudes[channel] = amplitudes
+                    components.append(({'name': channel_names[srow]},
+                                       amplitudes))
+                amplitudes.append((imts[srow], {'value': values[srow],
+                                                'flag': flags[srow]}))
+
+        yield (station, components)
+
+
+def _iter_station_elements(df, seen=None):
+    """Internal method to build the station elements of a dataframe.
+
+    Args:
+        df (DataFrame): Dataframe, as described in dataframe_to_xml.
+        seen (set): Station codes to skip, or None. Codes of the yielded
+            stations are added to the set.
+    Yields:
+        Element: One station element for every unique station code, in order
+        of first appearance.
+    """
+    for attributes, components in _iter_station_records(df, seen):
+        station = etree.Element('station', attributes)
+        for comp_attributes, amplitudes in components:
+            component = etree.SubElement(station, 'comp', comp_attributes)
+            for imt, amp_attributes in amplitudes:
+                etree.SubElement(component, imt, amp_attributes)
+        yield station
+
+
+def _get_wide_amplitudes(df):
+    """Internal method to format the amplitudes of a wide dataframe.
+
+    Args:
+        df (DataFrame): Multi-indexed dataframe, as from read_excel.
+    Returns:
+        list: List of (channel, orientation, pgms) tuples, sorted by channel
+        (i.e. N,E,Z or H1,H2,Z), where pgms is a list of (pgm, strings,
+        valid) tuples; strings are the formatted values of the pgm in every
+        row and valid is True where the value is not NaN.
+    """
+    if not hasattr(df.columns, 'levels'):
+        return []
+    top_headers = set(df.columns.levels[0])
+    required = set(REQUIRED_COLUMNS)
+    optional = set(OPTIONAL)
+    channel_candidates = (top_headers - required) - optional
+    channels = []
+    for channel in sorted(_get_channels(channel_candidates)):
+        # figure out if channel is horizontal or vertical
+        if channel[-1] in ['1', '2', 'E', 'N']:
+            orientation = 'h'
+        else:
+            orientation = 'z'
+        channel_df = df[channel]
+
+        # create sub elements out of any of the PGMs
+        # this is extra confusing because we're trying to
+        # transition from psa03 style to SA(0.3) style.
+        # station xml format only accepts the former, but we're
+        # supporting the latter as input, and the format as output.
+
+        # loop over desired output fields
+        pgms = []
+        for pgm in ['pga', 'pgv', 'psa03', 'psa10', 'psa30']:
+            newpgm = _translate_imt(pgm, channel_df.columns)
+            if newpgm not in channel_df.columns:
+                continue
+            values = channel_df[newpgm].to_numpy()
+            pgms.append((pgm, np.char.mod('%.4f', values), ~np.isnan(values)))
+        channels.append((channel.upper(), orientation, pgms))
+    return channels
 
 
 def _translate_imt(oldimt, imtlist):
@@ -0,0 +1,129 @@
+# stdlib imports
+import math
+
+
+class BoxIndex(object):
+    """
+    Spatial hash of axis aligned boxes (i.e., map label extents), for
+    overlap queries.
+
+    Boxes are put in the buckets of all the cells of a regular grid that
+    they overlap, so that a query only looks at the boxes in the cells that
+    overlap the query box, and then applies the exact test to those
+    candidates. Boxes are closed, i.e., boxes that only touch overlap.
+    """
+
+    def __init__(self, cellsize):
+        """Create an empty index.
+
+        Args:
+            cellsize: Size of grid cells, in the units of the boxes. Works
+                best when close to the size of typical boxes.
+
+        Raises:
+            ValueError: When cellsize is not positive.
+        """
+        if not cellsize > 0:
+            raise ValueError('Cell size must be positive.')
+        self._cellsize = cellsize
+        self._boxes = []
+        self._cells = {}
+
+    def __len__(self):
+        """Return the number of indexed boxes.
+
+        Returns:
+            Number of indexed boxes.
+        """
+        return len(self._boxes)
+
+    def addBox(self, left, right, bottom, top):
+        """Add a box to the index.
+
+        Args:
+            left: Left edge of the box.
+            right: Right edge of the box.
+            bottom: Bottom edge of the box.
+            top: Top edge of the box.
+
+        Returns:
+            Position of the box in the index (the number of boxes added
+            before it).
+        """
+        position = len(self._boxes)
+        self._boxes.append((left, right, bottom, top))
+        for cell in self._getCells(left, right, bottom, top):
+            self._cells.setdefault(cell, []).append(position)
+        return position
+
+    def queryBox(self, left, right, bottom, top):
+        """Find the boxes overlapping a box.
+
+        Args:
+            left: Left edge of the box.
+            right: Right edge of the box.
+            bottom: Bottom edge of the box.
+            top: Top edge of the box.
+
+        Returns:
+            Sorted list of positions of the boxes that overlap the box.
+        """
+        candidates = set()
+        for cell in self._getCells(left, right, bottom, top):
+            candidates.update(self._cells.get(cell, ()))
+        return sorted(i for i in candidates
+                      if self._overlaps(i, left, right, bottom, top))
+
+    def hasOverlap(self, left, right, bottom, top):
+        """Check whether any box overlaps a box.
+
+        Args:
+            left: Left edge of the box.
+            right: Right edge of the box.
+            bottom: Bottom edge of the box.
+            top: Top edge of the box.
+
+        Returns:
+            True if any box in the index overlaps the box, False otherwise.
+        """
+        for cell in self._getCells(left, right, bottom, top):
+            for i in self._cells.get(cell, ()):
+                if self._overlaps(i, left, right, bottom, top):
+                    return True
+        return False
+
+    def _overlaps(self, position, left, right, bottom, top):
+        """Internal method to test whether an indexed box overlaps a box.
+
+        Args:
+            position: Position of the indexed box.
+            left: Left edge of the box.
+            right: Right edge of the box.
+            bottom: Bottom edge of the box.
+            top: Top edge of the box.
+
+        Returns:
+            True if the boxes overlap, False otherwise.
+        """
+        bleft, bright, bbottom, btop = self._boxes[position]
+        return not (left > bright or right < bleft or
+                    top < bbottom or bottom > btop)
+
+    def _getCells(self, left, right, bottom, top):
+        """Internal method to list the grid cells a box overlaps.
+
+        Args:
+            left: Left edge of the box.
+            right: Right edge of the box.
+            bottom: Bottom edge of the box.
+            top: Top edge of the box.
+
+        Returns:
+            List of (column, row) tuples of grid cells.
+        """
+        col0 = math.floor(left / self._cellsize)
+        col1 = math.floor(right / self._cellsize)
+        row0 = math.floor(bottom / self._cellsize)
+        row1 = math.floor(top / self._cellsize)
+        return [(col, row) for col in range(col0, col1 + 1)
+                for row in range(row0, row1 + 1)]
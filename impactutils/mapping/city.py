@@ -1,12 +1,18 @@
 #!/usr/bin/python
+import csv
 import numpy as np
 import zipfile
 import tempfile
 import sys
 import io
+import os
 import os.path
+from concurrent.futures import ProcessPoolExecutor
 
-from impactutils.extern.openquake.geodetic import geodetic_distance
+from impactutils.extern.openquake.geodetic import azimuth
+from impactutils.io.columncache import read_column_cache, write_column_cache
+from impactutils.mapping.cityindex import CityIndex
+from impactutils.mapping.nameindex import NameIndex
 import pandas as pd
 if sys.version_info.major == 3:
     import urllib.request as request
@@ -14,6 +20,18 @@ else:
     import urllib2 as request
 
 GEONAME_URL = 'http://download.geonames.org/export/dump/cities1000.zip'
+CAPFLAG1 = 'PPLC'
+CAPFLAG2 = 'PPLA'
+CACHE_EXT = '.cache'
+RANK_EXT = '.ranks'
+# finest level of detail, with grid cells of 90 / 2**MAX_LEVEL degrees
+MAX_LEVEL = 12
+# compact dtypes, see Cities.compact()
+COMPACT_STRINGS = ['name', 'ccode']
+COMPACT_FLOATS = ['lat', 'lon']
+COMPACT_BOOLS = ['iscap']
+# ways of matching names, see Cities.limitByName()
+NAME_MATCHES = ['regex', 'exact', 'prefix']
 
 
 def _fetchGeoNames():
@@ -34,13 +52,244 @@ def _fetchGeoNames():
     return os.path.join(fdir, 'cities1000.txt')
 
 
+def _readGeoNames(cityfile):
+    """
+    Internal method to parse a GeoNames cities1000.txt file.
+
+    Args:
+        cityfile: Path to cities1000.txt file from GeoNames.
+
+    Returns:
+        pandas DataFrame with columns name, ccode, lat, lon, iscap, pop.
+    """
+    # asciiname, latitude, longitude, feature code, country code, population
+    columns = {2: 'name', 4: 'lat', 5: 'lon', 7: 'fcode', 8: 'ccode',
+               14: 'pop'}
+    dtypes = {2: str, 4: np.float64, 5: np.float64, 7: str, 8: str,
+              14: np.int64}
+    df = pd.read_csv(cityfile, sep='\t', header=None, engine='c',
+                     usecols=list(columns), dtype=dtypes,
+                     quoting=csv.QUOTE_NONE, na_filter=False,
+                     encoding='latin-1')
+    df = df.rename(columns=columns)
+    names = df['name'].str.strip()
+    # skip cities without a name, or with non-ascii characters in the name
+    keep = (names != '') & ~names.str.contains('[^\x00-\x7f]')
+    df = df[keep.to_numpy()]
+    iscap = df['fcode'].str.strip().isin([CAPFLAG1, CAPFLAG2])
+    df = pd.DataFrame({'name': names[keep].to_numpy(),
+                       'ccode': df['ccode'].str.strip().to_numpy(),
+                       'lat': df['lat'].to_numpy(),
+                       'lon': df['lon'].to_numpy(),
+                       'iscap': iscap.to_numpy(),
+                       'pop': df['pop'].to_numpy()})
+    return df
+
+
+def _compactDataFrame(dataframe):
+    """
+    Internal method to convert city columns to compact dtypes.
+
+    Args:
+        dataframe: pandas DataFrame of cities.
+
+    Returns:
+        New pandas DataFrame, where the COMPACT_STRINGS columns are
+        categorical, the COMPACT_FLOATS columns are float32, the
+        COMPACT_BOOLS columns are bool (one byte per flag, not bit
+        packed), and the pop column is uint32 (if all populations are
+        integers that fit). Other columns are copied unchanged.
+    """
+    columns = {}
+    for column in dataframe.columns:
+        values = dataframe[column]
+        if column in COMPACT_STRINGS and values.dtype == object:
+            values = values.astype('category')
+        elif column in COMPACT_FLOATS and values.dtype.kind == 'f':
+            values = values.astype(np.float32)
+        elif column in COMPACT_BOOLS and values.dtype != bool:
+            if values.isin([True, False]).all():
+                values = values.astype(bool)
+        elif column == 'pop' and values.dtype.kind in 'iuf':
+            array = values.to_numpy()
+            fits = (np.isfinite(array).all() and
+                    (array >= 0).all() and
+                    (array <= np.iinfo(np.uint32).max).all() and
+                    (array == np.floor(array)).all())
+            if fits:
+                values = values.astype(np.uint32)
+        columns[column] = values.copy()
+    return pd.DataFrame(columns, index=dataframe.index)
+
+
+def _computeRanks(lons, lats, pop, maxlevel, cities_per_cell):
+    """
+    Internal method to compute level of detail ranks of cities.
+
+    At level L the globe is divided into grid cells of 90 / 2**L degrees,
+    aligned with (-90, -180), and the cities_per_cell most populous cities
+    in each cell are visible. Since the cells of each level are divided in
+    four at the next level, a city visible at one level is visible at all
+    finer levels.
+
+    Args:
+        lons: Array of city longitudes (dd).
+        lats: Array of city latitudes (dd).
+        pop: Array of city populations.
+        maxlevel: Finest level of detail, at most 254.
+        cities_per_cell: Number of cities visible in each grid cell.
+
+    Returns:
+        Array (uint8) of the coarsest level at which each city is visible,
+        maxlevel + 1 for cities that are not visible at any level (or that
+        have NaN coordinates).
+    """
+    ranks = np.full(len(lons), maxlevel + 1, dtype=np.uint8)
+    rows = np.nonzero(~(np.isnan(lons) | np.isnan(lats)))[0]
+    # most populous first, ties in the order of the cities
+    rows = rows[np.argsort(-pop[rows].astype(np.float64), kind='stable')]
+    lats = lats[rows].astype(np.float64)
+    lons = np.mod(lons[rows].astype(np.float64) + 180.0, 360.0)
+    for level in range(maxlevel + 1):
+        cellsize = 90.0 / 2**level
+        nrows = 2 * 2**level
+        row = np.clip(np.floor((lats + 90.0) / cellsize), 0, nrows - 1)
+        col = np.clip(np.floor(lons / cellsize), 0, 2 * nrows - 1)
+        cells = row.astype(np.int64) * 2 * nrows + col.astype(np.int64)
+        # position of each city in its cell, by decreasing population
+        within = pd.Series(cells).groupby(cells, sort=False).cumcount()
+        visible = rows[within.values < cities_per_cell]
+        ranks[visible] = np.minimum(ranks[visible], level)
+    return ranks
+
+
+def _checkColumns(dataframe, columns):
+    """
+    Internal method to check that columns are in a dataframe.
+
+    Args:
+        dataframe: pandas DataFrame.
+        columns: String name or list of names of columns.
+
+    Raises:
+        KeyError: When column(s) are not in the list of dataframe columns.
+    """
+    if isinstance(columns, str):
+        columns = [columns]
+    bad_columns = set(columns).difference(set(dataframe.columns))
+    if bad_columns:
+        raise KeyError('Column(s) not in list of DataFrame columns: %s' %
+                       str(bad_columns))
+
+
+def _checkNameMatch(match, ignore_accents):
+    """
+    Internal method to check the options of a name search.
+
+    Args:
+        match: How names are matched, must be one of NAME_MATCHES.
+        ignore_accents: Boolean indicating whether diacritics should be
+            ignored, not supported for regex matches.
+
+    Raises:
+        ValueError: When match is not one of NAME_MATCHES, or
+            ignore_accents is used with a regex match.
+    """
+    if match not in NAME_MATCHES:
+        raise ValueError('Unsupported name match %r, must be one of %s.' %
+                         (match, NAME_MATCHES))
+    if match == 'regex' and ignore_accents:
+        raise ValueError('Diacritics can not be ignored in regex matches.')
+
+
+def _findName(cities, positions, cityname, match, ignore_case,
+              ignore_accents):
+    """
+    Internal method to find the cities matching a name.
+
+    Args:
+        cities: Cities instance.
+        positions: Array of row positions of the cities to search, or None
+            to search all of the cities.
+        cityname: Input city name (or regular expression).
+        match: How cityname is matched, one of NAME_MATCHES.
+        ignore_case: Boolean indicating whether case should be ignored.
+        ignore_accents: Boolean indicating whether diacritics should be
+            ignored.
+
+    Raises:
+        ValueError: When match is not one of NAME_MATCHES, or
+            ignore_accents is used with a regex match.
+
+    Returns:
+        Array of the positions of the cities matching cityname, in the same
+        order as positions (or sorted, when positions is None).
+    """
+    _checkNameMatch(match, ignore_accents)
+    if match == 'regex':
+        if positions is None:
+            positions = np.arange(len(cities._dataframe))
+        names = cities._dataframe['name'].iloc[positions]
+        found = names.str.contains(cityname, case=not ignore_case, na=False)
+        return positions[found.to_numpy(dtype=bool)]
+    index = cities.getNameIndex(ignore_case=ignore_case,
+                                ignore_accents=ignore_accents)
+    if match == 'exact':
+        found = index.queryExact(cityname)
+    else:
+        found = index.queryPrefix(cityname)
+    if positions is None:
+        return found
+    mask = np.zeros(len(cities._dataframe), dtype=bool)
+    mask[found] = True
+    return positions[mask[positions]]
+
+
+def _gridOrder(lons, lats, pop, nx, ny, cities_per_grid):
+    """
+    Internal method to grid cities, then limit cities in each grid cell by
+    population. See Cities.limitByGrid().
+
+    Args:
+        lons: Array of city longitudes (dd).
+        lats: Array of city latitudes (dd).
+        pop: Array of city populations.
+        nx: Desired number of columns for grid.
+        ny: Desired number of rows for grid.
+        cities_per_grid: Maximum number of cities allowed per grid cell.
+
+    Returns:
+        Array of positions of the cities to keep, ordered by grid cell (by
+        row from the bottom left), then by decreasing population.
+    """
+    rows = np.nonzero(~(np.isnan(lons) | np.isnan(lats)))[0]
+    if not len(rows):
+        return rows
+    lons = lons[rows]
+    lats = lats[rows]
+    xmin = lons.min()
+    ymin = lats.min()
+    dx = (lons.max() - xmin) / nx
+    dy = (lats.max() - ymin) / ny
+    # a city is in column j when the j-th interior edge is the first
+    # one that is not less than its longitude, and likewise for rows
+    col = np.searchsorted(xmin + np.arange(1, nx) * dx, lons, side='left')
+    row = np.searchsorted(ymin + np.arange(1, ny) * dy, lats, side='left')
+    cells = row * nx + col
+    # by cell, then by decreasing population
+    order = np.lexsort((-pop[rows].astype(np.float64), cells))
+    keep = pd.Series(cells[order]).groupby(
+        cells[order], sort=False).cumcount() < cities_per_grid
+    return rows[order[keep.values]]
+
+
 class Cities(object):
     """
     Handles loading and searching for cities.
     """
     REQFIELDS = ['name', 'lat', 'lon']  # class variable
 
-    def __init__(self, dataframe):
+    def __init__(self, dataframe, copy=True):
         """Construct a Cities object from a pandas DataFrame.
         Args:
             dataframe: pandas DataFrame,  where each row represents a city.
@@ -57,6 +306,9 @@ class Cities(object):
                   (optional).
                 - yoff Latitude offset for label relative to city coordinates
                   (optional).
+            copy: Boolean indicating whether the dataframe should be
+                copied; pass False only for dataframes that are not used
+                elsewhere (i.e., freshly read from a file).
 
         Raises:
             KeyError: When any of required columns are missing.
@@ -67,7 +319,15 @@ class Cities(object):
         if len(set(dataframe.columns).intersection(set(self.REQFIELDS))) < 3:
             raise KeyError('Missing some of required keys: %s'
                            % self.REQFIELDS)
-        self._dataframe = dataframe.copy()
+        if copy:
+            dataframe = dataframe.copy()
+        self._dataframe = dataframe
+        # spatial index, built on first use
+        self._index = None
+        # name indexes, by (ignore_case, ignore_accents), built on first use
+        self._nameindexes = {}
+        # file the cities were read from, while the rows are unchanged
+        self._source = None
 
     # "magic" methods
     def __len__(self):
@@ -88,69 +348,76 @@ class Cities(object):
         return str(self._dataframe)
 
     @classmethod
-    def fromDefault(cls):
+    def fromDefault(cls, compact=False):
         """
         Load the cities data set from the text file included in the
         distribution for this module.
 
+        Args:
+            compact: Boolean indicating whether the cities should be stored
+                with compact dtypes, see compact().
+
         Returns:
             Cities instance.
         """
         # where is this file?
         homedir = os.path.dirname(os.path.abspath(__file__))
         cityfile = os.path.join(homedir, '..', 'data', 'cities1000.txt')
-        return cls.fromGeoNames(cityfile)
+        return cls.fromGeoNames(cityfile, compact=compact)
 
     @classmethod
-    def fromGeoNames(cls, cityfile=None):
+    def fromGeoNames(cls, cityfile=None, cache=True, compact=False):
         """
         Load a cities data set from a GeoNames cities1000.txt file or by
         downloading it from GeoNames, then loading it.
 
+        The parsed data set is cached in a binary file beside cityfile
+        (cityfile + CACHE_EXT), which is used instead of parsing cityfile
+        as long as cityfile has not changed (same path, modification time
+        and size). The cache is rebuilt when it is stale; if it cannot be
+        written (i.e., read-only directory) cityfile is simply parsed.
+
         Args:
             cityfile: Path to cities1000.txt file from GeoNames, or None (file
-                will be downloaded).
+                will be downloaded, and not cached).
+            cache: Boolean indicating whether the binary cache should be used.
+            compact: Boolean indicating whether the cities should be stored
+                with compact dtypes, see compact().
 
         Returns:
             Cities instance.
         """
-        CAPFLAG1 = 'PPLC'
-        CAPFLAG2 = 'PPLA'
         delete_folder = False
         if cityfile is None:
             cityfile = _fetchGeoNames()
             delete_folder = True
+            cache = False
 
-        mydict = {'name': [],
-                  'ccode': [],
-                  'lat': [],
-                  'lon': [],
-                  'iscap': [],
-                  'pop': []}
-        f = open(cityfile, 'rt', encoding='latin-1')
-        for line in f.readlines():
-            parts = line.split('\t')
-            tname = parts[2].strip()
-            if not tname:
-                continue
-            myvals = np.array([ord(c) for c in tname])
-            if len((myvals > 127).nonzero()[0]):
-                continue
-            mydict['name'].append(tname)
-            mydict['ccode'].append(parts[8].strip())
-            mydict['lat'].append(float(parts[4].strip()))
-            mydict['lon'].append(float(parts[5].strip()))
-            capfield = parts[7].strip()
-            iscap = (capfield == CAPFLAG1) or (capfield == CAPFLAG2)
-            mydict['iscap'].append(iscap)
-            mydict['pop'].append(int(parts[14].strip()))
-        f.close()
+        df = None
+        if cache:
+            cachefile = cityfile + CACHE_EXT
+            cached = read_column_cache(cachefile, cityfile)
+            if cached is not None:
+                df = cached[0]
+        if df is None:
+            df = _readGeoNames(cityfile)
+            if cache:
+                try:
+                    write_column_cache(cachefile, df, cityfile)
+                except OSError:
+                    pass
         if delete_folder:
             fdir, bname = os.path.split(cityfile)
             os.remove(cityfile)
             os.rmdir(fdir)
-        df = pd.DataFrame.from_dict(mydict)
-        return cls(df)
+        if compact:
+            df = _compactDataFrame(df)
+        # df was just read, so keep its (possibly memory mapped) columns
+        cities = cls(df, copy=False)
+        if cache:
+            # ranks can be cached beside cityfile, see addRanks()
+            cities._source = cityfile
+        return cities
 
     @classmethod
     def fromCSV(cls, csvfile):
@@ -174,6 +441,22 @@ class Cities(object):
         """
         return len(self._dataframe)
 
+    def compact(self):
+        """Return a copy of the cities with a compact memory representation.
+
+        Names and country codes are stored as categoricals (integer codes
+        into a table of unique strings), coordinates as float32 (about 1 m
+        precision), population as uint32 and capital flags as bool (one
+        byte per city, not bit packed, so that they can still be used as
+        pandas masks). All of the query methods work the same on compact
+        cities, but results at the edges of search areas can differ due to
+        the rounding of the coordinates.
+
+        Returns:
+            New Cities instance containing the same cities.
+        """
+        return type(self)(_compactDataFrame(self._dataframe))
+
     def save(self, filename):
         """Save City internal dataframe to CSV file.
 
@@ -199,16 +482,16 @@ class Cities(object):
         Raises:
             KeyError: When column(s) are not in the list of dataframe columns.
         """
-        bad_columns = set(columns).difference(set(self._dataframe.columns()))
-        if bad_columns:
-            raise KeyError('Column(s) not in list of DataFrame columns: %s' %
-                           str(bad_columns))
+        _checkColumns(self._dataframe, columns)
         if pd.__version__ < '0.17.0':
             self._dataframe = self._dataframe.sort(columns=columns,
                                                    ascending=ascending)
         else:
             self._dataframe = self._dataframe.sort_values(by=columns,
                                                           ascending=ascending)
+        self._index = None
+        self._nameindexes = {}
+        self._source = None
 
     def getColumns(self):
         """Return list of column names in internal data frame.
@@ -218,21 +501,64 @@ class Cities(object):
         """
         return list(self._dataframe.columns)
 
+    def getIndex(self):
+        """Return the spatial index of the cities, building it if needed.
+
+        Returns:
+            CityIndex instance for the lat/lon coordinates of the cities,
+            positions in the index are row positions in the internal
+            dataframe.
+        """
+        if self._index is None:
+            self._index = CityIndex(self._dataframe['lat'].values,
+                                    self._dataframe['lon'].values)
+        return self._index
+
+    def query(self):
+        """Start a lazy query on the cities.
+
+        Returns:
+            CityQuery instance selecting all of the cities, which can be
+            narrowed down with its limitBy* and sortByColumns methods.
+        """
+        return CityQuery(self)
+
+    def getNameIndex(self, ignore_case=False, ignore_accents=False):
+        """Return an index of the city names, building it if needed.
+
+        Args:
+            ignore_case: Boolean indicating whether lookups should be case
+                insensitive.
+            ignore_accents: Boolean indicating whether lookups should ignore
+                diacritics.
+
+        Returns:
+            NameIndex instance for the names of the cities, positions in the
+            index are row positions in the internal dataframe.
+        """
+        key = (ignore_case, ignore_accents)
+        if key not in self._nameindexes:
+            self._nameindexes[key] = NameIndex(
+                self._dataframe['name'].to_numpy(), ignore_case=ignore_case,
+                ignore_accents=ignore_accents)
+        return self._nameindexes[key]
+
     def limitByBounds(self, bounds):
         """Search for cities within a bounding box (xmin,xmax,ymin,ymax).
 
+        Cities on the minimum edges of the box are excluded, cities on the
+        maximum edges are included. If xmin is greater than xmax, the box
+        is taken to cross the antimeridian (i.e., (170, -170, ymin, ymax) is
+        a 20 degree wide box).
+
         Args:
             bounds: Sequence containing xmin,xmax,ymin,ymax (decimal degrees).
 
         Returns:
             New Cities instance containing smaller cities data set.
         """
-        # TODO: figure out what to do with a meridian crossing?
-        newdf = self._dataframe.copy()
-        xmin, xmax, ymin, ymax = bounds
-        newdf = newdf.loc[(newdf['lat'] > ymin) & (newdf['lat'] <= ymax) &
-                          (newdf['lon'] > xmin) & (newdf['lon'] <= xmax)]
-        return type(self)(newdf)
+        rows = self.getIndex().queryBounds(bounds)
+        return type(self)(self._dataframe.iloc[rows])
 
     def limitByRadius(self, lat, lon, radius):
         """Search for cities within a radius (km) around a central point.
@@ -245,15 +571,106 @@ class Cities(object):
         Returns:
             New Cities instance containing smaller cities data set.
         """
-        # TODO: figure out what to do with a meridian crossing?
-        newdf = self._dataframe.copy()
-        dist = geodetic_distance(lon, lat,
-                                 self._dataframe['lon'],
-                                 self._dataframe['lat'])
-        newdf['dist'] = dist
-        newdf = newdf[newdf['dist'] <= radius]
-        del newdf['dist']
-        return type(self)(newdf)
+        rows, _ = self.getIndex().queryRadius(lat, lon, radius)
+        return type(self)(self._dataframe.iloc[rows])
+
+    def limitByRadiusMany(self, lats, lons, radii, workers=1):
+        """Search for cities within a radius (km) of each of many points.
+
+        Unlike limitByRadius, no new Cities instances are made; the results
+        are row positions into the internal dataframe, so that (for
+        example) the cities around the i-th point are
+        cities.getDataFrame().iloc[result[i]].
+
+        Args:
+            lats: Array of central latitudes (dd).
+            lons: Array of central longitudes (dd).
+            radii: Radius (km), or array of radii, one for each point.
+            workers: Number of worker processes to split the points
+                between. None uses the number of CPUs, 1 searches in this
+                process.
+
+        Returns:
+            List with a sorted array of row positions of the cities within
+            the radius of each point.
+
+        Raises:
+            ValueError: When lats, lons and radii have different lengths, or
+                workers is less than one.
+        """
+        if workers is not None and workers < 1:
+            raise ValueError('workers must be at least one.')
+        index = self.getIndex()
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        if lats.shape != lons.shape:
+            raise ValueError('Latitude and longitude arrays must have the '
+                             'same length.')
+        radii = np.broadcast_to(np.asarray(radii, dtype=np.float64),
+                                lats.shape)
+        if workers == 1 or len(lats) < 2:
+            return index.queryRadiusMany(lats, lons, radii)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        chunks = np.array_split(np.arange(len(lats)),
+                                min(workers, len(lats)))
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(index.queryRadiusMany, lats[chunk],
+                                       lons[chunk], radii[chunk])
+                       for chunk in chunks]
+            for future in futures:
+                results += future.result()
+        return results
+
+    def nearest(self, lats, lons, k=1, minpop=None):
+        """Find the k nearest cities to each of a set of points.
+
+        Args:
+            lats: Latitude (dd) or array of latitudes of the points.
+            lons: Longitude (dd) or array of longitudes of the points.
+            k: Number of cities to find for each point.
+            minpop: Only consider cities with population greater than or
+                equal to minpop, or None to consider all cities.
+
+        Returns:
+            DataFrame with one row for each of the k nearest cities of each
+            point, ordered by point and then by distance, with columns:
+              - point: Position of the point in lats/lons.
+              - rank: 0 for the nearest city, 1 for the next, etc.
+              - All of the columns of the cities data frame.
+              - distance: Geodetic distance (km) from the point to the city.
+              - azimuth: Direction (degrees clockwise from north) from the
+                point to the city.
+            Points with NaN coordinates have no rows, and points have fewer
+            than k rows when there are fewer than k cities.
+
+        Raises:
+            KeyError: When minpop is given and the Cities instance does not
+                contain population data.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        if minpop is None:
+            rows = np.arange(len(self._dataframe))
+            index = self.getIndex()
+        else:
+            if 'pop' not in self._dataframe.columns:
+                raise KeyError('Cities instance does not contain population '
+                               'information')
+            rows = np.nonzero((self._dataframe['pop'] >= minpop).values)[0]
+            index = CityIndex(self._dataframe['lat'].values[rows],
+                              self._dataframe['lon'].values[rows])
+        positions, distances = index.queryNearest(lats, lons, k)
+        point, rank = np.nonzero(positions >= 0)
+        cityrows = rows[positions[point, rank]]
+        newdf = self._dataframe.iloc[cityrows].reset_index(drop=True)
+        newdf.insert(0, 'point', point)
+        newdf.insert(1, 'rank', rank)
+        newdf['distance'] = distances[point, rank]
+        newdf['azimuth'] = azimuth(lons[point], lats[point],
+                                   newdf['lon'].values, newdf['lat'].values)
+        return newdf
 
     def limitByPopulation(self, pop, minpop=0):
         """Search for cities above a certain population threshold.
@@ -284,64 +701,137 @@ class Cities(object):
         Create a smaller Cities dataset by gridding cities, then limiting
         cities in each grid by population.
 
+        The grid spans the extent of the cities. Grid cells include cities
+        on their maximum edges, and cities on the minimum edges of the grid
+        are included in the first row/column of cells.
+
         Args:
             nx: Desired number of columns for grid.
             ny: Desired number of rows for grid.
-            cities_per_cell: Maximum number of cities allowed per grid cell.
+            cities_per_grid: Maximum number of cities allowed per grid cell.
 
         Raises:
             KeyError: When Cities instance does not contain population data.
 
         Returns:
             New Cities instance containing cities limited by number in each
-            grid cell.
+            grid cell, ordered by grid cell (by row from the bottom left),
+            then by decreasing population.
         """
         if 'pop' not in self._dataframe.columns:
             raise KeyError('Cities instance does not contain population '
                            'information')
-        xmin = self._dataframe['lon'].min()
-        xmax = self._dataframe['lon'].max()
-        ymin = self._dataframe['lat'].min()
-        ymax = self._dataframe['lat'].max()
-        dx = (xmax - xmin) / nx
-        dy = (ymax - ymin) / ny
-        newdf = None
-        # start from the bottom left of our grid, and trim our cities.
-
-        for i in range(0, ny):
-            cellymin = ymin + (i * dy)
-            cellymax = cellymin + dy
-            for j in range(0, nx):
-                cellxmin = xmin + (j * dx)
-                cellxmax = cellxmin + dx
-                tcities = self.limitByBounds(
-                    (cellxmin, cellxmax, cellymin, cellymax))
-                # older versions of pandas use a different sort function
-                if pd.__version__ < '0.17.0':
-                    tdf = tcities._dataframe.sort(columns='pop',
-                                                  ascending=False)
-                else:
-                    tdf = tcities._dataframe.sort_values(by='pop',
-                                                         ascending=False)
-                tdf = tdf[0:cities_per_grid]
-                if newdf is None:
-                    newdf = tdf.copy()
-                else:
-                    newdf = newdf.append(tdf)
-        return type(self)(newdf)
+        order = _gridOrder(self._dataframe['lon'].values,
+                           self._dataframe['lat'].values,
+                           self._dataframe['pop'].values,
+                           nx, ny, cities_per_grid)
+        return type(self)(self._dataframe.iloc[order])
 
-    def limitByName(self, cityname):
+    def limitByName(self, cityname, match='regex', ignore_case=False,
+                    ignore_accents=False):
         """Find all cities that match a given cityname (or regular expression).
 
+        Exact and prefix matches use a name index (see getNameIndex()),
+        which is built the first time it is needed, and make later lookups
+        much faster than searching with a regular expression. Names are
+        compared after replacing runs of whitespace with single spaces.
+
         Args:
             cityname: Input city name (i.e., "Los Angeles").
+            match: How cityname is matched, one of NAME_MATCHES:
+                - regex: Names containing a match of the regular expression.
+                - exact: Names equal to cityname.
+                - prefix: Names starting with cityname.
+            ignore_case: Boolean indicating whether case should be ignored.
+            ignore_accents: Boolean indicating whether diacritics should be
+                ignored (i.e., "Zurich" matches "Zürich"). Not supported for
+                regex matches.
+
+        Raises:
+            ValueError: When match is not one of NAME_MATCHES, or
+                ignore_accents is used with a regex match.
 
         Returns:
             Cities instance containing cities with names that match the input
             name/regular expression.
         """
-        newdf = self._dataframe[self._dataframe.name.str.contains(cityname)]
-        return type(self)(newdf)
+        rows = _findName(self, None, cityname, match, ignore_case,
+                         ignore_accents)
+        return type(self)(self._dataframe.iloc[rows])
+
+    def addRanks(self, maxlevel=MAX_LEVEL, cities_per_cell=1):
+        """Add level of detail ranks of the cities, as the 'rank' column.
+
+        The rank of a city is the coarsest level of detail at which it is
+        visible: at level L the globe is divided into grid cells of
+        90 / 2**L degrees (aligned with -90, -180), and the cities_per_cell
+        most populous cities of each cell are visible. A city visible at
+        one level is visible at all finer levels, so the label candidates
+        for a map at level L are limitByRank(L). Cities not visible at
+        maxlevel have rank maxlevel + 1.
+
+        For cities read with fromGeoNames(), the ranks are cached in a
+        binary file beside the GeoNames file (cityfile + RANK_EXT), so they
+        are only computed once for each version of the file.
+
+        Args:
+            maxlevel: Finest level of detail, at most 254.
+            cities_per_cell: Number of cities visible in each grid cell.
+
+        Raises:
+            KeyError: When Cities instance does not contain population data.
+            ValueError: When maxlevel is not between 0 and 254, or
+                cities_per_cell is less than one.
+        """
+        if 'pop' not in self._dataframe.columns:
+            raise KeyError('Cities instance does not contain population '
+                           'information')
+        if not 0 <= maxlevel <= 254:
+            raise ValueError('maxlevel must be between 0 and 254.')
+        if cities_per_cell < 1:
+            raise ValueError('cities_per_cell must be at least one.')
+        # compact (float32) coordinates can fall in different cells
+        params = {'maxlevel': maxlevel,
+                  'cities_per_cell': cities_per_cell,
+                  'nrows': len(self._dataframe),
+                  'coordinates': self._dataframe['lat'].dtype.str}
+        ranks = None
+        if self._source is not None:
+            rankfile = self._source + RANK_EXT
+            cached = read_column_cache(rankfile, self._source, mmap=False)
+            if cached is not None and cached[1] == params:
+                ranks = cached[0]['rank'].to_numpy()
+        if ranks is None:
+            ranks = _computeRanks(self._dataframe['lon'].values,
+                                  self._dataframe['lat'].values,
+                                  self._dataframe['pop'].values,
+                                  maxlevel, cities_per_cell)
+            if self._source is not None:
+                try:
+                    write_column_cache(rankfile,
+                                       pd.DataFrame({'rank': ranks}),
+                                       self._source, extra=params)
+                except OSError:
+                    pass
+        self._dataframe['rank'] = ranks
+
+    def limitByRank(self, level):
+        """Search for cities visible at a level of detail.
+
+        Args:
+            level: Level of detail, see addRanks().
+
+        Raises:
+            KeyError: When Cities instance does not contain ranks (see
+                addRanks()).
+
+        Returns:
+            New Cities instance containing cities with rank <= level.
+        """
+        if 'rank' not in self._dataframe.columns:
+            raise KeyError('Cities instance does not contain rank '
+                           'information, see addRanks()')
+        return type(self)(self._dataframe[self._dataframe['rank'] <= level])
 
     def getDataFrame(self):
         """Return a copy of the internal pandas DataFrame containing city data.
@@ -370,9 +860,9 @@ class Cities(object):
         Returns:
             tuple of (lat, lon, names) where each is a numpy array.
         """
-        lat = self._dataframe['lat'].values
-        lon = self._dataframe['lon'].values
-        names = self._dataframe['name'].values
+        lat = self._dataframe['lat'].to_numpy()
+        lon = self._dataframe['lon'].to_numpy()
+        names = self._dataframe['name'].to_numpy()
         return (lat, lon, names)
 
     def project(self, mbasemap):
@@ -385,3 +875,369 @@ class Cities(object):
                         self._dataframe['lat'].values)
         self._dataframe['x'] = x
         self._dataframe['y'] = y
+
+
+class CityQuery(object):
+    """
+    Lazy, chainable query on a Cities instance.
+
+    The limitBy* and sortByColumns methods of a query mirror those of
+    Cities, but rather than copying the data for each step, they return a
+    new query with the step added. When the result is needed the steps are
+    run in order on an array of row positions into the data of the Cities
+    instance (using its spatial index), and only the final rows are
+    copied, i.e.:
+
+        query = cities.query().limitByBounds(bounds)
+        query = query.limitByPopulation(50000).limitByGrid(4, 4, 5)
+        subset = query.execute()
+
+    Queries made from the same Cities instance share its data. Changing
+    the rows of the instance (i.e., sorting it) after making a query
+    makes the query invalid.
+    """
+
+    def __init__(self, cities, steps=()):
+        """Construct a query selecting all of the cities.
+
+        Args:
+            cities: Cities instance.
+            steps: Tuple of (method name, arguments) steps to run.
+
+        Returns:
+            CityQuery instance.
+        """
+        self._cities = cities
+        self._dataframe = cities._dataframe
+        self._steps = steps
+        self._positions = None
+
+    def __len__(self):
+        """Return the number of cities selected by the query.
+
+        Returns:
+            Number of cities selected by the query.
+        """
+        return len(self.getPositions())
+
+    def _addStep(self, name, *args):
+        """Internal method to make a new query with another step.
+
+        Args:
+            name: Name of the method that runs the step.
+            args: Arguments to the method.
+
+        Returns:
+            New CityQuery instance.
+        """
+        query = CityQuery(self._cities, self._steps + ((name, args),))
+        query._dataframe = self._dataframe
+        return query
+
+    def limitByBounds(self, bounds):
+        """Add a search for cities within a bounding box (xmin,xmax,ymin,ymax).
+
+        See Cities.limitByBounds().
+
+        Args:
+            bounds: Sequence containing xmin,xmax,ymin,ymax (decimal degrees).
+
+        Returns:
+            New CityQuery instance.
+        """
+        return self._addStep('_runBounds', tuple(bounds))
+
+    def limitByRadius(self, lat, lon, radius):
+        """Add a search for cities within a radius (km) around a point.
+
+        Args:
+            lat: Central latitude coordinate (dd).
+            lon: Central longitude coordinate (dd).
+            radius: Radius (km) around which cities will be searched.
+
+        Returns:
+            New CityQuery instance.
+        """
+        return self._addStep('_runRadius', lat, lon, radius)
+
+    def limitByPopulation(self, pop, minpop=0):
+        """Add a search for cities above a certain population threshold.
+
+        Args:
+            pop: Population threshold.
+            minpop: Population above which cities should be included.
+
+        Raises:
+            KeyError: When Cities instance does not contain population data.
+            ValueError: When minpop >= pop.
+
+        Returns:
+            New CityQuery instance.
+        """
+        if 'pop' not in self._dataframe.columns:
+            raise KeyError('Cities instance does not contain population '
+                           'information')
+        if minpop >= pop:
+            raise ValueError('Minimum population must be less than '
+                             'population threshold.')
+        return self._addStep('_runPopulation', pop)
+
+    def limitByGrid(self, nx=2, ny=2, cities_per_grid=20):
+        """Add a step limiting the number of cities in each cell of a grid.
+
+        See Cities.limitByGrid(); the grid spans the extent of the cities
+        selected by the earlier steps.
+
+        Args:
+            nx: Desired number of columns for grid.
+            ny: Desired number of rows for grid.
+            cities_per_grid: Maximum number of cities allowed per grid cell.
+
+        Raises:
+            KeyError: When Cities instance does not contain population data.
+
+        Returns:
+            New CityQuery instance.
+        """
+        if 'pop' not in self._dataframe.columns:
+            raise KeyError('Cities instance does not contain population '
+                           'information')
+        return self._addStep('_runGrid', nx, ny, cities_per_grid)
+
+    def limitByName(self, cityname, match='regex', ignore_case=False,
+                    ignore_accents=False):
+        """Add a search for cities that match a cityname (or regular
+        expression).
+
+        See Cities.limitByName().
+
+        Args:
+            cityname: Input city name (i.e., "Los Angeles").
+            match: How cityname is matched, one of NAME_MATCHES.
+            ignore_case: Boolean indicating whether case should be ignored.
+            ignore_accents: Boolean indicating whether diacritics should be
+                ignored.
+
+        Raises:
+            ValueError: When match is not one of NAME_MATCHES, or
+                ignore_accents is used with a regex match.
+
+        Returns:
+            New CityQuery instance.
+        """
+        _checkNameMatch(match, ignore_accents)
+        return self._addStep('_runName', cityname, match, ignore_case,
+                             ignore_accents)
+
+    def limitByRank(self, level):
+        """Add a search for cities visible at a level of detail.
+
+        See Cities.limitByRank().
+
+        Args:
+            level: Level of detail.
+
+        Raises:
+            KeyError: When Cities instance does not contain ranks.
+
+        Returns:
+            New CityQuery instance.
+        """
+        if 'rank' not in self._dataframe.columns:
+            raise KeyError('Cities instance does not contain rank '
+                           'information, see addRanks()')
+        return self._addStep('_runRank', level)
+
+    def sortByColumns(self, columns, ascending=True):
+        """Add a step sorting the selected cities by column names.
+
+        Args:
+            columns: String name or list of names of columns.
+            ascending: Boolean indicating which direction values should be
+                sorted.
+
+        Raises:
+            KeyError: When column(s) are not in the list of dataframe columns.
+
+        Returns:
+            New CityQuery instance.
+        """
+        _checkColumns(self._dataframe, columns)
+        return self._addStep('_runSort', columns, ascending)
+
+    def getPositions(self):
+        """Run the query, and return the row positions of the cities.
+
+        Returns:
+            Array of row positions into the dataframe of the Cities instance
+            the query was made from.
+        """
+        if self._positions is None:
+            positions = np.arange(len(self._dataframe))
+            for name, args in self._steps:
+                positions = getattr(self, name)(positions, *args)
+            self._positions = positions
+        return self._positions
+
+    def getDataFrame(self):
+        """Run the query, and return a dataframe of the selected cities.
+
+        Returns:
+            pandas DataFrame with the rows of the selected cities.
+        """
+        return self._dataframe.iloc[self.getPositions()]
+
+    def getCities(self):
+        """Run the query, and return arrays of lat,lon,names of the cities.
+
+        Returns:
+            tuple of (lat, lon, names) where each is a numpy array.
+        """
+        df = self.getDataFrame()
+        lat = df['lat'].to_numpy()
+        lon = df['lon'].to_numpy()
+        names = df['name'].to_numpy()
+        return (lat, lon, names)
+
+    def execute(self):
+        """Run the query, and return the selected cities.
+
+        Returns:
+            New instance of the Cities class (or subclass) the query was
+            made from, containing the selected cities.
+        """
+        return type(self._cities)(self.getDataFrame())
+
+    def _getIndex(self):
+        """Internal method to get the spatial index of the cities.
+
+        Returns:
+            CityIndex instance for the rows of the query dataframe.
+        """
+        if self._cities._dataframe is self._dataframe:
+            return self._cities.getIndex()
+        return CityIndex(self._dataframe['lat'].values,
+                         self._dataframe['lon'].values)
+
+    def _keep(self, positions, found):
+        """Internal method to keep the positions in a set of found rows.
+
+        Args:
+            positions: Array of row positions.
+            found: Array of row positions found by a search.
+
+        Returns:
+            Array of the positions that are in found, in the same order.
+        """
+        mask = np.zeros(len(self._dataframe), dtype=bool)
+        mask[found] = True
+        return positions[mask[positions]]
+
+    def _runBounds(self, positions, bounds):
+        """Internal method to run a limitByBounds step.
+
+        Args:
+            positions: Array of row positions selected by earlier steps.
+            bounds: Sequence containing xmin,xmax,ymin,ymax (decimal degrees).
+
+        Returns:
+            Array of the positions of the cities in the bounds.
+        """
+        return self._keep(positions, self._getIndex().queryBounds(bounds))
+
+    def _runRadius(self, positions, lat, lon, radius):
+        """Internal method to run a limitByRadius step.
+
+        Args:
+            positions: Array of row positions selected by earlier steps.
+            lat: Central latitude coordinate (dd).
+            lon: Central longitude coordinate (dd).
+            radius: Radius (km) around which cities will be searched.
+
+        Returns:
+            Array of the positions of the cities within the radius.
+        """
+        found, _ = self._getIndex().queryRadius(lat, lon, radius)
+        return self._keep(positions, found)
+
+    def _runPopulation(self, positions, pop):
+        """Internal method to run a limitByPopulation step.
+
+        Args:
+            positions: Array of row positions selected by earlier steps.
+            pop: Population threshold.
+
+        Returns:
+            Array of the positions of the cities with population >= pop.
+        """
+        return positions[self._dataframe['pop'].values[positions] >= pop]
+
+    def _runRank(self, positions, level):
+        """Internal method to run a limitByRank step.
+
+        Args:
+            positions: Array of row positions selected by earlier steps.
+            level: Level of detail.
+
+        Returns:
+            Array of the positions of the cities with rank <= level.
+        """
+        return positions[self._dataframe['rank'].values[positions] <= level]
+
+    def _runGrid(self, positions, nx, ny, cities_per_grid):
+        """Internal method to run a limitByGrid step.
+
+        Args:
+            positions: Array of row positions selected by earlier steps.
+            nx: Desired number of columns for grid.
+            ny: Desired number of rows for grid.
+            cities_per_grid: Maximum number of cities allowed per grid cell.
+
+        Returns:
+            Array of the positions of the cities kept in each grid cell.
+        """
+        order = _gridOrder(self._dataframe['lon'].values[positions],
+                           self._dataframe['lat'].values[positions],
+                           self._dataframe['pop'].values[positions],
+                           nx, ny, cities_per_grid)
+        return positions[order]
+
+    def _runName(self, positions, cityname, match, ignore_case,
+                 ignore_accents):
+        """Internal method to run a limitByName step.
+
+        Args:
+            positions: Array of row positions selected by earlier steps.
+            cityname: Input city name (or regular expression).
+            match: How cityname is matched, one of NAME_MATCHES.
+            ignore_case: Boolean indicating whether case should be ignored.
+            ignore_accents: Boolean indicating whether diacritics should be
+                ignored.
+
+        Returns:
+            Array of the positions of the cities matching cityname.
+        """
+        cities = self._cities
+        if cities._dataframe is not self._dataframe:
+            cities = Cities(self._dataframe)
+        return _findName(cities, positions, cityname, match, ignore_case,
+                         ignore_accents)
+
+    def _runSort(self, positions, columns, ascending):
+        """Internal method to run a sortByColumns step.
+
+        Args:
+            positions: Array of row positions selected by earlier steps.
+            columns: String name or list of names of columns.
+            ascending: Boolean indicating which direction values should be
+                sorted.
+
+        Returns:
+            Array of the positions, sorted by the columns.
+        """
+        if isinstance(columns, str):
+            columns = [columns]
+        values = self._dataframe[columns].iloc[positions]
+        values = values.reset_index(drop=True)
+        order = values.sort_values(by=columns, ascending=ascending).index
+        return positions[order.values]
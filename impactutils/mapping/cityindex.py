@@ -0,0 +1,421 @@
+# stdlib imports
+import math
+
+# third party imports
+import numpy as np
+
+# local imports
+from impactutils.extern.openquake.geodetic import (geodetic_distance,
+                                                   EARTH_RADIUS)
+
+# maximum number of elements in the distance matrices of batched queries
+BLOCK_SIZE = 2**22
+
+
+class CityIndex(object):
+    """
+    Spatial index of city coordinates, for bounding box and radius queries.
+
+    Cities are put in buckets on a regular lat/lon grid (1 degree cells by
+    default), sorted by bucket, so that a query only looks at the cities in
+    the cells that overlap the query area, and then applies the exact test
+    to those candidates. Query results are positions (as used by
+    DataFrame.iloc) into the arrays the index was built from.
+    """
+
+    def __init__(self, lats, lons, cellsize=1.0):
+        """Build an index from arrays of coordinates.
+
+        Args:
+            lats: Array of latitudes (dd).
+            lons: Array of longitudes (dd).
+            cellsize: Size (dd) of grid cells, must divide 180 evenly.
+
+        Raises:
+            ValueError: When cellsize does not divide 180 evenly, or lats and
+                lons have different lengths.
+        """
+        nlat = 180.0 / cellsize
+        if nlat != int(nlat):
+            raise ValueError('Cell size must divide 180 degrees evenly.')
+        self._lats = np.asarray(lats, dtype=np.float64)
+        self._lons = np.asarray(lons, dtype=np.float64)
+        if self._lats.shape != self._lons.shape:
+            raise ValueError('Latitude and longitude arrays must have the '
+                             'same length.')
+        self._cellsize = cellsize
+        self._nlat = int(nlat)
+        self._nlon = 2 * self._nlat
+        cells = (self._getRows(self._lats) * self._nlon +
+                 self._getColumns(self._lons))
+        # a counting sort of the cities into cell order
+        counts = np.bincount(cells, minlength=self._nlat * self._nlon)
+        self._starts = np.concatenate([[0], np.cumsum(counts)])
+        self._order = np.argsort(cells, kind='stable')
+
+    def __len__(self):
+        """Return the number of indexed cities.
+
+        Returns:
+            Number of indexed cities.
+        """
+        return len(self._lats)
+
+    def queryBounds(self, bounds):
+        """Find the cities within a bounding box (xmin,xmax,ymin,ymax).
+
+        Cities are inside the box when ymin < lat <= ymax and
+        xmin < lon <= xmax, as in Cities.limitByBounds(). When xmin is
+        greater than xmax the box is taken to cross the antimeridian,
+        i.e., to contain the longitudes greater than xmin or less than or
+        equal to xmax.
+
+        Args:
+            bounds: Sequence containing xmin,xmax,ymin,ymax (decimal degrees).
+
+        Returns:
+            Sorted array of positions of cities in the box.
+        """
+        xmin, xmax, ymin, ymax = bounds
+        candidates = self._getCandidates(ymin, ymax, xmin, xmax)
+        lats = self._lats[candidates]
+        lons = self._lons[candidates]
+        inside = (lats > ymin) & (lats <= ymax)
+        if xmin > xmax:
+            inside &= (lons > xmin) | (lons <= xmax)
+        else:
+            inside &= (lons > xmin) & (lons <= xmax)
+        return candidates[inside]
+
+    def queryRadius(self, lat, lon, radius):
+        """Find the cities within a radius (km) around a central point.
+
+        Args:
+            lat: Central latitude coordinate (dd).
+            lon: Central longitude coordinate (dd).
+            radius: Radius (km) around which cities will be searched.
+
+        Returns:
+            Tuple of (positions, distances), sorted arrays of positions of
+            the cities within radius of the point and their distances (km).
+        """
+        candidates = self._getCandidates(*self._getRadiusWindow(lat, lon,
+                                                                radius))
+        dist = geodetic_distance(lon, lat, self._lons[candidates],
+                                 self._lats[candidates])
+        inside = dist <= radius
+        return (candidates[inside], dist[inside])
+
+    def queryRadiusMany(self, lats, lons, radii):
+        """Find the cities within a radius (km) of each of a set of points.
+
+        Points are grouped by the grid cell they fall in, and the distances
+        from each group to the cities in the cells within the largest radius
+        of the group are computed in blocks of at most BLOCK_SIZE distances.
+
+        Args:
+            lats: Array of latitudes (dd) of the points.
+            lons: Array of longitudes (dd) of the points.
+            radii: Radius (km), or array of radii, one for each point.
+
+        Returns:
+            List with a sorted array of positions of the cities within the
+            radius of each point. Points with NaN coordinates or radius have
+            no cities.
+
+        Raises:
+            ValueError: When lats, lons and radii have different lengths.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        if lats.shape != lons.shape:
+            raise ValueError('Latitude and longitude arrays must have the '
+                             'same length.')
+        try:
+            radii = np.broadcast_to(np.asarray(radii, dtype=np.float64),
+                                    lats.shape)
+        except ValueError:
+            raise ValueError('Radius array must have the same length as '
+                             'the coordinate arrays.')
+        empty = np.array([], dtype=np.int64)
+        results = [empty] * len(lats)
+        points = np.nonzero(np.isfinite(lats) & np.isfinite(lons) &
+                            np.isfinite(radii))[0]
+        if not len(self) or not len(points):
+            return results
+
+        cells = (self._getRows(lats[points]) * self._nlon +
+                 self._getColumns(lons[points]))
+        order = np.argsort(cells, kind='stable')
+        points = points[order]
+        cells = cells[order]
+        bounds = np.nonzero(np.diff(cells))[0] + 1
+        starts = np.concatenate([[0], bounds]).astype(np.int64)
+        for group, cell in zip(np.split(points, bounds), cells[starts]):
+            row, col = divmod(cell, self._nlon)
+            candidates = self._getCandidates(
+                *self._getCellWindow(row, col, radii[group].max()))
+            if not len(candidates):
+                continue
+            clons = self._lons[candidates][None, :]
+            clats = self._lats[candidates][None, :]
+            step = max(1, BLOCK_SIZE // len(candidates))
+            for start in range(0, len(group), step):
+                block = group[start:start + step]
+                dist = geodetic_distance(lons[block][:, None],
+                                         lats[block][:, None],
+                                         clons, clats)
+                inside = dist <= radii[block][:, None]
+                # positions of each row, split at the row boundaries
+                _, cols = np.nonzero(inside)
+                splits = np.cumsum(inside.sum(axis=1))[:-1]
+                for point, found in zip(block,
+                                        np.split(candidates[cols], splits)):
+                    results[point] = found
+        return results
+
+    def queryNearest(self, lats, lons, k):
+        """Find the k nearest cities to each of a set of points.
+
+        Points are grouped by the grid cell they fall in. For each group,
+        the distances to the cities in the cells within a search radius
+        are computed (in blocks of at most BLOCK_SIZE distances), and the
+        search radius is doubled for the points that do not yet have k
+        cities within it.
+
+        Args:
+            lats: Array of latitudes (dd) of the points.
+            lons: Array of longitudes (dd) of the points.
+            k: Number of cities to find for each point.
+
+        Returns:
+            Tuple of (positions, distances), arrays of shape (npoints, k)
+            with the positions of the k nearest cities of each point and
+            their distances (km), nearest first. When there are fewer than k
+            cities, or a point has NaN coordinates, missing positions are -1
+            and missing distances are NaN.
+
+        Raises:
+            ValueError: When k is less than one, or lats and lons have
+                different lengths.
+        """
+        if k < 1:
+            raise ValueError('k must be at least one.')
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        if lats.shape != lons.shape:
+            raise ValueError('Latitude and longitude arrays must have the '
+                             'same length.')
+        positions = np.full((len(lats), k), -1, dtype=np.int64)
+        distances = np.full((len(lats), k), np.nan)
+        nfound = min(k, len(self))
+        if not nfound:
+            return (positions, distances)
+
+        points = np.nonzero(np.isfinite(lats) & np.isfinite(lons))[0]
+        if not len(points):
+            return (positions, distances)
+        cells = (self._getRows(lats[points]) * self._nlon +
+                 self._getColumns(lons[points]))
+        order = np.argsort(cells, kind='stable')
+        points = points[order]
+        cells = cells[order]
+        bounds = np.nonzero(np.diff(cells))[0] + 1
+        # about the width of a cell (km)
+        radius0 = np.radians(self._cellsize) * EARTH_RADIUS
+        starts = np.concatenate([[0], bounds]).astype(np.int64)
+        for group, cell in zip(np.split(points, bounds), cells[starts]):
+            row, col = divmod(cell, self._nlon)
+            radius = radius0
+            while len(group):
+                candidates = self._getCandidates(
+                    *self._getCellWindow(row, col, radius))
+                if len(candidates) < nfound:
+                    radius *= 2
+                    continue
+                complete = len(candidates) == len(self)
+                clons = self._lons[candidates][None, :]
+                clats = self._lats[candidates][None, :]
+                done = []
+                step = max(1, BLOCK_SIZE // len(candidates))
+                for start in range(0, len(group), step):
+                    block = group[start:start + step]
+                    dist = geodetic_distance(lons[block][:, None],
+                                             lats[block][:, None],
+                                             clons, clats)
+                    if nfound < len(candidates):
+                        nearest = np.argpartition(dist, nfound - 1,
+                                                  axis=1)[:, :nfound]
+                    else:
+                        nearest = np.broadcast_to(
+                            np.arange(len(candidates)),
+                            (len(block), len(candidates)))
+                    ndist = np.take_along_axis(dist, nearest, axis=1)
+                    npos = candidates[nearest]
+                    # nearest first, ties broken by position
+                    sort = np.lexsort((npos, ndist), axis=-1)
+                    ndist = np.take_along_axis(ndist, sort, axis=1)
+                    npos = np.take_along_axis(npos, sort, axis=1)
+                    # cities beyond the search radius may be missing from
+                    # the candidates, so the result is final only if the
+                    # k-th nearest candidate is within the radius
+                    found = complete | (ndist[:, -1] <= radius)
+                    positions[block[found], :nfound] = npos[found]
+                    distances[block[found], :nfound] = ndist[found]
+                    done.append(found)
+                group = group[~np.concatenate(done)]
+                radius *= 2
+        return (positions, distances)
+
+    def _getCellWindow(self, row, col, radius):
+        """Internal method to get the lat/lon window around a grid cell.
+
+        Args:
+            row: Grid row of the cell.
+            col: Grid column of the cell.
+            radius: Radius (km).
+
+        Returns:
+            Tuple of (ymin, ymax, xmin, xmax) window (dd) that contains all
+            points within radius of any point in the cell.
+        """
+        lat0 = -90.0 + row * self._cellsize
+        lat1 = lat0 + self._cellsize
+        lon0 = -180.0 + col * self._cellsize
+        lon1 = lon0 + self._cellsize
+        delta = radius / EARTH_RADIUS + 1e-9
+        ymin = lat0 - np.degrees(delta)
+        ymax = lat1 + np.degrees(delta)
+        if ymin <= -90 or ymax >= 90 or delta >= np.pi / 2:
+            return (ymin, ymax, -180.0, 180.0)
+        # the longitude extent of a cap grows with latitude
+        maxlat = max(abs(lat0), abs(lat1))
+        ratio = np.sin(delta) / np.cos(np.radians(maxlat))
+        if ratio >= 1:
+            return (ymin, ymax, -180.0, 180.0)
+        dlon = np.degrees(np.arcsin(ratio))
+        return (ymin, ymax, lon0 - dlon, lon1 + dlon)
+
+    def _getRadiusWindow(self, lat, lon, radius):
+        """Internal method to get the lat/lon window around a circle.
+
+        Args:
+            lat: Central latitude coordinate (dd).
+            lon: Central longitude coordinate (dd).
+            radius: Radius (km).
+
+        Returns:
+            Tuple of (ymin, ymax, xmin, xmax) window (dd) that contains all
+            points within radius of the center, with xmin > xmax when the
+            window crosses the antimeridian.
+        """
+        # angular radius, with a little margin for rounding
+        delta = radius / EARTH_RADIUS + 1e-9
+        ymin = lat - np.degrees(delta)
+        ymax = lat + np.degrees(delta)
+        if ymin <= -90 or ymax >= 90 or delta >= np.pi / 2:
+            # the circle contains a pole
+            return (ymin, ymax, -180.0, 180.0)
+        # widest longitude extent of a spherical cap
+        ratio = np.sin(delta) / np.cos(np.radians(lat))
+        if ratio >= 1:
+            return (ymin, ymax, -180.0, 180.0)
+        dlon = np.degrees(np.arcsin(ratio))
+        return (ymin, ymax, lon - dlon, lon + dlon)
+
+    def _getRows(self, lats):
+        """Internal method to get the grid rows of latitudes.
+
+        Args:
+            lats: Array of latitudes (dd).
+
+        Returns:
+            Array of row indices.
+        """
+        rows = np.floor((np.asarray(lats) + 90.0) / self._cellsize)
+        rows = np.nan_to_num(rows, nan=0)
+        return np.clip(rows, 0, self._nlat - 1).astype(np.int64)
+
+    def _getColumns(self, lons):
+        """Internal method to get the grid columns of longitudes.
+
+        Longitudes are wrapped into the range -180 to 180.
+
+        Args:
+            lons: Array of longitudes (dd).
+
+        Returns:
+            Array of column indices.
+        """
+        lons = np.mod(np.asarray(lons) + 180.0, 360.0)
+        cols = np.nan_to_num(np.floor(lons / self._cellsize), nan=0)
+        return np.clip(cols, 0, self._nlon - 1).astype(np.int64)
+
+    def _getRow(self, lat):
+        """Internal method to get the grid row of a latitude.
+
+        Args:
+            lat: Latitude (dd), not NaN.
+
+        Returns:
+            Row index.
+        """
+        lat = min(max(lat, -90.0), 90.0)
+        row = math.floor((lat + 90.0) / self._cellsize)
+        return min(row, self._nlat - 1)
+
+    def _getColumn(self, lon):
+        """Internal method to get the grid column of a finite longitude.
+
+        Args:
+            lon: Longitude (dd).
+
+        Returns:
+            Column index.
+        """
+        col = math.floor(((lon + 180.0) % 360.0) / self._cellsize)
+        return min(col, self._nlon - 1)
+
+    def _getCandidates(self, ymin, ymax, xmin, xmax):
+        """Internal method to get the cities in the cells overlapping a box.
+
+        Args:
+            ymin: Minimum latitude (dd).
+            ymax: Maximum latitude (dd).
+            xmin: Minimum longitude (dd).
+            xmax: Maximum longitude (dd), less than xmin when the box
+                crosses the antimeridian.
+
+        Returns:
+            Sorted array of positions of the cities in the cells.
+        """
+        # bounds are python floats here, numpy is slow for scalars
+        if not len(self) or not ymin <= ymax:
+            return np.array([], dtype=np.int64)
+        row0 = self._getRow(ymin)
+        row1 = self._getRow(ymax)
+        all_columns = [(0, self._nlon - 1)]
+        if (not math.isfinite(xmin) or not math.isfinite(xmax) or
+                xmax - xmin >= 360):
+            col_ranges = all_columns
+        else:
+            col0 = self._getColumn(xmin)
+            col1 = self._getColumn(xmax)
+            # the columns wrap around when the box crosses the antimeridian,
+            # either as given (xmin > xmax) or after wrapping longitudes
+            if xmin <= xmax and col0 <= col1:
+                col_ranges = [(col0, col1)]
+            elif col0 <= col1:
+                col_ranges = all_columns
+            else:
+                col_ranges = [(col0, self._nlon - 1), (0, col1)]
+        parts = []
+        for row in range(row0, row1 + 1):
+            for col0, col1 in col_ranges:
+                start = self._starts[row * self._nlon + col0]
+                end = self._starts[row * self._nlon + col1 + 1]
+                if end > start:
+                    parts.append(self._order[start:end])
+        if not parts:
+            return np.array([], dtype=np.int64)
+        return np.sort(np.concatenate(parts))
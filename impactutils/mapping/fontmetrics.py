@@ -0,0 +1,288 @@
+# stdlib imports
+import functools
+import re
+
+# third party imports
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.font_manager import FontProperties, findfont, get_font
+try:
+    from matplotlib.backends.backend_agg import get_hinting_flag
+except ImportError:
+    get_hinting_flag = None
+
+# Matplotlib versions (major, minor), from first to last, whose Text layout
+# is reproduced from font metrics; labels are measured with Text artists
+# for other versions.
+LAYOUT_VERSIONS = ((3, 11), (3, 11))
+
+# fractions of text widths and heights between the text position and the
+# left and bottom edges of the text, for each alignment
+HORIZONTAL_ALIGNMENTS = {'left': 0.0, 'center': 0.5, 'right': 1.0}
+VERTICAL_ALIGNMENTS = {'bottom': 0.0, 'center': 0.5, 'top': 1.0}
+
+
+@functools.lru_cache(maxsize=64)
+def get_font_metrics(fontname, fontsize, dpi):
+    """Get the (cached) FontMetrics instance for a font, size and resolution.
+
+    Args:
+        fontname: Matplotlib font name (i.e., 'DejaVu Sans').
+        fontsize: Font size (points).
+        dpi: Figure resolution (dots per inch).
+
+    Returns:
+        FontMetrics instance.
+    """
+    return FontMetrics(fontname, fontsize, dpi)
+
+
+def is_layout_supported(version=None):
+    """Check whether FontMetrics reproduces the Text layout of Matplotlib.
+
+    Args:
+        version: Matplotlib version string, or None for the installed
+            version.
+
+    Returns:
+        True if the version is within LAYOUT_VERSIONS and the private
+        Matplotlib functions used to lay out text are available, False
+        otherwise.
+    """
+    if get_hinting_flag is None:
+        return False
+    if version is None:
+        version = matplotlib.__version__
+    match = re.match(r'(\d+)\.(\d+)', version)
+    if match is None:
+        return False
+    first, last = LAYOUT_VERSIONS
+    return first <= tuple(int(part) for part in match.groups()) <= last
+
+
+class FontMetrics(object):
+    """
+    Measures the extents of single line text labels from font metrics,
+    without creating or rendering Matplotlib Text artists.
+
+    The size of a text is computed from the advances and bounding boxes of
+    its glyphs, and the kerning of each pair of glyphs, which are measured
+    once with the font (as the Agg backend does) and cached. Text heights
+    follow the layout of Matplotlib Text, which makes the ascent and
+    descent of a line at least those of the font. Texts with ligatures are
+    measured by laying out the whole text with the font, as are all texts
+    if the glyph measurements do not reproduce the layout of the font (as
+    checked with CALIBRATION_TEXTS). Mathtext (text between dollar signs)
+    is measured as plain text.
+
+    This reproduces the Text layout of the Matplotlib versions in
+    LAYOUT_VERSIONS. With other versions, texts are measured by creating
+    Text artists and getting their window extents, which is much slower.
+    """
+    CALIBRATION_TEXTS = ['d', 'Yj', 'AVAT Ly', 'jIjjcbL', 'MVv1k']
+
+    def __init__(self, fontname, fontsize, dpi):
+        """Load the font metrics for a font, size and resolution.
+
+        Args:
+            fontname: Matplotlib font name (i.e., 'DejaVu Sans').
+            fontsize: Font size (points, or a Matplotlib size name such as
+                'large').
+            dpi: Figure resolution (dots per inch).
+        """
+        self._props = FontProperties(family=fontname, size=fontsize)
+        self._fontfile = findfont(self._props)
+        self._fontsize = self._props.get_size_in_points()
+        self._dpi = dpi
+        self._sizes = {}
+        # glyph advance and bounding box, by character
+        self._glyphs = {}
+        # kerning (None for ligatures), by pair of characters
+        self._pairs = {}
+
+        self._use_glyphs = False
+        # figure used to measure Text artists, when the layout is not
+        # reproduced
+        self._figure = None
+        if not is_layout_supported():
+            self._figure = Figure(dpi=dpi)
+            FigureCanvasAgg(self._figure)
+            return
+
+        font = get_font(self._fontfile)
+        self._min_ascent = None
+        self._min_descent = None
+        # same tables, in the same order, as Matplotlib Text
+        possible = [('OS/2', 'sTypoAscender', 'sTypoDescender'),
+                    ('hhea', 'ascent', 'descent')]
+        for table_name, ascent_key, descent_key in possible:
+            table = font.get_sfnt_table(table_name)
+            if table is None:
+                continue
+            units_per_em = font.get_sfnt_table('head')['unitsPerEm']
+            scale = self._fontsize * dpi / 72 / units_per_em
+            self._min_ascent = table[ascent_key] * scale
+            self._min_descent = -table[descent_key] * scale
+            break
+        if self._min_ascent is None:
+            _, height, self._min_descent = self._measure('lp')
+            self._min_ascent = height - self._min_descent
+
+        self._use_glyphs = True
+        for text in self.CALIBRATION_TEXTS:
+            if self._layoutGlyphs(text) != self._layoutText(text):
+                self._use_glyphs = False
+                break
+
+    def getTextSize(self, text):
+        """Get the size of a text label.
+
+        Args:
+            text: Single line of text.
+
+        Returns:
+            Tuple of (width, height) of the text, in pixels.
+        """
+        if text not in self._sizes:
+            if not text:
+                # as Matplotlib Text, empty texts have no extent
+                self._sizes[text] = (0.0, 0.0)
+            elif self._figure is not None:
+                self._sizes[text] = self._measureArtist(text)
+            else:
+                width, height, descent = self._measure(text)
+                ascent = max(height - descent, self._min_ascent)
+                descent = max(descent, self._min_descent)
+                self._sizes[text] = (width, ascent + descent)
+        return self._sizes[text]
+
+    def getTextExtent(self, text, x, y, ha='left', va='center'):
+        """Get the extent of a text label drawn at a point.
+
+        Args:
+            text: Single line of text.
+            x: X coordinate (pixels) of the text position.
+            y: Y coordinate (pixels) of the text position.
+            ha: Horizontal alignment of the text, one of
+                HORIZONTAL_ALIGNMENTS.
+            va: Vertical alignment of the text, one of VERTICAL_ALIGNMENTS.
+
+        Returns:
+            Tuple of left, right, bottom and top edges (pixels) of the text.
+
+        Raises:
+            ValueError: When ha or va are not supported.
+        """
+        if ha not in HORIZONTAL_ALIGNMENTS:
+            raise ValueError('Unsupported horizontal alignment %r.' % ha)
+        if va not in VERTICAL_ALIGNMENTS:
+            raise ValueError('Unsupported vertical alignment %r.' % va)
+        width, height = self.getTextSize(text)
+        left = x - width * HORIZONTAL_ALIGNMENTS[ha]
+        bottom = y - height * VERTICAL_ALIGNMENTS[va]
+        return (left, left + width, bottom, bottom + height)
+
+    def _measure(self, text):
+        """Internal method to measure text.
+
+        Args:
+            text: Single line of text.
+
+        Returns:
+            Tuple of (width, height, descent) of the text, in pixels.
+        """
+        if self._use_glyphs:
+            size = self._layoutGlyphs(text)
+            if size is not None:
+                return size
+        return self._layoutText(text)
+
+    def _measureArtist(self, text):
+        """Internal method to measure text by rendering a Text artist.
+
+        Args:
+            text: Single line of text.
+
+        Returns:
+            Tuple of (width, height) of the text, in pixels.
+        """
+        th = self._figure.text(0, 0, text, fontproperties=self._props,
+                               ha='left', va='bottom')
+        bbox = th.get_window_extent(self._figure.canvas.get_renderer())
+        th.remove()
+        return (bbox.width, bbox.height)
+
+    def _getFont(self):
+        """Internal method to get the font, set to the size and resolution.
+
+        Returns:
+            FT2Font instance.
+        """
+        font = get_font(self._fontfile)
+        font.clear()
+        font.set_size(self._fontsize, self._dpi)
+        return font
+
+    def _layoutText(self, text):
+        """Internal method to measure text by laying it out with the font.
+
+        Args:
+            text: Single line of text.
+
+        Returns:
+            Tuple of (width, height, descent) of the text, in pixels.
+        """
+        font = self._getFont()
+        font.set_text(text, 0.0, flags=get_hinting_flag())
+        width, height = font.get_width_height()
+        descent = font.get_descent()
+        return (width / 64.0, height / 64.0, descent / 64.0)
+
+    def _layoutGlyphs(self, text):
+        """Internal method to measure text from glyph measurements.
+
+        Args:
+            text: Single line of text.
+
+        Returns:
+            Tuple of (width, height, descent) of the text, in pixels, or
+            None if the text has ligatures or characters not in the font.
+        """
+        pen = 0
+        ymin = 32000
+        ymax = -32000
+        previous = None
+        for char in text:
+            if char not in self._glyphs:
+                font = self._getFont()
+                if not font.get_char_index(ord(char)):
+                    self._glyphs[char] = None
+                else:
+                    glyph = font.load_char(ord(char),
+                                           flags=get_hinting_flag())
+                    self._glyphs[char] = (glyph.horiAdvance, glyph.bbox)
+            if self._glyphs[char] is None:
+                return None
+            advance, bbox = self._glyphs[char]
+            if previous is not None:
+                pair = previous + char
+                if pair not in self._pairs:
+                    font = self._getFont()
+                    positions = font.set_text(pair, 0.0,
+                                              flags=get_hinting_flag())
+                    if len(positions) != 2:
+                        self._pairs[pair] = None
+                    else:
+                        self._pairs[pair] = (positions[1][0] -
+                                             self._glyphs[previous][0])
+                if self._pairs[pair] is None:
+                    return None
+                pen += self._pairs[pair]
+            ymin = min(ymin, bbox[1])
+            ymax = max(ymax, bbox[3])
+            pen += advance
+            previous = char
+        if not text:
+            return (0.0, 0.0, 0.0)
+        return (pen / 64.0, (ymax - ymin) / 64.0, -ymin / 64.0)
@@ -12,7 +12,7 @@ class MapCities(Cities):
 
     """
 
-    def __init__(self, dataframe):
+    def __init__(self, dataframe, copy=True):
         """Construct a MapCities object from a pandas DataFrame.
 
         Args:
@@ -30,6 +30,9 @@ class MapCities(Cities):
                   (optional).
                 - yoff Latitude offset for label relative to city coordinates
                   (optional).
+            copy: Boolean indicating whether the dataframe should be
+                copied; pass False only for dataframes that are not used
+                elsewhere (i.e., freshly read from a file).
 
         Raises:
             KeyError: When any of required columns are missing.
@@ -45,7 +48,15 @@ class MapCities(Cities):
         if len(set(dataframe.columns).intersection(set(self.REQFIELDS))) < 3:
             raise KeyError('Missing some of required keys: %s'
                            % self.REQFIELDS)
-        self._dataframe = dataframe.copy()
+        if copy:
+            dataframe = dataframe.copy()
+        self._dataframe = dataframe
+        # spatial index, built on first use
+        self._index = None
+        # name indexes, by (ignore_case, ignore_accents), built on first use
+        self._nameindexes = {}
+        # file the cities were read from, while the rows are unchanged
+        self._source = None
 
         self._fontlist = [f.name for f in fm.fontManager.ttflist]
         self._fontlist.sort()
@@ -1,10 +1,14 @@
 # local imports
+from .boxindex import BoxIndex
 from .city import Cities
+from .fontmetrics import (get_font_metrics, HORIZONTAL_ALIGNMENTS,
+                          VERTICAL_ALIGNMENTS)
 
 # third party imports
 import matplotlib.font_manager as fm
 import matplotlib.patheffects as path_effects
 import matplotlib.pyplot as plt
+from matplotlib.transforms import BboxTransform
 import numpy as np
 import pyproj
 import cartopy.crs as ccrs
@@ -13,6 +17,23 @@ import matplotlib
 matplotlib.use('Agg')
 
 XOFFSET = 4  # how many pixels between the city dot and the city text
+# horizontal and vertical alignment of labels, and directions of their
+# XOFFSET pixel offsets from the city, for each placement
+PLACEMENTS = {'E': ('left', 'center', 1, 0),
+              'W': ('right', 'center', -1, 0),
+              'N': ('center', 'bottom', 0, 1),
+              'S': ('center', 'top', 0, -1),
+              'NE': ('left', 'bottom', 1, 1),
+              'SE': ('left', 'top', 1, -1),
+              'SW': ('right', 'top', -1, -1),
+              'NW': ('right', 'bottom', -1, 1)}
+# placement of labels of cities without a placement
+DEFAULT_PLACEMENT = 'E'
+# placements tried, in order, when labeling cities without a placement
+PLACEMENT_ORDER = ['E', 'W', 'NE', 'SE', 'NW', 'SW', 'N', 'S']
+# maximum number of candidate cities in each quarter of the map; can be
+# raised (through drawCities) for denser maps
+CITIES_PER_GRID = 15
 
 
 class MercatorMap(object):
@@ -84,25 +105,19 @@ class MercatorMap(object):
         #                                        globe=None)
         self._geoproj = ccrs.PlateCarree()
 
+        # projection used to place city labels
+        self._pproj = pyproj.Proj(self._proj.proj4_init)
+
         # set up an axes object
         self._figure = plt.figure(figsize=figsize)
         self._ax = self._figure.add_axes(dimensions, projection=self._proj)
         try:
             self._ax.set_extent([xmin, xmax, ymin, ymax], crs=self._geoproj)
         except Exception:
-            pproj = pyproj.Proj(self._proj.proj4_init)
-            ulx, uly = pproj(xmin, ymax)
-            lrx, lry = pproj(xmax, ymin)
+            ulx, uly = self._pproj(xmin, ymax)
+            lrx, lry = self._pproj(xmax, ymin)
             self._ax.set_extent([ulx, lrx, lry, uly], crs=self._proj)
 
-        # set up an identical axes object - this will be used to determine city
-        # label collisions.
-        self._figure_clone = plt.figure(figsize=figsize)
-        self._ax_clone = self._figure_clone.add_axes([0, 0, 1, 1],
-                                                     projection=self._proj)
-        self._ax_clone.set_extent([xmin, xmax, ymin, ymax],
-                                  crs=self._geoproj)
-
         # establish list of supported fonts
         self._fontlist = [f.name for f in fm.fontManager.ttflist]
         self._fontlist.sort()
@@ -151,30 +166,6 @@ class MercatorMap(object):
         """
         return self._geoproj
 
-    def getFigureClone(self):
-        """
-        Return the second "hidden" figure object, which is used for determining
-        city label collisions.
-
-        Probably only useful for debugging.
-
-        Returns:
-            Matplotlib Figure instance.
-        """
-        return self._figure_clone
-
-    def getAxesClone(self):
-        """
-        Return the second "hidden" GeoAxes object, which is used for
-        determining city label collisions.
-
-        Probably only useful for debugging.
-
-        Returns:
-            Cartopy GeoAxes instance.
-        """
-        return self._axes_clone
-
     def getFonts(self):
         """Get list of supported fonts.
 
@@ -186,7 +177,8 @@ class MercatorMap(object):
     def drawCities(self, fontname='DejaVu Sans',
                    fontsize=10.0, shadow=False,
                    draw_dots=False,
-                   zorder=10):
+                   zorder=10, cities_per_grid=CITIES_PER_GRID,
+                   placements=PLACEMENT_ORDER):
         """Render cities on map axes (obtainable through the axes property).
 
         Args:
@@ -197,23 +189,36 @@ class MercatorMap(object):
             draw_dots: Boolean indicating whether city locations should
                 be marked with a black dot.
             zorder: Desired plotting z-order for city labels and dots.
+            cities_per_grid: Maximum number of candidate cities, by
+                decreasing population, in each quarter (2x2 grid cell) of
+                the map.
+            placements: Sequence of label placements (keys of PLACEMENTS,
+                i.e., 'E' or 'NW') tried, in order, for cities that do not
+                have a placement.
 
         Returns:
             Cities() instance containing all cities that were rendered on the
-            map.
+            map, with the projected coordinates (x and y columns) of the
+            cities, and the placement (placement column), position (xoff
+            and yoff columns) and edges (left, right, bottom and top
+            columns) of their labels.
 
         Raises:
             KeyError: When font name is not one of the supported Matplotlib
                 font names.
+            ValueError: When placements is empty or contains unsupported
+                placements.
         """
-        # set the active axes to be the clone
-        plt.sca(self._ax_clone)
         # cut down on the number of cities we can draw from
-        self._cities = self._cities.limitByGrid(nx=2, ny=2, cities_per_grid=15)
+        self._cities = self._cities.limitByGrid(
+            nx=2, ny=2, cities_per_grid=cities_per_grid)
+        # project all of the candidate cities at once
+        self._cities = Cities(self.projectCities(self._cities._dataframe))
         # pare down cities by removing small cities that collide with larger
         # ones.
         if len(self._cities):
-            self.limitByMapCollision(fontname, fontsize, shadow, zorder)
+            self.limitByMapCollision(fontname, fontsize, shadow, zorder,
+                                     placements=placements)
         # set the active axes to be the "real" axes object that we want to
         # draw on
         plt.sca(self._ax)
@@ -221,71 +226,121 @@ class MercatorMap(object):
             if draw_dots:
                 self._ax.plot(row['lon'], row['lat'], 'k.',
                               transform=self._geoproj, zorder=zorder)
-            _ = self.renderRow(row, fontname, fontsize, shadow, zorder,
-                               test=False)
+            _ = self.renderRow(row, fontname, fontsize, shadow, zorder)
 
         return Cities(self._cities._dataframe)
 
-    def limitByMapCollision(self, fontname, fontsize, shadow, zorder):
+    def limitByMapCollision(self, fontname, fontsize, shadow, zorder,
+                            placements=[DEFAULT_PLACEMENT]):
         """
         Limit cities found on map by removing smaller cities that collide with
         larger ones.
 
+        Cities are labeled by decreasing population. The label of each city
+        is put at the first of its candidate placements where it is entirely
+        on the map and does not intersect the label of any larger city that
+        was kept, and the city is removed when there is no such placement.
+        The largest city is always kept. The candidate placements of a city
+        are its own placement (placement column), if it has one, or else
+        placements.
+
+        The placement of the label of each city that is kept is recorded in
+        the placement column, the longitude and latitude offsets of the label
+        position from the city in the xoff and yoff columns, and the edges of
+        the bounding box of the label in the left, right, bottom and top
+        columns.
+
         Args:
             fontname: Desired font name for city labels.
             fontsize: Desired font size for city labels.
             shadow: Boolean indicating whether drop-shadow effect should be
                 applied.
             zorder: Desired plotting z-order for city labels and dots.
+            placements: Sequence of label placements (keys of PLACEMENTS,
+                i.e., 'E' or 'NW') tried, in order, for cities that do not
+                have a placement.
 
         Raises:
             KeyError: When font name is not one of the supported Matplotlib
                 font names.
+            ValueError: When placements is empty or contains unsupported
+                placements.
         """
+        if not len(placements):
+            raise ValueError('At least one label placement is required.')
+        for placement in placements:
+            if placement not in PLACEMENTS:
+                raise ValueError('Unsupported label placement %r, must be '
+                                 'one of %s.' % (placement,
+                                                 list(PLACEMENTS.keys())))
+
         # make a copy of the internal dataframe
         newdf = self._cities._dataframe.copy()
 
         # sort that copy by descending population
         newdf = newdf.sort_values(by='pop', ascending=False)
 
-        # get the bounding boxes of all cities as drawn on the map
-        lefts, rights, bottoms, tops = self.getCityBoundingBoxes(
-            newdf, fontname, fontsize, shadow, zorder)
-
-        # remove those cities that were off the map
-        ikeep = ~np.isnan(lefts)
-
-        # create new dataframe with cities that are on the map
-        newdf = newdf.iloc[ikeep]
-        lefts = lefts[ikeep]
-        rights = rights[ikeep]
-        bottoms = bottoms[ikeep]
-        tops = tops[ikeep]
-        ikeep = [0]  # indices of non-overlapping cities in dataframe
-        for i in range(1, len(tops)):
-            # what is this cities name?
-            # Seems like an unused variable...
-            # cname = newdf.iloc[i]['name']
-
-            # what is the bounding box of this city
-            left = lefts[i]
-            right = rights[i]
-            bottom = bottoms[i]
-            top = tops[i]
-
-            # does this bounding box insersect with any larger city's
-            # bounding box?
-            clrx = (left > rights[0:i]) | (right < lefts[0:i])
-            clry = (top < bottoms[0:i]) | (bottom > tops[0:i])
-            allclr = (clrx | clry)
-            if all(allclr):
-                ikeep.append(i)
-
-        newdf = newdf.iloc[ikeep]
-        newdf['top'] = tops[ikeep]
-        newdf['bottom'] = bottoms[ikeep]
-        newdf['left'] = lefts[ikeep]
-        newdf['right'] = rights[ikeep]
+        # candidate placements of each city
+        choices = [placements if placement is None else [placement]
+                   for placement in self._getPlacements(newdf, None)]
+
+        # get the bounding boxes of the labels of all cities at each of the
+        # candidate placements, as drawn on the map, with a flag indicating
+        # whether each box is entirely on the map.
+        axmin, axmax, aymin, aymax = self._ax.get_extent()
+        frame = self._getMeasureFrame()
+        sizes = self._getLabelSizes(newdf['name'], fontname, fontsize)
+        boxes = {}
+        for placement in set(p for choice in choices for p in choice):
+            edges = self._getPlacementEdges(newdf, placement, frame, sizes)
+            lefts, rights, bottoms, tops = edges
+            onmap = ((lefts >= axmin) & (rights <= axmax) &
+                     (bottoms >= aymin) & (tops <= aymax))
+            boxes[placement] = list(zip(lefts.tolist(), rights.tolist(),
+                                        bottoms.tolist(), tops.tolist(),
+                                        onmap.tolist()))
+
+        # place the labels, looking only at the boxes of nearby labels
+        allboxes = [box for placement_boxes in boxes.values()
+                    for box in placement_boxes]
+        widths = [box[1] - box[0] for box in allboxes]
+        heights = [box[3] - box[2] for box in allboxes]
+        index = BoxIndex(max(np.median(widths), np.median(heights)))
+        ikeep = []  # indices of non-overlapping cities in dataframe
+        chosen = []  # placements of the labels of those cities
+        for i in range(len(newdf)):
+            for placement in choices[i]:
+                left, right, bottom, top, onmap = boxes[placement][i]
+                if onmap and not index.hasOverlap(left, right, bottom, top):
+                    break
+            else:
+                if i:
+                    continue
+                # the largest city is always kept
+                placement = choices[i][0]
+            ikeep.append(i)
+            chosen.append(placement)
+            index.addBox(*boxes[placement][i][:4])
+
+        newdf = newdf.iloc[ikeep].copy()
+        edges = np.array([boxes[placement][i][:4]
+                          for placement, i in zip(chosen, ikeep)])
+        newdf['top'] = edges[:, 3]
+        newdf['bottom'] = edges[:, 2]
+        newdf['left'] = edges[:, 0]
+        newdf['right'] = edges[:, 1]
+        newdf['placement'] = chosen
+
+        # record the label positions, as drawn on the user's axes
+        xoffset, yoffset = self._getLabelOffsets((self._ax.viewLim,
+                                                  self._ax.bbox))
+        x, y = self._getCityCoordinates(newdf)
+        xsigns = np.array([PLACEMENTS[p][2] for p in chosen])
+        ysigns = np.array([PLACEMENTS[p][3] for p in chosen])
+        lons, lats = self._pproj(x + xsigns * xoffset, y + ysigns * yoffset,
+                                 inverse=True)
+        newdf['xoff'] = (lons - newdf['lon'].values + 180) % 360 - 180
+        newdf['yoff'] = lats - newdf['lat'].values
         self._cities = Cities(newdf)
 
     def getCityBoundingBoxes(self, df, fontname, fontsize, shadow, zorder):
@@ -301,38 +356,36 @@ class MercatorMap(object):
 
         Returns:
             Tuple of numpy arrays of left,right,bottom and top edges of each
-            city's bounding box.
+            city's bounding box, at the city's placement (placement column,
+            DEFAULT_PLACEMENT when missing).
         """
 
         # get the extent of the map
-        axmin, axmax, aymin, aymax = self._ax_clone.get_extent()
-
-        # make arrays of the edges of all the bounding boxes
-        tops = np.ones(len(df)) * np.nan
-        bottoms = np.ones(len(df)) * np.nan
-        lefts = np.ones(len(df)) * np.nan
-        rights = np.ones(len(df)) * np.nan
-
-        # get the extent of the first city
-        left, right, bottom, top = self.getCityEdges(
-            df.iloc[0], fontname, fontsize, shadow, zorder)
-        lefts[0] = left
-        rights[0] = right
-        bottoms[0] = bottom
-        tops[0] = top
-
-        # loop over all the cities and get their extents on the map
-        for i in range(1, len(df)):
-            row = df.iloc[i]
-            left, right, bottom, top = self.getCityEdges(
-                row, fontname, fontsize, shadow, zorder)
-            # remove cities that have any portion off the map
-            if left < axmin or right > axmax or bottom < aymin or top > aymax:
-                continue
-            lefts[i] = left
-            rights[i] = right
-            bottoms[i] = bottom
-            tops[i] = top
+        axmin, axmax, aymin, aymax = self._ax.get_extent()
+        frame = self._getMeasureFrame()
+
+        # get the extents of all the cities on the map, at their placements
+        lefts = np.full(len(df), np.nan)
+        rights = np.full(len(df), np.nan)
+        bottoms = np.full(len(df), np.nan)
+        tops = np.full(len(df), np.nan)
+        widths, heights = self._getLabelSizes(df['name'], fontname, fontsize)
+        placements = np.array(self._getPlacements(df, DEFAULT_PLACEMENT))
+        for placement in set(placements):
+            rows = np.nonzero(placements == placement)[0]
+            edges = self._getPlacementEdges(df.iloc[rows], placement, frame,
+                                            (widths[rows], heights[rows]))
+            lefts[rows], rights[rows], bottoms[rows], tops[rows] = edges
+
+        # remove cities that have any portion off the map (but never the
+        # first city)
+        offmap = ((lefts < axmin) | (rights > axmax) |
+                  (bottoms < aymin) | (tops > aymax))
+        offmap[:1] = False
+        lefts[offmap] = np.nan
+        rights[offmap] = np.nan
+        bottoms[offmap] = np.nan
+        tops[offmap] = np.nan
 
         return (lefts, rights, bottoms, tops)
 
@@ -349,22 +402,38 @@ class MercatorMap(object):
 
         Returns:
             Tuple of left,right,bottom and top edges of input city's bounding
-            box.
+            box, at the city's placement (placement column,
+            DEFAULT_PLACEMENT when missing).
         """
-        th = self.renderRow(row, fontname, fontsize, shadow, zorder, test=True)
-        bbox = th.get_window_extent(self._figure.canvas.get_renderer())
-        axbox = bbox.inverse_transformed(self._ax_clone.transData)
-        left, bottom, right, top = axbox.extents
-        xpad = (right - left) * self._padding
-        ypad = (top - bottom) * self._padding
-        left = left - xpad
-        right = right + xpad
-        bottom = bottom - ypad
-        top = top + ypad
+        placement = self._getPlacement(row.get('placement'),
+                                       DEFAULT_PLACEMENT)
+        ha, va = PLACEMENTS[placement][:2]
+        frame = self._getMeasureFrame()
+        tx, ty = self._getLabelPosition(row, frame, placement)
+        sizes = self._getLabelSizes([row['name']], fontname, fontsize)
+        edges = self._getLabelEdges([tx], [ty], sizes, frame, ha=ha, va=va)
+        left, right, bottom, top = [edge[0] for edge in edges]
         return (left, right, bottom, top)
 
-    def renderRow(self, row, fontname, fontsize, shadow, zorder, test=True):
-        """Render the city in input row.
+    def projectCities(self, df):
+        """Project the coordinates of cities to the map projection.
+
+        Args:
+            df: DataFrame from Cities() instance.
+
+        Returns:
+            Copy of the input DataFrame, with x and y columns containing the
+            projected coordinates of each city.
+        """
+        df = df.copy()
+        x, y = self._pproj(df['lon'].values, df['lat'].values)
+        df['x'] = x
+        df['y'] = y
+        return df
+
+    def renderRow(self, row, fontname, fontsize, shadow, zorder):
+        """Render the city in input row, at its placement (placement column,
+        DEFAULT_PLACEMENT when missing).
 
         Args:
             row: DataFrame from Cities() instance.
@@ -373,28 +442,15 @@ class MercatorMap(object):
             shadow: Boolean indicating whether drop-shadow effect should be
                 applied.
             zorder: Desired plotting z-order for city labels and dots.
-            test: Boolean indicating whether to render city on cloned axes
-                (True) or user's visible axes (False).
 
         Returns:
             Matplotlib Text instance.
         """
-        if test:
-            ax = self._ax_clone
-        else:
-            ax = self._ax
-
-        ha = 'left'
-        va = 'center'
-        display1 = (1, 1)
-        display2 = (1 + XOFFSET, 1)
-        data1 = ax.transData.inverted().transform((display1))
-        data2 = ax.transData.inverted().transform((display2))
-        data_x_offset = data2[0] - data1[0]
-
-        proj = pyproj.Proj(ax.projection.proj4_init)
-        tx, ty = proj(row['lon'], row['lat'])
-        tx = tx + data_x_offset
+        ax = self._ax
+        placement = self._getPlacement(row.get('placement'),
+                                       DEFAULT_PLACEMENT)
+        ha, va = PLACEMENTS[placement][:2]
+        tx, ty = self._getLabelPosition(row, (ax.viewLim, ax.bbox), placement)
 
         if shadow:
             th = ax.text(tx, ty, row['name'], fontname=fontname, color='black',
@@ -409,3 +465,174 @@ class MercatorMap(object):
                          transform=ax.projection)
 
         return th
+
+    def _getCityCoordinates(self, df):
+        """Internal method to get the projected coordinates of cities.
+
+        Args:
+            df: DataFrame from Cities() instance, with projected coordinates
+                from projectCities() or not.
+
+        Returns:
+            Tuple of numpy arrays of x and y coordinates (projected) of each
+            city.
+        """
+        if 'x' in df.columns and 'y' in df.columns:
+            return (df['x'].values, df['y'].values)
+        return self._pproj(df['lon'].values, df['lat'].values)
+
+    def _getPlacement(self, placement, default):
+        """Internal method to check the placement of the label of a city.
+
+        Args:
+            placement: Placement from the placement column, or None.
+            default: Placement returned for missing or unsupported
+                placements.
+
+        Returns:
+            Placement (key of PLACEMENTS), or default.
+        """
+        if isinstance(placement, str):
+            placement = placement.strip().upper()
+            if placement in PLACEMENTS:
+                return placement
+        return default
+
+    def _getPlacements(self, df, default):
+        """Internal method to check the placements of the labels of cities.
+
+        Args:
+            df: DataFrame from Cities() instance.
+            default: Placement returned for missing or unsupported
+                placements.
+
+        Returns:
+            List of placements (keys of PLACEMENTS, or default) of each
+            city.
+        """
+        if 'placement' not in df.columns:
+            return [default] * len(df)
+        return [self._getPlacement(placement, default)
+                for placement in df['placement']]
+
+    def _getMeasureFrame(self):
+        """Internal method to get the frame in which labels are measured.
+
+        Labels are measured, and checked for collisions, on the extent of
+        the map stretched over the whole figure, whatever the position of
+        the axes in the figure.
+
+        Returns:
+            Tuple of Bbox instances of the view limits (projected) and of
+            the figure (pixels).
+        """
+        return (self._ax.viewLim.frozen(), self._figure.bbox.frozen())
+
+    def _getLabelOffsets(self, frame):
+        """Internal method to get the distance between a city and its label.
+
+        Args:
+            frame: Tuple of Bbox instances of the view limits (projected) and
+                of the area (pixels) the labels are drawn on.
+
+        Returns:
+            Tuple of horizontal and vertical distances (projected units)
+            corresponding to XOFFSET pixels in the frame.
+        """
+        limits, bbox = frame
+        return (XOFFSET * limits.width / bbox.width,
+                XOFFSET * limits.height / bbox.height)
+
+    def _getLabelPosition(self, row, frame, placement):
+        """Internal method to get the position of the label of a city.
+
+        Args:
+            row: Row of DataFrame from Cities() instance.
+            frame: Tuple of Bbox instances of the view limits (projected) and
+                of the area (pixels) the label is drawn on.
+            placement: Placement (key of PLACEMENTS) of the label.
+
+        Returns:
+            Tuple of x and y coordinates (projected) of the label, XOFFSET
+            pixels away from the city in the direction of the placement.
+        """
+        if 'x' in row.index and 'y' in row.index:
+            tx, ty = row['x'], row['y']
+        else:
+            tx, ty = self._pproj(row['lon'], row['lat'])
+        xoffset, yoffset = self._getLabelOffsets(frame)
+        _, _, xsign, ysign = PLACEMENTS[placement]
+        return (tx + xsign * xoffset, ty + ysign * yoffset)
+
+    def _getPlacementEdges(self, df, placement, frame, sizes):
+        """Internal method to get the bounding boxes of city labels.
+
+        Args:
+            df: DataFrame from Cities() instance.
+            placement: Placement (key of PLACEMENTS) of the labels.
+            frame: Tuple of Bbox instances of the view limits (projected) and
+                of the area (pixels) the labels are drawn on.
+            sizes: Tuple of numpy arrays of widths and heights (pixels) of
+                the labels, from _getLabelSizes().
+
+        Returns:
+            Tuple of numpy arrays of left,right,bottom and top edges of each
+            city's bounding box.
+        """
+        ha, va, xsign, ysign = PLACEMENTS[placement]
+        xoffset, yoffset = self._getLabelOffsets(frame)
+        tx, ty = self._getCityCoordinates(df)
+        return self._getLabelEdges(tx + xsign * xoffset, ty + ysign * yoffset,
+                                   sizes, frame, ha=ha, va=va)
+
+    def _getLabelSizes(self, names, fontname, fontsize):
+        """Internal method to measure city labels.
+
+        Labels are measured from font metrics instead of being rendered;
+        the sizes are the same as those of the Text created by renderRow().
+
+        Args:
+            names: Sequence of label texts.
+            fontname: Desired font name for city labels.
+            fontsize: Desired font size for city labels.
+
+        Returns:
+            Tuple of numpy arrays of widths and heights (pixels) of each
+            label.
+        """
+        metrics = get_font_metrics(fontname, fontsize, self._figure.dpi)
+        sizes = np.array([metrics.getTextSize(name)
+                          for name in names]).reshape(-1, 2)
+        return (sizes[:, 0], sizes[:, 1])
+
+    def _getLabelEdges(self, tx, ty, sizes, frame, ha='left', va='center'):
+        """Internal method to get the padded bounding boxes of city labels.
+
+        Args:
+            tx: Sequence of x coordinates (projected) of the labels.
+            ty: Sequence of y coordinates (projected) of the labels.
+            sizes: Tuple of numpy arrays of widths and heights (pixels) of
+                the labels, from _getLabelSizes().
+            frame: Tuple of Bbox instances of the view limits (projected) and
+                of the area (pixels) the labels are drawn on.
+            ha: Horizontal alignment of the labels.
+            va: Vertical alignment of the labels.
+
+        Returns:
+            Tuple of numpy arrays of left,right,bottom and top edges of each
+            label's bounding box.
+        """
+        widths, heights = sizes
+        transform = BboxTransform(*frame)
+        points = transform.transform(np.column_stack([tx, ty]))
+        lefts = points[:, 0] - widths * HORIZONTAL_ALIGNMENTS[ha]
+        bottoms = points[:, 1] - heights * VERTICAL_ALIGNMENTS[va]
+        inverse = transform.inverted()
+        lower = inverse.transform(np.column_stack([lefts, bottoms]))
+        upper = inverse.transform(np.column_stack([lefts + widths,
+                                                   bottoms + heights]))
+        lefts, bottoms = lower.T
+        rights, tops = upper.T
+        xpad = (rights - lefts) * self._padding
+        ypad = (tops - bottoms) * self._padding
+        return (lefts - xpad, rights + xpad, bottoms - ypad, tops + ypad)
@@ -0,0 +1,122 @@
+# stdlib imports
+import bisect
+import unicodedata
+
+# third party imports
+import numpy as np
+
+
+def normalize_name(name, ignore_case=False, ignore_accents=False):
+    """Normalize a place name for lookups.
+
+    Runs of whitespace are replaced by single spaces, and leading and
+    trailing whitespace is removed.
+
+    Args:
+        name: Place name.
+        ignore_case: Boolean indicating whether the name should be case
+            folded.
+        ignore_accents: Boolean indicating whether diacritics should be
+            removed (i.e., "Zürich" => "Zurich").
+
+    Returns:
+        Normalized name.
+    """
+    name = ' '.join(name.split())
+    if ignore_accents:
+        name = ''.join(c for c in unicodedata.normalize('NFKD', name)
+                       if not unicodedata.combining(c))
+    else:
+        name = unicodedata.normalize('NFC', name)
+    if ignore_case:
+        name = name.casefold()
+    return name
+
+
+class NameIndex(object):
+    """
+    Index of place names, for exact and prefix lookups.
+
+    Names are normalized with normalize_name(), then sorted, so that prefix
+    lookups are binary searches. Exact lookups use a hash table of the
+    normalized names. Query results are positions into the sequence of
+    names the index was built from.
+    """
+
+    def __init__(self, names, ignore_case=False, ignore_accents=False):
+        """Build an index from a sequence of names.
+
+        Args:
+            names: Sequence of place names. Values that are not strings
+                (i.e., NaN) are never found.
+            ignore_case: Boolean indicating whether lookups should be case
+                insensitive.
+            ignore_accents: Boolean indicating whether lookups should ignore
+                diacritics.
+        """
+        self._ignore_case = ignore_case
+        self._ignore_accents = ignore_accents
+        keys = []
+        positions = []
+        for i, name in enumerate(names):
+            if isinstance(name, str):
+                keys.append(self.normalize(name))
+                positions.append(i)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._keys = [keys[i] for i in order]
+        self._positions = np.array(positions, dtype=np.int64)[order]
+        # start and end of each unique name in the sorted keys
+        self._slices = {}
+        for i, key in enumerate(self._keys):
+            start, _ = self._slices.get(key, (i, i))
+            self._slices[key] = (start, i + 1)
+
+    def __len__(self):
+        """Return the number of indexed names.
+
+        Returns:
+            Number of indexed names.
+        """
+        return len(self._keys)
+
+    def normalize(self, name):
+        """Normalize a name the same way as the indexed names.
+
+        Args:
+            name: Place name.
+
+        Returns:
+            Normalized name.
+        """
+        return normalize_name(name, ignore_case=self._ignore_case,
+                              ignore_accents=self._ignore_accents)
+
+    def queryExact(self, name):
+        """Find the places with a given name.
+
+        Args:
+            name: Place name (i.e., "Los Angeles").
+
+        Returns:
+            Sorted array of positions of the places with that name.
+        """
+        start, end = self._slices.get(self.normalize(name), (0, 0))
+        return np.sort(self._positions[start:end])
+
+    def queryPrefix(self, prefix):
+        """Find the places whose names start with a prefix.
+
+        Args:
+            prefix: Start of place name (i.e., "Los").
+
+        Returns:
+            Sorted array of positions of the places with names starting
+            with prefix.
+        """
+        # normalizing strips trailing spaces, which are part of a prefix
+        key = self.normalize(prefix)
+        if prefix[-1:].isspace() and key:
+            key += ' '
+        start = bisect.bisect_left(self._keys, key)
+        end = bisect.bisect_left(self._keys, key + '\U0010ffff', lo=start)
+        return np.sort(self._positions[start:end])
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+from datetime import datetime
+import json
+import os.path
+import shutil
+import tempfile
+
+import impactutils.io.batch as batch
+from impactutils.io.batch import find_station_files, convert_station_files
+from impactutils.io.table import read_table, xml_to_dataframe
+
+
+def _exit_worker(infile, outfile, output_format):
+    # kills the worker process, as a crash would
+    os._exit(1)
+
+
+def _read_dated_table(infile):
+    # reference cells can hold dates, which are not JSON serializable
+    df, _ = read_table(infile)
+    return (df, datetime(2020, 1, 2))
+
+
+def test_convert_station_files():
+    homedir = os.path.dirname(os.path.abspath(
+        __file__))  # where is this script?
+    datadir = os.path.join(homedir, '..', 'data')
+    good = ['complete_pgm.xlsx', 'minimum_mmi.xlsx', 'example_dyfi.csv']
+    bad = ['no_reference.xlsx', 'wrong_channels.xlsx']
+    tempdir = tempfile.mkdtemp()
+    try:
+        indir = os.path.join(tempdir, 'input')
+        os.makedirs(indir)
+        for fname in good + bad:
+            shutil.copy(os.path.join(datadir, fname), indir)
+        # not a station file
+        with open(os.path.join(indir, 'readme.txt'), 'wt') as f:
+            f.write('nothing to see here')
+        files = find_station_files(indir)
+        assert [os.path.basename(f) for f in files] == sorted(good + bad)
+        pattern = os.path.join(indir, '*.csv')
+        assert find_station_files(pattern) == \
+            [os.path.join(indir, 'example_dyfi.csv')]
+
+        outdir = os.path.join(tempdir, 'output')
+        manifest = convert_station_files(indir, outdir, workers=2)
+        assert manifest['nconverted'] == len(good)
+        assert manifest['nfailed'] == len(bad)
+        with open(os.path.join(outdir, 'manifest.json'), 'rt') as f:
+            assert json.load(f) == manifest
+        results = {os.path.basename(r['input']): r
+                   for r in manifest['files']}
+        for fname in good:
+            result = results[fname]
+            assert result['status'] == 'ok'
+            stem = os.path.splitext(fname)[0]
+            assert result['output'] == os.path.join(outdir,
+                                                    stem + '_dat.xml')
+            df, _ = xml_to_dataframe(result['output'])
+            assert len(df) == result['rows']
+        assert results['complete_pgm.xlsx']['reference'].startswith(
+            'Mexican')
+        for fname in bad:
+            result = results[fname]
+            assert result['status'] == 'error'
+            assert result['error_type'] == 'KeyError'
+            assert result['output'] is None
+        assert 'not a valid channel grouping' in \
+            results['wrong_channels.xlsx']['error']
+        assert len(os.listdir(outdir)) == len(good) + 1
+
+        # in process, to GeoJSON
+        outdir = os.path.join(tempdir, 'json')
+        manifest = convert_station_files(
+            os.path.join(indir, '*.xlsx'), outdir, workers=1,
+            output_format='geojson')
+        assert manifest['nconverted'] == 2
+        assert os.path.isfile(os.path.join(outdir, 'complete_pgm_dat.json'))
+
+        # references are written as strings
+        outdir = os.path.join(tempdir, 'dated')
+        batch.read_table = _read_dated_table
+        try:
+            manifest = convert_station_files(
+                os.path.join(indir, '*.csv'), outdir, workers=1)
+        finally:
+            batch.read_table = read_table
+        assert manifest['files'][0]['reference'] == '2020-01-02 00:00:00'
+        with open(os.path.join(outdir, 'manifest.json'), 'rt') as f:
+            assert json.load(f) == manifest
+
+        # workers that die are recorded in the manifest
+        outdir = os.path.join(tempdir, 'broken')
+        convert = batch._convert_station_file
+        batch._convert_station_file = _exit_worker
+        try:
+            manifest = convert_station_files(indir, outdir, workers=2)
+        finally:
+            batch._convert_station_file = convert
+        assert manifest['nconverted'] == 0
+        assert manifest['nfailed'] == len(good) + len(bad)
+        assert set(r['error_type'] for r in manifest['files']) == \
+            {'BrokenProcessPool'}
+        assert os.path.isfile(os.path.join(outdir, 'manifest.json'))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    test_convert_station_files()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import os.path
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from impactutils.io.columncache import (read_column_cache,
+                                        write_column_cache)
+
+
+def _is_memmap(array):
+    while not isinstance(array, np.memmap) and array.base is not None:
+        array = array.base
+    return isinstance(array, np.memmap)
+
+
+def test_column_cache():
+    tempdir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(tempdir, 'source.txt')
+        with open(source, 'wt') as f:
+            f.write('some data')
+        cachefile = source + '.cache'
+        df = pd.DataFrame({'name': ['Los Angeles', 'Zürich', 'Los Angeles'],
+                           'lat': [34.05, 47.37, 34.05],
+                           'pop': np.array([3971883, 341730, 1],
+                                           dtype=np.int64),
+                           'iscap': [False, True, False],
+                           'code': pd.Categorical(['US', 'CH', 'US']),
+                           'small': np.array([1, 2, 3], dtype=np.float32)})
+        write_column_cache(cachefile, df, source, extra={'version': 1})
+        # no temporary files are left behind
+        assert sorted(os.listdir(tempdir)) == ['source.txt',
+                                               'source.txt.cache']
+
+        for mmap in [True, False]:
+            cached, extra = read_column_cache(cachefile, source, mmap=mmap)
+            assert extra == {'version': 1}
+            expected = df.copy()
+            expected['code'] = expected['code'].astype(str).astype(object)
+            pd.testing.assert_frame_equal(cached, expected)
+            # numeric columns are still memory mapped
+            assert _is_memmap(cached['lat'].values) == mmap
+            assert _is_memmap(cached['pop'].values) == mmap
+        # memory mapped columns are copy-on-write
+        cached, _ = read_column_cache(cachefile, source)
+        cached.loc[0, 'lat'] = 0.0
+        cached, _ = read_column_cache(cachefile, source)
+        assert cached['lat'].iloc[0] == 34.05
+
+        # empty dataframe
+        write_column_cache(cachefile, df.iloc[:0], source)
+        cached, extra = read_column_cache(cachefile, source)
+        assert len(cached) == 0 and extra is None
+        assert list(cached.columns) == list(df.columns)
+
+        # stale cache, modified source
+        write_column_cache(cachefile, df, source)
+        mtime = time.time() + 10
+        os.utime(source, (mtime, mtime))
+        assert read_column_cache(cachefile, source) is None
+
+        # not a cache file
+        assert read_column_cache(source, source) is None
+        # missing cache file
+        assert read_column_cache(cachefile + '.foo', source) is None
+
+        # truncated cache files, in the header length, header and blocks
+        os.utime(source)
+        write_column_cache(cachefile, df, source)
+        with open(cachefile, 'rb') as f:
+            content = f.read()
+        assert read_column_cache(cachefile, source) is not None
+        for size in [28, 40, len(content) - 8]:
+            with open(cachefile, 'wb') as f:
+                f.write(content[:size])
+            assert read_column_cache(cachefile, source) is None
+
+        # strings with newlines can't be cached
+        try:
+            write_column_cache(cachefile, pd.DataFrame({'a': ['a\nb']}),
+                               source)
+            assert 1 == 2
+        except ValueError:
+            assert 1 == 1
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    test_column_cache()
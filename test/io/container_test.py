@@ -12,6 +12,8 @@ import pandas as pd
 import pytz
 
 from impactutils.io.container import HDFContainer
+from impactutils.io.smcontainers import HDFContainerBase
+from impactutils.io.iostats import IOStats
 
 TIMEFMT = '%Y-%d-%m %H:%M:%S.%f'
 
@@ -255,9 +257,81 @@ def test_hdf_dataframes():
         os.remove(testfile)
 
 
+def test_hdf_stats():
+    f, testfile = tempfile.mkstemp()
+    os.close(f)
+    f, reportfile = tempfile.mkstemp()
+    os.close(f)
+    try:
+        container = HDFContainer.create(testfile)
+        # instrumentation is off by default
+        container.setDictionary('person', {'name': 'Fred'})
+        assert container.getStats() is None
+
+        stats = IOStats()
+        container.setStats(stats)
+        data = np.random.rand(200, 300)
+        container.setArray('testdata', data, compression=True)
+        outdata, _ = container.getArray('testdata')
+        np.testing.assert_array_equal(outdata, data)
+        outdict = container.getDictionary('person')
+        assert outdict == {'name': 'Fred'}
+        container.dropArray('testdata')
+        container.getDictionaries()
+
+        records = stats.getRecords()
+        assert [r['method'] for r in records] == [
+            'setArray', 'getArray', 'getDictionary', 'dropArray']
+        setrec, getrec, dictrec, droprec = records
+        assert getrec['path'] == 'arrays/testdata'
+        assert getrec['nbytes'] == data.nbytes
+        assert 0 < getrec['storage_bytes'] <= data.nbytes
+        assert getrec['decompress_time'] > 0
+        assert setrec['nbytes'] == data.nbytes
+        assert dictrec['decode_time'] > 0
+        assert droprec['nbytes'] == 0
+        assert droprec['wall_time'] > 0
+
+        summary = stats.getSummary()
+        assert summary.loc['getArray', 'calls'] == 1
+        assert 'total' in stats.report()
+        stats.dump(reportfile)
+        with open(reportfile, 'rt') as f:
+            assert f.read().startswith('{')
+        container.close()
+
+        # the same stats object can be shared with other containers
+        container2 = HDFContainerBase.create(testfile)
+        container2.setStats(stats)
+        container2.setDictionary(['a', 'b'], 'config', {'x': 1})
+        assert container2.getDictionary(['a', 'b'], 'config') == {'x': 1}
+        assert stats.getRecords()[-1]['path'] == 'dictionaries/a/b/config'
+        assert len(stats) == 6
+        container2.close()
+    finally:
+        os.remove(testfile)
+        os.remove(reportfile)
+
+
+def test_stats_nesting():
+    # nested calls on the same path start equal records; each must be
+    # finished and added to as itself
+    stats = IOStats()
+    outer = stats._start('getDictionary', 'dictionaries/config')
+    inner = stats._start('getDictionary', 'dictionaries/config')
+    stats._finish(inner, 0.0)
+    stats._add(decode_time=2.0)
+    stats._finish(outer, 3.0)
+    inrec, outrec = stats.getRecords()
+    assert (inrec['wall_time'], inrec['decode_time']) == (0.0, 0)
+    assert (outrec['wall_time'], outrec['decode_time']) == (3.0, 2.0)
+
+
 if __name__ == '__main__':
     test_hdf_dictonaries()
     test_hdf_lists()
     test_hdf_arrays()
     test_hdf_strings()
     test_hdf_dataframes()
+    test_hdf_stats()
+    test_stats_nesting()
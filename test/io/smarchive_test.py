@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import os.path
+import shutil
+import tempfile
+
+import numpy as np
+
+from impactutils.io.smcontainers import ShakeMapOutputContainer
+from impactutils.io.smarchive import ShakeMapArchive
+
+
+def _make_grid_container(filename, eventid, value):
+    container = ShakeMapOutputContainer.create(filename)
+    info = {'input': {'event_information': {'event_id': eventid}}}
+    container.setMetadata(info)
+    mean = np.full((10, 20), value)
+    mean[0, 0] = np.nan
+    std = np.full((10, 20), 0.5)
+    container.setIMTGrids('PGA', mean, {'units': 'ln(g)'},
+                          std, {'units': 'ln(g)'}, 'Larger')
+    container.setIMTGrids('MMI', mean + 1, {}, std, {}, 'Larger')
+    container.close()
+
+
+def _make_point_container(filename):
+    container = ShakeMapOutputContainer.create(filename)
+    lons = np.array([-118.0, -117.5, -117.0])
+    lats = np.array([34.0, 34.5, 35.0])
+    ids = np.array([b'CI.A', b'CI.B', b'CI.C'])
+    mean = np.array([1.0, 2.0, 3.0])
+    std = np.array([0.1, 0.2, 0.3])
+    container.setIMTArrays('PGV', lons, lats, ids, mean, {}, std, {},
+                           'rotd50')
+    container.close()
+
+
+def test_archive():
+    tempdir = tempfile.mkdtemp()
+    try:
+        archive_dir = os.path.join(tempdir, 'archive')
+        os.makedirs(archive_dir)
+        files = []
+        for i, eventid in enumerate(['us1000abcd', 'ci38457511']):
+            filename = os.path.join(archive_dir, '%s.hdf' % eventid)
+            _make_grid_container(filename, eventid, float(i))
+            files.append(filename)
+        points_file = os.path.join(archive_dir, 'points.hdf')
+        _make_point_container(points_file)
+        files.append(points_file)
+
+        index_file = os.path.join(tempdir, 'index.hdf')
+        archive = ShakeMapArchive.create(index_file, files)
+        archive.close()
+
+        # the index should survive being moved with the archive
+        newdir = os.path.join(tempdir, 'moved')
+        os.makedirs(newdir)
+        shutil.move(archive_dir, os.path.join(newdir, 'archive'))
+        shutil.move(index_file, os.path.join(newdir, 'index.hdf'))
+        index_file = os.path.join(newdir, 'index.hdf')
+        points_file = os.path.join(newdir, 'archive', 'points.hdf')
+
+        archive = ShakeMapArchive.load(index_file)
+        assert sorted(archive.getEvents()) == sorted(
+            ['us1000abcd', 'ci38457511', 'points'])
+        assert sorted(archive.getIMTs('ci38457511')) == [
+            'Larger/MMI', 'Larger/PGA']
+        assert archive.getIMTs('points', component='rotd50') == ['PGV']
+        info = archive.getMetadata('ci38457511')
+        assert info['input']['event_information']['event_id'] == \
+            'ci38457511'
+        assert archive.getSourceFile('points') == \
+            os.path.join(newdir, 'archive', 'points.hdf')
+
+        imt = archive.getIMT('ci38457511', 'PGA', 'Larger')
+        assert imt['mean'].shape == (10, 20)
+        np.testing.assert_almost_equal(np.nanmax(imt['mean']), 1.0)
+        assert imt['mean_metadata']['units'] == 'ln(g)'
+        # no IMT data was copied into the index
+        assert archive._hdfobj[
+            'events/ci38457511/imts/Larger/PGA/mean'].is_virtual
+
+        imt = archive.getIMT('points', 'PGV', 'rotd50')
+        assert list(imt['ids']) == [b'CI.A', b'CI.B', b'CI.C']
+        np.testing.assert_almost_equal(imt['mean'], [1.0, 2.0, 3.0])
+
+        summary = archive.getSummary()
+        assert len(summary) == 5
+        row = summary[(summary['eventid'] == 'us1000abcd') &
+                      (summary['imt'] == 'MMI')].iloc[0]
+        np.testing.assert_almost_equal(row['max'], 1.0)
+        np.testing.assert_almost_equal(row['std_mean'], 0.5)
+        archive.close()
+
+        # duplicate event IDs are not allowed
+        try:
+            ShakeMapArchive.create(os.path.join(tempdir, 'dup.hdf'),
+                                   [points_file, points_file])
+            assert 1 == 2
+        except ValueError:
+            assert 1 == 1
+        # and no partial index is left behind
+        assert not os.path.exists(os.path.join(tempdir, 'dup.hdf'))
+
+        # neither when a file is not a container
+        bad_file = os.path.join(tempdir, 'bad.txt')
+        with open(bad_file, 'wt') as f:
+            f.write('not an HDF file')
+        try:
+            ShakeMapArchive.create(os.path.join(tempdir, 'bad.hdf'),
+                                   [points_file, bad_file])
+            assert 1 == 2
+        except OSError:
+            assert 1 == 1
+        assert not os.path.exists(os.path.join(tempdir, 'bad.hdf'))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    test_archive()
@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 
+import io
+import json
+import re
 import shutil
 import tempfile
 import os.path
 import numpy as np
 from xml.dom import minidom
-from impactutils.io.table import read_excel, dataframe_to_xml
+from impactutils.io.table import (read_excel, dataframe_to_xml,
+                                  dataframes_to_xml, xml_to_dataframe,
+                                  dataframe_to_geojson, dataframes_to_geojson,
+                                  read_csv, read_table, merge_tables)
 import pandas as pd
 
 
@@ -146,7 +152,11 @@ def test_dataframe_to_xml():
         dataframe_to_xml(df, xmlfile)
         # HNN,psa10,0.0107
         root = minidom.parse(xmlfile)
+        stations = root.getElementsByTagName('station')
+        assert len(stations) == len(df['STATION'].unique())
         comps = root.getElementsByTagName('comp')
+        channels = df[['STATION', 'CHANNEL']].drop_duplicates()
+        assert len(comps) == len(channels)
         for comp in comps:
             if comp.getAttribute('name') == 'HNN':
                 psa10 = comp.getElementsByTagName('psa10')[0]
@@ -158,6 +168,259 @@ def test_dataframe_to_xml():
         shutil.rmtree(outdir)
 
 
+def test_dataframes_to_xml():
+    homedir = os.path.dirname(os.path.abspath(
+        __file__))  # where is this script?
+    datadir = os.path.join(homedir, '..', 'data')
+    amps_output = os.path.join(datadir, 'amps.csv')
+    df = pd.read_csv(amps_output)
+    outdir = tempfile.mkdtemp()
+    try:
+        xmlfile = os.path.join(outdir, 'single.xml')
+        dataframe_to_xml(df, xmlfile, reference='test')
+        with open(xmlfile, 'rt') as f:
+            single = re.sub('created="[0-9]+"', '', f.read())
+
+        # write one chunk per station, repeating the first chunk
+        chunks = [chunk for _, chunk in df.groupby('STATION', sort=False)]
+        xmlfile = os.path.join(outdir, 'chunks.xml')
+        dataframes_to_xml(iter(chunks + chunks[:1]), xmlfile,
+                          reference='test')
+        with open(xmlfile, 'rt') as f:
+            chunked = re.sub('created="[0-9]+"', '', f.read())
+        assert chunked == single
+
+        # no stations
+        xmlfile = os.path.join(outdir, 'empty.xml')
+        dataframes_to_xml([], xmlfile)
+        root = minidom.parse(xmlfile)
+        assert len(root.getElementsByTagName('stationlist')) == 1
+        assert len(root.getElementsByTagName('station')) == 0
+        root.unlink()
+    finally:
+        shutil.rmtree(outdir)
+
+
+def test_xml_to_dataframe():
+    homedir = os.path.dirname(os.path.abspath(
+        __file__))  # where is this script?
+    datadir = os.path.join(homedir, '..', 'data')
+    complete_file = os.path.join(datadir, 'complete_pgm.xlsx')
+    df, reference = read_excel(complete_file)
+    outdir = tempfile.mkdtemp()
+    try:
+        xmlfile = os.path.join(outdir, 'complete_pgm.xml')
+        dataframe_to_xml(df, xmlfile, reference=reference)
+
+        # wide layout
+        wide, wide_reference = xml_to_dataframe(xmlfile)
+        assert wide_reference == reference
+        assert len(wide) == len(df)
+        assert wide['STATION'].iloc[0] == 'MX.ACAM'
+        np.testing.assert_almost_equal(wide['H1']['PGA'].sum(), 569.17)
+        np.testing.assert_almost_equal(wide['H1']['SA(0.3)'].values,
+                                       df['H1']['SA(0.3)'].values)
+
+        # writing the wide layout gives back the same file
+        xmlfile2 = os.path.join(outdir, 'complete_pgm2.xml')
+        dataframe_to_xml(wide, xmlfile2, reference=wide_reference)
+        with open(xmlfile, 'rt') as f:
+            xml1 = re.sub('created="[0-9]+"', '', f.read())
+        with open(xmlfile2, 'rt') as f:
+            xml2 = re.sub('created="[0-9]+"', '', f.read())
+        assert xml1 == xml2
+
+        # long layout
+        long_df, _ = xml_to_dataframe(xmlfile, layout='long')
+        assert len(long_df) == df['H1'].notnull().sum().sum() * 3
+        pga = long_df[(long_df['CHANNEL'] == 'H1') &
+                      (long_df['IMT'] == 'pga')]
+        np.testing.assert_almost_equal(pga['VALUE'].sum(), 569.17)
+        assert (long_df['FLAG'] == '0').all()
+
+        # chunks
+        chunks = list(xml_to_dataframe(xmlfile, layout='long', chunksize=7))
+        assert [len(chunk['STATION'].unique()) for chunk, _ in chunks] == \
+            [7, 7, 4]
+        assert chunks[0][1] == reference
+        chunked = pd.concat([chunk for chunk, _ in chunks],
+                            ignore_index=True)
+        pd.testing.assert_frame_equal(chunked, long_df)
+
+        try:
+            xml_to_dataframe(xmlfile, layout='tall')
+            assert 1 == 2
+        except ValueError:
+            assert 1 == 1
+    finally:
+        shutil.rmtree(outdir)
+
+
+def test_dataframe_to_geojson():
+    homedir = os.path.dirname(os.path.abspath(
+        __file__))  # where is this script?
+    datadir = os.path.join(homedir, '..', 'data')
+    missing_file = os.path.join(datadir, 'missing_rows.xlsx')
+    df, reference = read_excel(missing_file)
+    dyfi_file = os.path.join(datadir, 'example_dyfi.csv')
+    dyfi = pd.read_csv(dyfi_file)
+    outdir = tempfile.mkdtemp()
+    try:
+        jsonfile = os.path.join(outdir, 'missing_rows.json')
+        dataframe_to_geojson(df, jsonfile, reference=reference)
+        with open(jsonfile, 'rt') as f:
+            stationlist = json.load(f)
+        assert stationlist['type'] == 'FeatureCollection'
+        assert stationlist['reference'] == reference
+        features = stationlist['features']
+        assert len(features) == len(df)
+        feature = features[0]
+        assert feature['id'] == 'MX.ACAM'
+        np.testing.assert_almost_equal(feature['geometry']['coordinates'],
+                                       [-100.7168, 20.0432])
+        props = feature['properties']
+        assert props['network'] == 'MX'
+        assert props['station_type'] == 'seismic'
+        assert [c['name'] for c in props['channels']] == ['H1', 'H2', 'Z']
+        pga = props['channels'][0]['amplitudes'][0]
+        assert pga['name'] == 'pga'
+        np.testing.assert_almost_equal(pga['value'], 4.48)
+        # missing amplitudes are left out
+        psa03 = [[amp['value'] for amp in channel['amplitudes']
+                  if amp['name'] == 'psa03']
+                 for channel in features[3]['properties']['channels']]
+        assert psa03[0] == []
+
+        # macroseismic stations, written in chunks
+        jsonfile = os.path.join(outdir, 'dyfi.json')
+        dataframes_to_geojson([dyfi.iloc[:2], dyfi.iloc[2:]], jsonfile)
+        with open(jsonfile, 'rt') as f:
+            stationlist = json.load(f)
+        features = stationlist['features']
+        assert len(features) == len(dyfi)
+        for feature in features:
+            props = feature['properties']
+            assert props['station_type'] == 'macroseismic'
+            assert props['intensity'] > 1
+            assert isinstance(props['nresp'], int)
+    finally:
+        shutil.rmtree(outdir)
+
+
+def test_read_csv():
+    homedir = os.path.dirname(os.path.abspath(
+        __file__))  # where is this script?
+    datadir = os.path.join(homedir, '..', 'data')
+    amps_file = os.path.join(datadir, 'amps.csv')
+    df, reference = read_csv(amps_file)
+    assert reference is None
+    assert 'UNNAMED: 0' not in df.columns
+    assert df['STATION'].iloc[0] == '1810'
+    assert df['VALUE'].dtype == np.float64
+    assert set(df['CHANNEL']) == set(['HNE', 'HNN', 'HNZ'])
+
+    chunks = list(read_csv(amps_file, chunksize=5))
+    assert [len(chunk) for chunk, _ in chunks] == [5, 5, 5, 3]
+    pd.testing.assert_frame_equal(
+        pd.concat([chunk for chunk, _ in chunks], ignore_index=True), df)
+
+    dyfi_file = os.path.join(datadir, 'example_dyfi.csv')
+    df, _ = read_table(dyfi_file)
+    np.testing.assert_almost_equal(df['NRESP'].sum(), 25)
+    complete_file = os.path.join(datadir, 'complete_pgm.xlsx')
+    df, reference = read_table(complete_file)
+    np.testing.assert_almost_equal(df['H1']['PGA'].sum(), 569.17)
+
+    # PGM column names are translated to amplitude names
+    header = 'STATION,LAT,LON,NETID,CHANNEL,IMT,VALUE\n'
+    df, _ = read_csv(io.StringIO(header + 'A,1,2,XX,HNE,SA(0.3),1\n' +
+                                 'A,1,2,XX,HNE,PGV,2\n'))
+    assert list(df['IMT']) == ['psa03', 'pgv']
+
+    # these should all fail
+    header = 'STATION,LAT,LON,NETID,CHANNEL,IMT,VALUE\n'
+    bad_files = [header.replace('NETID,', '') + 'A,1,2,FOO,pga,1\n',
+                 header + 'A,1,2,XX,FOO,pga,1\n',
+                 header + 'A,1,2,XX,HNE,FOO,1\n',
+                 header + 'A,1,2,XX,HNE,X1,1\n',
+                 header + 'A,1,2,XX,HNE,SA(x),1\n',
+                 'STATION,LAT,LON,NETID\nA,1,2,XX\n']
+    for bad_file in bad_files:
+        try:
+            read_csv(io.StringIO(bad_file))
+            assert 1 == 2
+        except KeyError:
+            assert 1 == 1
+
+
+def test_merge_tables():
+    homedir = os.path.dirname(os.path.abspath(
+        __file__))  # where is this script?
+    datadir = os.path.join(homedir, '..', 'data')
+    amps_file = os.path.join(datadir, 'amps.csv')
+    amps_a, _ = read_csv(amps_file)
+    amps_a['SOURCE'] = 'A'
+    # the same station from another source, with the code prefixed with
+    # the network, one amplitude missing and one more unflagged
+    amps_b = amps_a.copy()
+    amps_b['SOURCE'] = 'B'
+    amps_b['STATION'] = 'NP.' + amps_b['STATION']
+    amps_b['VALUE'] = amps_b['VALUE'] * 10
+    amps_b['FLAG'] = '0'
+    amps_b = amps_b.iloc[1:]
+
+    # input order
+    merged = merge_tables([amps_a, amps_b])
+    assert len(merged) == len(amps_a)
+    assert list(merged['STATION'].unique()) == ['NP.1810']
+    pgv = merged[(merged['CHANNEL'] == 'HNE') & (merged['IMT'] == 'pgv')]
+    # the unflagged amplitude beats the flagged one
+    assert pgv['SOURCE'].iloc[0] == 'B'
+    assert (merged['SOURCE'] == 'A').sum() == len(amps_a) - 1
+
+    # source priority
+    merged = merge_tables([amps_a, amps_b], priority=['B', 'A'])
+    assert (merged['SOURCE'] == 'B').sum() == len(amps_b)
+    pga = merged[(merged['CHANNEL'] == 'HNE') & (merged['IMT'] == 'pga')]
+    assert pga['SOURCE'].iloc[0] == 'A'
+
+    # rows are in order of first appearance, even when a later table wins
+    table1 = pd.DataFrame({'STATION': ['X', 'Y'], 'LAT': [1.0, 2.0],
+                           'LON': [1.0, 2.0], 'NETID': 'XX',
+                           'CHANNEL': 'HNE', 'IMT': 'pga',
+                           'VALUE': [1.0, 2.0], 'SOURCE': 'A'})
+    table2 = table1.iloc[::-1].copy()
+    table2['SOURCE'] = 'B'
+    merged = merge_tables([table1, table2], priority=['B', 'A'])
+    assert list(merged['STATION']) == ['XX.X', 'XX.Y']
+    assert (merged['SOURCE'] == 'B').all()
+
+    # flags don't matter
+    merged = merge_tables([amps_a, amps_b], prefer_unflagged=False)
+    assert (merged['SOURCE'] == 'A').all()
+
+    # wide tables are converted to long format
+    complete_file = os.path.join(datadir, 'complete_pgm.xlsx')
+    wide, _ = read_excel(complete_file)
+    merged = merge_tables([wide, amps_a])
+    assert (merged['CHANNEL'] == 'H1').sum() == \
+        wide['H1'].notnull().sum().sum()
+    assert (merged['STATION'] == 'NP.1810').sum() == len(amps_a)
+    assert 'psa03' in set(merged['IMT'])
+    h1 = merged[(merged['CHANNEL'] == 'H1') & (merged['IMT'] == 'pga')]
+    np.testing.assert_almost_equal(h1['VALUE'].sum(), 569.17)
+    outdir = tempfile.mkdtemp()
+    try:
+        xmlfile = os.path.join(outdir, 'merged.xml')
+        dataframe_to_xml(merged, xmlfile)
+        root = minidom.parse(xmlfile)
+        stations = root.getElementsByTagName('station')
+        assert len(stations) == len(wide) + 1
+        root.unlink()
+    finally:
+        shutil.rmtree(outdir)
+
+
 # Use DYFI raw data and attempt to create a valid
 # Shakemap input XML.
 def test_read_dyfi():
@@ -191,3 +454,8 @@ if __name__ == '__main__':
     test_write_xml()
     test_read_tables()
     test_dataframe_to_xml()
+    test_dataframes_to_xml()
+    test_xml_to_dataframe()
+    test_dataframe_to_geojson()
+    test_read_csv()
+    test_merge_tables()
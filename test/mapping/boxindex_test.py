@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+# stdlib imports
+import os.path
+import sys
+
+import numpy as np
+import pytest
+
+# hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__))  # where is this script?
+impactdir = os.path.abspath(os.path.join(homedir, '..', '..'))
+# put this at the front of the system path, ignoring any installed mapio stuff
+sys.path.insert(0, impactdir)
+
+from impactutils.mapping.boxindex import BoxIndex
+
+
+def test_boxes():
+    np.random.seed(42)
+    nboxes = 2000
+    lefts = np.random.uniform(-500, 500, nboxes)
+    bottoms = np.random.uniform(-500, 500, nboxes)
+    rights = lefts + np.random.uniform(0, 40, nboxes)
+    tops = bottoms + np.random.uniform(0, 10, nboxes)
+    index = BoxIndex(15.0)
+    for i in range(nboxes):
+        assert index.addBox(lefts[i], rights[i], bottoms[i], tops[i]) == i
+    assert len(index) == nboxes
+
+    queries = [(0, 10, 0, 10), (-600, 600, -600, 600), (1000, 1001, 0, 1),
+               (lefts[5], lefts[5], bottoms[5], bottoms[5])]
+    for left, right, bottom, top in queries:
+        overlaps = ~((left > rights) | (right < lefts) |
+                     (top < bottoms) | (bottom > tops))
+        expected = list(np.nonzero(overlaps)[0])
+        assert index.queryBox(left, right, bottom, top) == expected
+        assert index.hasOverlap(left, right, bottom, top) == bool(expected)
+
+    # boxes that only touch overlap
+    index = BoxIndex(1.0)
+    index.addBox(0, 2, 0, 1)
+    assert index.queryBox(2, 3, 1, 2) == [0]
+    assert not index.hasOverlap(2.01, 3, 0, 1)
+
+    with pytest.raises(ValueError):
+        BoxIndex(0)
+
+
+if __name__ == '__main__':
+    test_boxes()
@@ -4,10 +4,12 @@ from __future__ import print_function
 
 # stdlib imports
 import os.path
+import shutil
 import sys
 import tempfile
 
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 
 # hack the path so that I can debug these functions if I need to
@@ -16,7 +18,37 @@ impactdir = os.path.abspath(os.path.join(homedir, '..', '..'))
 # put this at the front of the system path, ignoring any installed mapio stuff
 sys.path.insert(0, impactdir)
 
-from impactutils.mapping.city import Cities
+from impactutils.mapping.city import Cities, CACHE_EXT, RANK_EXT
+
+# a few lines in GeoNames cities1000.txt format
+GEONAMES_LINES = [
+    ['5368361', 'Los Angeles', 'Los Angeles', '', '34.05223', '-118.24368',
+     'P', 'PPLA2', 'US', '', 'CA', '037', '', '', '3971883', '', '89',
+     'America/Los_Angeles', '2019-09-05'],
+    ['5391959', 'San Francisco', 'San Francisco', '', '37.77493',
+     '-122.41942', 'P', 'PPLA2', 'US', '', 'CA', '075', '', '', '864816', '',
+     '16', 'America/Los_Angeles', '2019-09-05'],
+    ['5334223', 'Carlsbad', 'Carlsbad', '', '33.15809', '-117.35059', 'P',
+     'PPL', 'US', '', 'CA', '073', '', '', '114746', '', '16',
+     'America/Los_Angeles', '2017-03-09'],
+    ['5332921', 'California City', 'California City', '', '35.1258',
+     '-117.98591', 'P', 'PPL', 'US', '', 'CA', '029', '', '', '13252', '',
+     '734', 'America/Los_Angeles', '2017-03-09'],
+    ['3530597', 'Mexico City', 'Mexico City', '', '19.42847', '-99.12766',
+     'P', 'PPLC', 'MX', '', '09', '', '', '', '12294193', '', '2240',
+     'America/Mexico_City', '2019-09-05'],
+    ['2657896', 'Z\xfcrich', '', '', '47.36667', '8.55', 'P', 'PPLA',
+     'CH', '', 'ZH', '112', '261', '', '341730', '', '429',
+     'Europe/Zurich', '2019-09-05'],
+    ['3352136', 'Windhoek', 'Windhoek', '', '-22.55941', '17.08323', 'P',
+     'PPLC', 'NA', '', '21', '', '', '', '268132', '', '1725',
+     'Africa/Windhoek', '2019-09-05']]
+
+
+def _write_geonames(filename):
+    with open(filename, 'wt', encoding='latin-1') as f:
+        for line in GEONAMES_LINES:
+            f.write('\t'.join(line) + '\n')
 
 
 def test():
@@ -70,5 +102,247 @@ def test():
     print('Passed saving cities and reading them back in.')
 
 
+def test_geonames_cache():
+    tempdir = tempfile.mkdtemp()
+    try:
+        cityfile = os.path.join(tempdir, 'cities1000.txt')
+        _write_geonames(cityfile)
+        cachefile = cityfile + CACHE_EXT
+
+        # without the cache
+        cities = Cities.fromGeoNames(cityfile, cache=False)
+        assert not os.path.isfile(cachefile)
+        # the city without an ascii name is skipped
+        assert len(cities) == len(GEONAMES_LINES) - 1
+        df = cities.getDataFrame()
+        assert df['iscap'].tolist() == [False, False, False, False, True,
+                                        True]
+        assert df['pop'].iloc[0] == 3971883
+        # Namibia is not a missing value
+        assert df['ccode'].iloc[-1] == 'NA'
+
+        # first load makes the cache, second one reads it
+        cities = Cities.fromGeoNames(cityfile)
+        assert os.path.isfile(cachefile)
+        cached = Cities.fromGeoNames(cityfile)
+        pd.testing.assert_frame_equal(cached.getDataFrame(), df)
+        # the numeric columns are memory mapped from the cache, not copied
+        lats = cached._dataframe['lat'].values
+        while not isinstance(lats, np.memmap) and lats.base is not None:
+            lats = lats.base
+        assert isinstance(lats, np.memmap)
+        assert len(cached.limitByName('Los Angeles')) == 1
+        compact = Cities.fromGeoNames(cityfile, compact=True)
+        assert compact.getDataFrame()['pop'].dtype == np.uint32
+
+        # the cache is rebuilt when the file changes
+        with open(cityfile, 'at', encoding='latin-1') as f:
+            f.write('\t'.join(GEONAMES_LINES[0]) + '\n')
+        cities = Cities.fromGeoNames(cityfile)
+        assert len(cities) == len(GEONAMES_LINES)
+        assert len(Cities.fromGeoNames(cityfile)) == len(GEONAMES_LINES)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_limit_by_grid():
+    # a 3x3 grid of cities, with populations increasing with lat/lon,
+    # in a 2x2 grid of cells
+    lats, lons = np.meshgrid([0.0, 1.0, 2.0], [10.0, 11.0, 12.0])
+    df = pd.DataFrame({'name': ['city%i' % i for i in range(9)],
+                       'ccode': 'XX',
+                       'lat': lats.ravel(),
+                       'lon': lons.ravel(),
+                       'iscap': False,
+                       'pop': np.arange(9) * 100})
+    cities = Cities(df)
+    gdf = cities.limitByGrid(nx=2, ny=2, cities_per_grid=10).getDataFrame()
+    # cities on the minimum edges are kept
+    assert len(gdf) == 9
+    # ordered by cell from the bottom left, then by population
+    assert list(gdf['name']) == ['city4', 'city3', 'city1', 'city0',
+                                 'city7', 'city6', 'city5', 'city2', 'city8']
+    gdf = cities.limitByGrid(nx=2, ny=2, cities_per_grid=1).getDataFrame()
+    assert list(gdf['name']) == ['city4', 'city7', 'city5', 'city8']
+
+
+def test_query():
+    np.random.seed(42)
+    npoints = 2000
+    prefixes = ['San', 'Los', 'New']
+    df = pd.DataFrame({'name': ['%s city %i' % (prefixes[i % 3], i)
+                                for i in range(npoints)],
+                       'ccode': 'XX',
+                       'lat': np.random.uniform(30, 40, npoints),
+                       'lon': np.random.uniform(-125, -115, npoints),
+                       'iscap': False,
+                       'pop': np.random.randint(1000, 1000000, npoints)})
+    cities = Cities(df)
+    eager = cities.limitByBounds((-122, -117, 32, 38))
+    eager = eager.limitByPopulation(50000).limitByGrid(4, 4, 5)
+    eager = eager.limitByName('San')
+    query = cities.query().limitByBounds((-122, -117, 32, 38))
+    query = query.limitByPopulation(50000).limitByGrid(4, 4, 5)
+    query = query.limitByName('San')
+    lazy = query.execute()
+    assert isinstance(lazy, Cities)
+    assert len(query) == len(lazy) == len(eager)
+    pd.testing.assert_frame_equal(lazy.getDataFrame(), eager.getDataFrame())
+    lat, lon, names = query.getCities()
+    np.testing.assert_array_equal(names, eager.getDataFrame()['name'])
+
+    # queries are immutable, and run once
+    base = cities.query().limitByRadius(35.0, -120.0, 200)
+    big = base.limitByPopulation(500000)
+    assert len(big) < len(base)
+    assert big.getPositions() is big.getPositions()
+    eager = cities.limitByRadius(35.0, -120.0, 200)
+    eager.sortByColumns(['pop', 'name'], ascending=False)
+    query = base.sortByColumns(['pop', 'name'], ascending=False)
+    pd.testing.assert_frame_equal(query.getDataFrame(), eager.getDataFrame())
+
+    try:
+        cities.query().sortByColumns('population')
+        assert False
+    except KeyError:
+        pass
+    try:
+        cities.query().limitByPopulation(1000, minpop=2000)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_compact():
+    np.random.seed(7)
+    npoints = 1000
+    df = pd.DataFrame({'name': ['city %i' % i for i in range(npoints)],
+                       'ccode': np.random.choice(['US', 'MX', 'CA'], npoints),
+                       'lat': np.random.uniform(30, 40, npoints),
+                       'lon': np.random.uniform(-125, -115, npoints),
+                       'iscap': np.random.uniform(size=npoints) < 0.1,
+                       'pop': np.random.randint(1000, 1000000, npoints)})
+    cities = Cities(df)
+    compact = cities.compact()
+    cdf = compact.getDataFrame()
+    assert isinstance(cdf['name'].dtype, pd.CategoricalDtype)
+    assert isinstance(cdf['ccode'].dtype, pd.CategoricalDtype)
+    assert cdf['lat'].dtype == np.float32
+    assert cdf['lon'].dtype == np.float32
+    assert cdf['iscap'].dtype == bool
+    assert cdf['pop'].dtype == np.uint32
+    assert (cdf.memory_usage(deep=True).sum() <
+            df.memory_usage(deep=True).sum())
+    # the original is unchanged
+    assert cities.getDataFrame()['lat'].dtype == np.float64
+
+    for limit in [lambda c: c.limitByBounds((-122, -117, 32, 38)),
+                  lambda c: c.limitByRadius(35.0, -120.0, 200),
+                  lambda c: c.limitByPopulation(500000),
+                  lambda c: c.limitByGrid(3, 3, 4),
+                  lambda c: c.limitByName('city 1.*5'),
+                  lambda c: c.query().limitByPopulation(50000).execute()]:
+        names = limit(cities).getDataFrame()['name']
+        cnames = limit(compact).getDataFrame()['name']
+        assert list(names) == list(cnames)
+    lat, lon, names = compact.getCities()
+    assert isinstance(names, np.ndarray)
+    assert names[0] == 'city 0'
+
+    # populations that do not fit in uint32 are left alone
+    df['pop'] = df['pop'].astype(float)
+    df.loc[0, 'pop'] = np.nan
+    assert Cities(df).compact().getDataFrame()['pop'].dtype == np.float64
+
+
+def test_limit_by_name():
+    df = pd.DataFrame({'name': ['Los Angeles', 'Los Alamos', 'Zürich',
+                                'LOS ANGELES', 'San Jose'],
+                       'lat': [34.05, 35.88, 47.37, 34.05, 37.34],
+                       'lon': [-118.24, -106.30, 8.55, -118.24, -121.89]})
+    for cities in [Cities(df), Cities(df).compact()]:
+        result = cities.limitByName('Los A')
+        assert list(result.getDataFrame()['name']) == ['Los Angeles',
+                                                       'Los Alamos']
+        result = cities.limitByName('Los Angeles', match='exact')
+        assert list(result.getDataFrame()['name']) == ['Los Angeles']
+        result = cities.limitByName('los angeles', match='exact',
+                                    ignore_case=True)
+        assert len(result) == 2
+        result = cities.limitByName('los', match='prefix', ignore_case=True)
+        assert len(result) == 3
+        result = cities.limitByName('Zurich', match='exact',
+                                    ignore_accents=True)
+        assert list(result.getDataFrame()['name']) == ['Zürich']
+        result = cities.limitByName('los a', ignore_case=True)
+        assert len(result) == 3
+        query = cities.query().limitByBounds((-120, -100, 30, 40))
+        query = query.limitByName('Los A', match='prefix')
+        assert list(query.getDataFrame()['name']) == ['Los Angeles',
+                                                      'Los Alamos']
+    try:
+        cities.limitByName('Los', match='fuzzy')
+        assert False
+    except ValueError:
+        pass
+    try:
+        cities.query().limitByName('Zurich', ignore_accents=True)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_ranks():
+    # four cities in one 45 degree cell, two in another
+    df = pd.DataFrame({'name': ['a', 'b', 'c', 'd', 'e', 'f'],
+                       'lat': [10.0, 20.0, 30.0, 40.0, -10.0, -20.0],
+                       'lon': [10.0, 20.0, 30.0, 40.0, -100.0, -120.0],
+                       'pop': [100, 400, 300, 200, 50, 60]})
+    cities = Cities(df)
+    try:
+        cities.limitByRank(2)
+        assert False
+    except KeyError:
+        pass
+    cities.addRanks(maxlevel=2)
+    ranks = cities.getDataFrame()['rank']
+    # the most populous city of each 90 degree cell at level 0, then of
+    # each 22.5 degree cell at level 2 (a and b, c and d share cells)
+    assert list(ranks) == [3, 0, 2, 3, 2, 0]
+    assert list(cities.limitByRank(1).getDataFrame()['name']) == ['b', 'f']
+    assert len(cities.limitByRank(3)) == 6
+    query = cities.query().limitByRank(0).limitByPopulation(100)
+    assert list(query.getDataFrame()['name']) == ['b']
+    cities.addRanks(maxlevel=2, cities_per_cell=2)
+    assert list(cities.getDataFrame()['rank']) == [2, 0, 0, 2, 0, 0]
+
+    # ranks are cached beside the GeoNames file
+    tempdir = tempfile.mkdtemp()
+    try:
+        cityfile = os.path.join(tempdir, 'cities1000.txt')
+        _write_geonames(cityfile)
+        cities = Cities.fromGeoNames(cityfile)
+        cities.addRanks(maxlevel=4)
+        assert os.path.isfile(cityfile + RANK_EXT)
+        cached = Cities.fromGeoNames(cityfile)
+        cached.addRanks(maxlevel=4)
+        pd.testing.assert_frame_equal(cached.getDataFrame(),
+                                      cities.getDataFrame())
+        # subsets are ranked on their own, not from the cache
+        subset = cities.limitByPopulation(100000)
+        subset.addRanks(maxlevel=0)
+        assert (subset.getDataFrame()['rank'] <= 1).all()
+        assert subset.limitByRank(0).getDataFrame()['name'].iloc[0] == \
+            'Mexico City'
+    finally:
+        shutil.rmtree(tempdir)
+
+
 if __name__ == '__main__':
     test()
+    test_geonames_cache()
+    test_limit_by_grid()
+    test_query()
+    test_compact()
+    test_limit_by_name()
+    test_ranks()
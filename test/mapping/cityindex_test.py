@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+# stdlib imports
+import os.path
+import sys
+
+import numpy as np
+import pandas as pd
+
+# hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__))  # where is this script?
+impactdir = os.path.abspath(os.path.join(homedir, '..', '..'))
+# put this at the front of the system path, ignoring any installed mapio stuff
+sys.path.insert(0, impactdir)
+
+from impactutils.extern.openquake.geodetic import (geodetic_distance,
+                                                   azimuth)
+from impactutils.mapping.city import Cities
+from impactutils.mapping.cityindex import CityIndex
+
+
+def _random_points(npoints=20000):
+    np.random.seed(1234)
+    lats = np.random.uniform(-90, 90, npoints)
+    lons = np.random.uniform(-180, 180, npoints)
+    # points on cell edges, at the poles and on the antimeridian
+    lats = np.concatenate([lats, [90, -90, 0, 10, 10, 45]])
+    lons = np.concatenate([lons, [0, 180, -180, 180, -180, 10]])
+    return (lats, lons)
+
+
+def test_bounds():
+    lats, lons = _random_points()
+    index = CityIndex(lats, lons)
+    assert len(index) == len(lats)
+    boxes = [(-120, -110, 30, 40),
+             (10, 11, 44, 45),
+             (-181, 181, -91, 91),
+             (170, -170, -60, 70),
+             (175, 185, 0, 20),
+             (-185, -175, 0, 20),
+             (0, 1, 40, 30)]
+    for xmin, xmax, ymin, ymax in boxes:
+        inside = (lats > ymin) & (lats <= ymax)
+        if xmin > xmax:
+            inside &= (lons > xmin) | (lons <= xmax)
+        else:
+            inside &= (lons > xmin) & (lons <= xmax)
+        rows = index.queryBounds((xmin, xmax, ymin, ymax))
+        np.testing.assert_array_equal(rows, np.nonzero(inside)[0])
+
+    # the crossing box contains points on both sides of the antimeridian
+    rows = index.queryBounds((170, -170, -60, 70))
+    assert (lons[rows] > 170).any() and (lons[rows] < -170).any()
+
+
+def test_radius():
+    lats, lons = _random_points()
+    index = CityIndex(lats, lons)
+    queries = [(34.0, -118.0, 100),
+               (0.0, 179.9, 500),
+               (-10.0, -180.0, 1000),
+               (89.9, 0.0, 300),
+               (-89.0, 45.0, 200),
+               (60.0, 20.0, 5000),
+               (0.0, 0.0, 21000),
+               (10.0, 10.0, 0)]
+    for lat, lon, radius in queries:
+        dist = geodetic_distance(lon, lat, lons, lats)
+        rows, rowdist = index.queryRadius(lat, lon, radius)
+        np.testing.assert_array_equal(rows, np.nonzero(dist <= radius)[0])
+        np.testing.assert_allclose(rowdist, dist[rows])
+
+
+def test_cities():
+    lats, lons = _random_points(1000)
+    df = pd.DataFrame({'name': ['city%i' % i for i in range(len(lats))],
+                       'ccode': 'XX', 'lat': lats, 'lon': lons,
+                       'iscap': False, 'pop': np.arange(len(lats))})
+    cities = Cities(df)
+    subset = cities.limitByRadius(40.0, 175.0, 3000)
+    dist = geodetic_distance(175.0, 40.0, lons, lats)
+    assert sorted(subset.getDataFrame()['pop']) == list(np.nonzero(
+        dist <= 3000)[0])
+
+    # positions in the index are rows of the dataframe, not labels
+    shuffled = Cities(df.sample(frac=1, random_state=1))
+    subset = shuffled.limitByBounds((-10, 10, -10, 10))
+    inside = (lats > -10) & (lats <= 10) & (lons > -10) & (lons <= 10)
+    assert sorted(subset.getDataFrame()['pop']) == list(np.nonzero(inside)[0])
+
+
+def test_radius_many():
+    lats, lons = _random_points(5000)
+    index = CityIndex(lats, lons)
+    np.random.seed(7)
+    qlats = np.concatenate([np.random.normal(34, 1, 50),
+                            np.random.uniform(-90, 90, 50),
+                            [89.9, 0, np.nan]])
+    qlons = np.concatenate([np.random.normal(-118, 1, 50),
+                            np.random.uniform(-180, 180, 50),
+                            [0, 180, 0]])
+    radii = np.random.choice([100, 500, 2000], len(qlats))
+    results = index.queryRadiusMany(qlats, qlons, radii)
+    assert len(results) == len(qlats)
+    for i in range(len(qlats)):
+        rows, _ = index.queryRadius(qlats[i], qlons[i], radii[i])
+        np.testing.assert_array_equal(results[i], rows)
+    assert len(results[-1]) == 0
+
+    # the same radius for all points
+    results = index.queryRadiusMany(qlats, qlons, 1000)
+    rows, _ = index.queryRadius(qlats[0], qlons[0], 1000)
+    np.testing.assert_array_equal(results[0], rows)
+
+    # cities, in this process and in a pool of processes
+    df = pd.DataFrame({'name': ['city%i' % i for i in range(len(lats))],
+                       'ccode': 'XX', 'lat': lats, 'lon': lons,
+                       'iscap': False, 'pop': np.arange(len(lats))})
+    cities = Cities(df)
+    results = cities.limitByRadiusMany(qlats[:10], qlons[:10], 300)
+    pooled = cities.limitByRadiusMany(qlats[:10], qlons[:10], 300,
+                                      workers=2)
+    for i in range(10):
+        subset = cities.limitByRadius(qlats[i], qlons[i], 300)
+        assert subset.getDataFrame().equals(
+            cities.getDataFrame().iloc[results[i]])
+        np.testing.assert_array_equal(results[i], pooled[i])
+
+
+def test_nearest():
+    lats, lons = _random_points(5000)
+    index = CityIndex(lats, lons)
+    np.random.seed(99)
+    qlats = np.concatenate([np.random.uniform(-90, 90, 200),
+                            [90, -90, 0, 10, np.nan]])
+    qlons = np.concatenate([np.random.uniform(-180, 180, 200),
+                            [0, 0, 180, -180, 0]])
+    positions, distances = index.queryNearest(qlats, qlons, 4)
+    assert positions.shape == (len(qlats), 4)
+    for i in range(len(qlats) - 1):
+        dist = geodetic_distance(qlons[i], qlats[i], lons, lats)
+        np.testing.assert_allclose(distances[i], np.sort(dist)[:4])
+        np.testing.assert_allclose(dist[positions[i]], distances[i])
+    assert (positions[-1] == -1).all()
+    assert np.isnan(distances[-1]).all()
+
+    # fewer cities than k
+    index = CityIndex([10.0, 20.0], [30.0, 40.0])
+    positions, distances = index.queryNearest([0.0], [0.0], 3)
+    np.testing.assert_array_equal(positions, [[0, 1, -1]])
+    assert np.isnan(distances[0, 2])
+    positions, distances = CityIndex([], []).queryNearest([0.0], [0.0], 1)
+    np.testing.assert_array_equal(positions, [[-1]])
+
+    # cities
+    lats, lons = _random_points(1000)
+    df = pd.DataFrame({'name': ['city%i' % i for i in range(len(lats))],
+                       'ccode': 'XX', 'lat': lats, 'lon': lons,
+                       'iscap': False, 'pop': np.arange(len(lats))})
+    cities = Cities(df)
+    qlats = np.array([34.0, -45.0, np.nan])
+    qlons = np.array([-118.0, 179.5, 0.0])
+    nearest = cities.nearest(qlats, qlons, k=3, minpop=500)
+    assert list(nearest['point']) == [0, 0, 0, 1, 1, 1]
+    assert list(nearest['rank']) == [0, 1, 2, 0, 1, 2]
+    assert (nearest['pop'] >= 500).all()
+    for i in range(2):
+        big = df[df['pop'] >= 500]
+        dist = geodetic_distance(qlons[i], qlats[i], big['lon'].values,
+                                 big['lat'].values)
+        rows = nearest[nearest['point'] == i]
+        np.testing.assert_allclose(rows['distance'], np.sort(dist)[:3])
+        np.testing.assert_allclose(rows['azimuth'],
+                                   azimuth(qlons[i], qlats[i],
+                                           rows['lon'].values,
+                                           rows['lat'].values))
+    nearest = cities.nearest(34.0, -118.0)
+    assert len(nearest) == 1
+    assert nearest['name'].iloc[0] == df['name'].iloc[
+        np.argmin(geodetic_distance(-118.0, 34.0, lons, lats))]
+
+
+if __name__ == '__main__':
+    test_bounds()
+    test_radius()
+    test_cities()
+    test_radius_many()
+    test_nearest()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# stdlib imports
+import os.path
+import sys
+
+import matplotlib
+import matplotlib.pyplot as plt
+import pytest
+
+# hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__))  # where is this script?
+impactdir = os.path.abspath(os.path.join(homedir, '..', '..'))
+# put this at the front of the system path, ignoring any installed mapio stuff
+sys.path.insert(0, impactdir)
+
+from impactutils.mapping.fontmetrics import (FontMetrics, get_font_metrics,
+                                             is_layout_supported,
+                                             LAYOUT_VERSIONS)
+
+matplotlib.use('Agg')
+
+
+def test_extent():
+    texts = ['Los Angeles', 'Yucca Valley', "St. John's", 'Zürich',
+             'Quyjpg', 'W', 'AVAT', 'Office flow', ' padded ']
+    for dpi in [72, 100]:
+        fig = plt.figure(figsize=(5, 5), dpi=dpi)
+        ax = fig.add_axes([0, 0, 1, 1])
+        renderer = fig.canvas.get_renderer()
+        for fontname in ['DejaVu Sans', 'DejaVu Serif']:
+            for fontsize in [8, 10.0, 13.5]:
+                metrics = get_font_metrics(fontname, fontsize, dpi)
+                for text in texts:
+                    for ha, va in [('left', 'center'), ('center', 'top'),
+                                   ('right', 'bottom')]:
+                        th = ax.text(0.3, 0.6, text, fontname=fontname,
+                                     fontsize=fontsize, ha=ha, va=va)
+                        bbox = th.get_window_extent(renderer)
+                        th.remove()
+                        x, y = ax.transData.transform((0.3, 0.6))
+                        extent = metrics.getTextExtent(text, x, y, ha, va)
+                        assert extent == pytest.approx(
+                            (bbox.x0, bbox.x1, bbox.y0, bbox.y1), abs=1e-6)
+        plt.close(fig)
+
+    # the layout is reproduced (this test would need updating otherwise)
+    assert is_layout_supported()
+    # measured from the glyphs and by laying out the whole text (texts with
+    # ligatures, such as "ffl", are only measured by laying them out)
+    metrics = FontMetrics('DejaVu Sans', 10.0, 100)
+    assert metrics._use_glyphs
+    for text in texts:
+        size = metrics._layoutGlyphs(text)
+        assert size is None or size == metrics._layoutText(text)
+
+    # cached instances
+    assert get_font_metrics('DejaVu Sans', 10.0, 100) is \
+        get_font_metrics('DejaVu Sans', 10.0, 100)
+
+    with pytest.raises(ValueError):
+        metrics.getTextExtent('Golden', 0, 0, ha='baseline')
+    with pytest.raises(ValueError):
+        metrics.getTextExtent('Golden', 0, 0, va='baseline')
+
+
+def test_artist_fallback():
+    first, last = LAYOUT_VERSIONS
+    assert is_layout_supported('%i.%i.0' % first)
+    assert is_layout_supported('%i.%i.5rc1' % last)
+    assert not is_layout_supported('%i.%i.0' % (first[0], first[1] - 1))
+    assert not is_layout_supported('%i.%i.0' % (last[0], last[1] + 1))
+    assert not is_layout_supported('unknown')
+
+    # other Matplotlib versions are measured with Text artists
+    version = matplotlib.__version__
+    matplotlib.__version__ = '%i.%i.0' % (last[0], last[1] + 1)
+    try:
+        metrics = FontMetrics('DejaVu Sans', 12.0, 100)
+    finally:
+        matplotlib.__version__ = version
+    assert metrics._figure is not None
+    fig = plt.figure(figsize=(5, 5), dpi=100)
+    ax = fig.add_axes([0, 0, 1, 1])
+    renderer = fig.canvas.get_renderer()
+    for text in ['Los Angeles', 'Quyjpg', 'Office flow']:
+        for ha, va in [('left', 'center'), ('right', 'top')]:
+            th = ax.text(0.5, 0.5, text, fontname='DejaVu Sans',
+                         fontsize=12.0, ha=ha, va=va)
+            bbox = th.get_window_extent(renderer)
+            x, y = ax.transData.transform((0.5, 0.5))
+            extent = metrics.getTextExtent(text, x, y, ha, va)
+            assert extent == pytest.approx(
+                (bbox.x0, bbox.x1, bbox.y0, bbox.y1), abs=1e-6)
+    assert metrics.getTextSize('') == (0.0, 0.0)
+    plt.close(fig)
+
+
+if __name__ == '__main__':
+    test_extent()
+    test_artist_fallback()
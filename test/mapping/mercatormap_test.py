@@ -6,9 +6,13 @@ import sys
 
 import matplotlib.pyplot as plt
 import matplotlib
+import numpy as np
+import pandas as pd
+import pyproj
+import pytest
 
 from impactutils.mapping.city import Cities
-from impactutils.mapping.mercatormap import MercatorMap
+from impactutils.mapping.mercatormap import MercatorMap, PLACEMENTS
 
 # hack the path so that I can debug these functions if I need to
 homedir = os.path.dirname(os.path.abspath(__file__))
@@ -44,6 +48,76 @@ def test_mmap(outfile=None, bounds=None):
 #    return
 
 
+def _get_cities(ncities=2000):
+    np.random.seed(10)
+    df = pd.DataFrame({'name': ['City %i' % i for i in range(ncities)],
+                       'ccode': 'US',
+                       'lat': np.random.uniform(30, 40, ncities),
+                       'lon': np.random.uniform(-125, -110, ncities),
+                       'iscap': False,
+                       'pop': np.random.randint(1000, 1000000, ncities)})
+    return Cities(df)
+
+
+def test_draw_cities():
+    cities = _get_cities()
+    bounds = (-121.0, -116.0, 32.0, 36.0)
+    nfigures = len(plt.get_fignums())
+    mmap = MercatorMap(bounds, (7, 7), cities, padding=0.25)
+    # labels are measured without a second figure
+    assert len(plt.get_fignums()) == nfigures + 1
+
+    # projected coordinates of the cities
+    df = mmap.projectCities(cities.getDataFrame())
+    proj = pyproj.Proj(mmap.proj.proj4_init)
+    x, y = proj(df['lon'].values, df['lat'].values)
+    np.testing.assert_allclose(df['x'], x)
+    np.testing.assert_allclose(df['y'], y)
+
+    drawn = mmap.drawCities(shadow=True).getDataFrame()
+    assert len(drawn) > 1
+    assert len(mmap.axes.texts) == len(drawn)
+    assert list(drawn['pop']) == sorted(drawn['pop'], reverse=True)
+    # the labels do not overlap
+    for i in range(len(drawn)):
+        for j in range(i):
+            a = drawn.iloc[i]
+            b = drawn.iloc[j]
+            assert (a['left'] > b['right'] or a['right'] < b['left'] or
+                    a['bottom'] > b['top'] or a['top'] < b['bottom'])
+
+    # the labels are drawn at their placements and offsets
+    assert set(drawn['placement']) <= set(PLACEMENTS)
+    assert len(set(drawn['placement'])) > 1
+    for (_, row), th in zip(drawn.iterrows(), mmap.axes.texts):
+        ha, va, _, _ = PLACEMENTS[row['placement']]
+        assert th.get_ha() == ha and th.get_va() == va
+        x, y = proj(row['lon'] + row['xoff'], row['lat'] + row['yoff'])
+        np.testing.assert_allclose(th.get_position(), (x, y), atol=1e-3)
+    plt.close('all')
+
+    # labels of cities with a placement are only drawn at that placement,
+    # and only the first placement is tried for the others
+    df = cities.getDataFrame()
+    df['placement'] = np.where(np.arange(len(df)) % 2, 'nw', None)
+    mmap = MercatorMap(bounds, (7, 7), Cities(df), padding=0.25)
+    drawn = mmap.drawCities(placements=['S']).getDataFrame()
+    placements = df.set_index('name').loc[drawn['name'], 'placement']
+    expected = np.where(placements.values == 'nw', 'NW', 'S')
+    assert list(drawn['placement']) == list(expected)
+
+    # more candidate cities for denser maps
+    ndefault = len(MercatorMap(bounds, (7, 7), cities).drawCities())
+    mmap = MercatorMap(bounds, (7, 7), cities)
+    assert len(mmap.drawCities(cities_per_grid=200)) > ndefault
+
+    with pytest.raises(ValueError):
+        mmap.drawCities(placements=['X'])
+    with pytest.raises(ValueError):
+        mmap.drawCities(placements=[])
+    plt.close('all')
+
+
 if __name__ == '__main__':
     if len(sys.argv) > 1:
         xmin = float(sys.argv[1])
@@ -55,3 +129,4 @@ if __name__ == '__main__':
         bounds = None
     outfile = os.path.join(os.path.expanduser('~'), 'mercatormap.pdf')
     test_mmap(outfile, bounds=None)
+    test_draw_cities()
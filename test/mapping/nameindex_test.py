@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+# stdlib imports
+import os.path
+import sys
+
+import numpy as np
+
+# hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__))  # where is this script?
+impactdir = os.path.abspath(os.path.join(homedir, '..', '..'))
+# put this at the front of the system path, ignoring any installed mapio stuff
+sys.path.insert(0, impactdir)
+
+from impactutils.mapping.nameindex import NameIndex, normalize_name
+
+NAMES = ['Los Angeles', 'San Francisco', 'Zürich', 'Zurich', 'los  angeles',
+         float('nan'), 'Los Alamos', 'São Paulo', 'San Jose', 'Los Angeles']
+
+
+def test_normalize():
+    assert normalize_name('  Los   Angeles ') == 'Los Angeles'
+    assert normalize_name('Zürich', ignore_case=True) == 'zürich'
+    assert normalize_name('Zürich', ignore_accents=True) == 'Zurich'
+    assert normalize_name('SÃO Paulo', True, True) == 'sao paulo'
+    # composed and decomposed forms are the same
+    assert normalize_name('Zu\u0308rich') == 'Z\xfcrich'
+
+
+def test_exact():
+    index = NameIndex(NAMES)
+    assert len(index) == len(NAMES) - 1
+    np.testing.assert_array_equal(index.queryExact('Los Angeles'), [0, 9])
+    np.testing.assert_array_equal(index.queryExact(' Los Angeles'), [0, 9])
+    np.testing.assert_array_equal(index.queryExact('los angeles'), [4])
+    np.testing.assert_array_equal(index.queryExact('Zurich'), [3])
+    assert len(index.queryExact('Los')) == 0
+
+    index = NameIndex(NAMES, ignore_case=True)
+    np.testing.assert_array_equal(index.queryExact('LOS ANGELES'), [0, 4, 9])
+    np.testing.assert_array_equal(index.queryExact('zurich'), [3])
+
+    index = NameIndex(NAMES, ignore_case=True, ignore_accents=True)
+    np.testing.assert_array_equal(index.queryExact('zurich'), [2, 3])
+    np.testing.assert_array_equal(index.queryExact('Sao Paulo'), [7])
+
+
+def test_prefix():
+    index = NameIndex(NAMES)
+    np.testing.assert_array_equal(index.queryPrefix('Los A'), [0, 6, 9])
+    np.testing.assert_array_equal(index.queryPrefix('San'), [1, 8])
+    np.testing.assert_array_equal(index.queryPrefix('Zu'), [3])
+    assert len(index.queryPrefix('Lost')) == 0
+    # a trailing space only matches whole words
+    index = NameIndex(['Sand Point', 'San Jose', 'San'])
+    np.testing.assert_array_equal(index.queryPrefix('San'), [0, 1, 2])
+    np.testing.assert_array_equal(index.queryPrefix('San '), [1])
+    assert len(index.queryPrefix('')) == 3
+
+    index = NameIndex(NAMES, ignore_case=True, ignore_accents=True)
+    np.testing.assert_array_equal(index.queryPrefix('zu'), [2, 3])
+    np.testing.assert_array_equal(index.queryPrefix('LOS'), [0, 4, 6, 9])
+
+
+if __name__ == '__main__':
+    test_normalize()
+    test_exact()
+    test_prefix()